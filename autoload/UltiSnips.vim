@@ -92,6 +92,57 @@ function! UltiSnips#SnippetsInCurrentScope(...)
     return g:current_ulti_dict
 endfunction
 
+function! UltiSnips#Preload(filetype)
+    if !has('timers')
+        return
+    endif
+    exec g:_uspy "UltiSnips_Manager.preload(vim.eval('a:filetype'))"
+endfunction
+
+function! UltiSnips#PreloadStep(timer)
+    exec g:_uspy "UltiSnips_Manager.preload_step()"
+endfunction
+
+function! UltiSnips#PreloadStatus()
+    let g:current_ulti_preload_status = {}
+    exec g:_uspy "UltiSnips_Manager.preload_status()"
+    return g:current_ulti_preload_status
+endfunction
+
+function! UltiSnips#ContextCacheStats()
+    let g:current_ulti_context_cache_stats = {}
+    exec g:_uspy "UltiSnips_Manager.context_cache_stats()"
+    return g:current_ulti_context_cache_stats
+endfunction
+
+function! UltiSnips#InterpolationStats()
+    let g:current_ulti_interpolation_stats = {}
+    exec g:_uspy "UltiSnips_Manager.interpolation_stats()"
+    return g:current_ulti_interpolation_stats
+endfunction
+
+function! UltiSnips#EditStats()
+    let g:current_ulti_edit_stats = {}
+    exec g:_uspy "UltiSnips_Manager.edit_stats()"
+    return g:current_ulti_edit_stats
+endfunction
+
+function! UltiSnips#TrackChanges(bufnr, start, end, added, changes)
+    if a:bufnr == get(g:, '_ultisnips_tracked_buffer', -1)
+        for change in a:changes
+            call add(g:_ultisnips_changes,
+                \ [change.lnum - 1, change.end - 1, change.end - 1 + change.added])
+        endfor
+    endif
+endfunction
+
+function! UltiSnips#TakeChanges(bufnr)
+    call listener_flush(a:bufnr)
+    let changes = get(g:, '_ultisnips_changes', [])
+    let g:_ultisnips_changes = []
+    return changes
+endfunction
+
 function! UltiSnips#SaveLastVisualSelection() range
     exec g:_uspy "UltiSnips_Manager._save_last_visual_selection()"
     return ""
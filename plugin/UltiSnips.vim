@@ -52,6 +52,14 @@ augroup UltiSnips_AutoTrigger
     au TextChangedI * call UltiSnips#TrackChange()
 augroup END
 
+if get(g:, 'UltiSnipsPreload', 0) && has('timers')
+    augroup UltiSnips_Preload
+        au!
+        au VimEnter * call UltiSnips#Preload(&filetype)
+        au FileType * call UltiSnips#Preload(expand('<amatch>'))
+    augroup END
+endif
+
 call UltiSnips#map_keys#MapKeys()
 
 " vim: ts=8 sts=4 sw=4
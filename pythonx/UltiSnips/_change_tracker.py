@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Finds the lines the user changed from the change events of Vim
+(listener_add()) or Neovim (nvim_buf_attach()) instead of comparing the text
+of the snippet with a snapshot."""
+
+from UltiSnips import _vim
+
+# Sets up the on_lines callbacks in Neovim. The lines are joined before they
+# are run, so they must not contain comments. The changes of the tracked
+# buffer are lost when it is reloaded or detached, e.g. by :edit!, and a
+# detached buffer is attached again when it is tracked the next time.
+_NEOVIM_SETUP = """
+UltiSnipsChanges = {tracked = -1, changes = {}, lost = 0, attached = {}}
+function UltiSnipsChanges.lose(buffer)
+    if buffer == UltiSnipsChanges.tracked then
+        UltiSnipsChanges.lost = 1
+    end
+end
+function UltiSnipsChanges.attach(buffer)
+    if UltiSnipsChanges.attached[buffer] then
+        return
+    end
+    UltiSnipsChanges.attached[buffer] = vim.api.nvim_buf_attach(
+        buffer, false, {
+        on_lines = function(_, buf, _, first, last, new_last)
+            if buf == UltiSnipsChanges.tracked then
+                table.insert(UltiSnipsChanges.changes, {first, last, new_last})
+            end
+        end,
+        on_reload = function(_, buf)
+            UltiSnipsChanges.lose(buf)
+        end,
+        on_detach = function(_, buf)
+            UltiSnipsChanges.attached[buf] = nil
+            UltiSnipsChanges.lose(buf)
+        end})
+end
+function UltiSnipsChanges.track(buffer)
+    UltiSnipsChanges.tracked = buffer
+    UltiSnipsChanges.changes = {}
+    UltiSnipsChanges.lost = 0
+    if buffer >= 0 then
+        UltiSnipsChanges.attach(buffer)
+    end
+end
+function UltiSnipsChanges.take()
+    local taken = {changes = UltiSnipsChanges.changes,
+                   lost = UltiSnipsChanges.lost}
+    UltiSnipsChanges.changes = {}
+    return taken
+end
+"""
+
+
+def merge_changes(changes):
+    """Returns the smallest (first, last, new_last) range of lines that covers
+    all 'changes'.
+
+    Every change replaces the lines 'first' up to 'last' by the lines 'first'
+    up to 'new_last' (0 based, exclusive) of the text as it was after the
+    change before. Lines before 'first' are unchanged and lines from 'last' on
+    in the original are the lines from 'new_last' on in the changed text.
+    Returns () if there are no changes.
+
+    """
+    merged = ()
+    for change in changes:
+        first, last, new_last = [int(i) for i in change]
+        if not merged:
+            merged = (first, last, new_last)
+            continue
+        m_first, m_last, m_new_last = merged
+        merged = (min(m_first, first),
+                  m_last + max(0, last - m_new_last),
+                  max(m_new_last, last) + new_last - last)
+    return merged
+
+
+class _VimListener(object):
+
+    """Change events from listener_add(), collected by the autoload functions
+    of UltiSnips."""
+
+    def attach(self, buffer):  # pylint:disable=no-self-use
+        """Starts listening to changes in 'buffer' and returns the id of the
+        listener."""
+        return int(_vim.eval(
+            'listener_add("UltiSnips#TrackChanges", %i)' % buffer))
+
+    def detach(self, listener):  # pylint:disable=no-self-use
+        """Removes the 'listener' returned by attach(). Vim removed it already
+        if its buffer was wiped out."""
+        _vim.eval('listener_remove(%i)' % listener)
+
+    def track(self, buffer):
+        """Records the changes of 'buffer' from now on, and of no other
+        buffer."""
+        _vim.command('let g:_ultisnips_tracked_buffer = %i' % buffer)
+        if buffer < 0:
+            _vim.command('let g:_ultisnips_changes = []')
+        else:
+            self.take(buffer)
+
+    def take(self, buffer):  # pylint:disable=no-self-use
+        """Returns the changes recorded since the last call and forgets
+        them."""
+        return _vim.eval('UltiSnips#TakeChanges(%i)' % buffer)
+
+
+class _NeovimAttach(object):
+
+    """Change events from the on_lines callback of nvim_buf_attach()."""
+
+    def __init__(self):
+        _vim.command('lua ' + ' '.join(_NEOVIM_SETUP.split()))
+
+    def attach(self, buffer):  # pylint:disable=no-self-use
+        """Starts listening to changes in 'buffer'."""
+        _vim.command('lua UltiSnipsChanges.attach(%i)' % buffer)
+
+    def detach(self, listener):  # pylint:disable=no-self-use,unused-argument
+        """Does nothing: the on_lines callback only records the changes of
+        the tracked buffer and stays attached until Neovim detaches it, so
+        that attach() is cheap the next time."""
+
+    def track(self, buffer):  # pylint:disable=no-self-use
+        """Records the changes of 'buffer' from now on, and of no other
+        buffer."""
+        _vim.command('lua UltiSnipsChanges.track(%i)' % buffer)
+
+    def take(self, buffer):  # pylint:disable=no-self-use,unused-argument
+        """Returns the changes recorded since the last call and forgets
+        them, or None if they are lost because the buffer was reloaded or
+        detached."""
+        taken = _vim.eval('luaeval("UltiSnipsChanges.take()")')
+        if int(taken['lost']):
+            return None
+        return taken['changes']
+
+
+def _select_backend():
+    """Returns the change events this Vim supports, or None if there are none
+    or they are disabled through g:UltiSnipsTrackChanges."""
+    if _vim.eval('get(g:, "UltiSnipsTrackChanges", 1)') == '0':
+        return None
+    if _vim.eval('exists("*listener_add")') == '1':
+        return _VimListener()
+    if _vim.eval('has("nvim-0.4")') == '1':
+        return _NeovimAttach()
+    return None
+
+
+class ChangeTracker(object):
+
+    """Knows which lines of a buffer changed since start() was called."""
+
+    def __init__(self):
+        self._backend = None
+        self._selected = False
+        self._attached = {}  # buffer -> what attach() of the backend returned
+        self._buffer = None
+        self._changes = []
+
+    def start(self, buffer):
+        """Forgets all changes so far and tracks the changes of 'buffer'."""
+        if not self._selected:
+            self._backend = _select_backend()
+            self._selected = True
+        if self._backend is None:
+            return
+        if buffer not in self._attached:
+            self._attached[buffer] = self._backend.attach(buffer)
+        self._backend.track(buffer)
+        self._buffer = buffer
+        self._changes = []
+
+    def stop(self):
+        """Stops recording changes until start() is called again and stops
+        listening to the changes of all buffers."""
+        if self._backend is None:
+            return
+        if self._buffer is not None:
+            self._backend.track(-1)
+        for listener in self._attached.values():
+            self._backend.detach(listener)
+        self._attached.clear()
+        self._buffer = None
+        self._changes = []
+
+    def changed_lines(self, buffer):
+        """Returns the (first, last, new_last) range of lines of 'buffer' that
+        changed since start(), see merge_changes(). Returns () if nothing
+        changed and None if the changes are unknown."""
+        if self._buffer is None or buffer != self._buffer:
+            return None
+        changes = self._backend.take(buffer)
+        if changes is None:
+            # The buffer has to be attached again by the next start().
+            self._attached.pop(buffer, None)
+            self._buffer = None
+            self._changes = []
+            return None
+        self._changes.extend(changes)
+        return merge_changes(self._changes)
@@ -4,12 +4,89 @@
 """Commands to compare text objects and to guess how to transform from one to
 another."""
 
-from collections import defaultdict
-import sys
-
 from UltiSnips import _vim
 from UltiSnips.position import Position
 
+# How many edits of the user were guessed by guess_edit() and how many needed
+# the full diff().
+edit_stats = {'guessed': 0, 'diffed': 0}
+
+
+class _EditedLines(object):
+
+    """The lines of a text while edit commands are applied to it.
+
+    Only the lines touched by the commands are copied. They form a window
+    into the original text that grows when a command reaches outside of it.
+
+    """
+
+    def __init__(self, original):
+        self._original = original
+        self._start = 0  # First original line in the window.
+        self._end = 0  # Original line after the window.
+        self._lines = []
+
+    def __len__(self):
+        return len(self._original) - (self._end - self._start) + \
+            len(self._lines)
+
+    def window(self, line, count):
+        """Makes the 'count' lines from 'line' on part of the window and
+        returns the index of 'line' in it, or None if they do not exist."""
+        if line < 0 or line + count > len(self):
+            return None
+        if self._start == self._end and not self._lines:
+            self._start = self._end = line
+        if line < self._start:
+            self._lines[0:0] = self._original[line:self._start]
+            self._start = line
+        missing = line + count - self._start - len(self._lines)
+        if missing > 0:
+            self._lines.extend(self._original[self._end:self._end + missing])
+            self._end += missing
+        return line - self._start
+
+    def delete(self, line, col, text):
+        """Deletes len('text') characters at 'line', 'col'."""
+        newlines = text.count('\n')
+        # Deleting the newline of the last line removes the line.
+        if newlines and line + newlines == len(self):
+            index = self.window(line, newlines)
+            if index is None:
+                return False
+            del self._lines[index:index + newlines]
+            return True
+        index = self.window(line, newlines + 1)
+        if index is None:
+            return False
+        end_col = col + len(text) if not newlines else \
+            len(text) - text.rfind('\n') - 1
+        self._lines[index:index + newlines + 1] = [
+            self._lines[index][:col] + self._lines[index + newlines][end_col:]]
+        return True
+
+    def insert(self, line, col, text):
+        """Inserts 'text' at 'line', 'col'."""
+        index = self.window(line, 1)
+        if index is None:
+            return False
+        current = self._lines[index]
+        pieces = text.split('\n')
+        pieces[0] = current[:col] + pieces[0]
+        pieces[-1] += current[col:]
+        self._lines[index:index + 1] = pieces
+        return True
+
+    def equals(self, wanted):
+        """True if the lines are now 'wanted'."""
+        if len(self) != len(wanted):
+            return False
+        end = self._start + len(self._lines)
+        return (self._lines == wanted[self._start:end] and
+                self._original[:self._start] == wanted[:self._start] and
+                self._original[self._end:] == wanted[end:])
+
 
 def is_complete_edit(initial_line, original, wanted, cmds):
     """Returns true if 'original' is changed to 'wanted' with the edit commands
@@ -18,24 +95,85 @@ def is_complete_edit(initial_line, original, wanted, cmds):
     Initial line is to change the line numbers in 'cmds'.
 
     """
-    buf = original[:]
-    for cmd in cmds:
-        ctype, line, col, char = cmd
+    buf = _EditedLines(original)
+    for ctype, line, col, text in cmds:
         line -= initial_line
         if ctype == 'D':
-            if char != '\n':
-                buf[line] = buf[line][:col] + buf[line][col + len(char):]
-            else:
-                if line + 1 < len(buf):
-                    buf[line] = buf[line] + buf[line + 1]
-                    del buf[line + 1]
-                else:
-                    del buf[line]
-        elif ctype == 'I':
-            buf[line] = buf[line][:col] + char + buf[line][col:]
-        buf = '\n'.join(buf).split('\n')
-    return (len(buf) == len(wanted) and
-            all(j == k for j, k in zip(buf, wanted)))
+            applied = buf.delete(line, col, text)
+        else:
+            applied = buf.insert(line, col, text)
+        if not applied:
+            return False
+    return buf.equals(wanted)
+
+
+def _has_line(lines, initial_line, line):
+    """True if 'lines', which start at 'initial_line', contain 'line'."""
+    return 0 <= line - initial_line < len(lines)
+
+
+def _text_between(lines, initial_line, start, end):
+    """Returns the text of 'lines' from Position 'start' to 'end'."""
+    first = lines[start.line - initial_line]
+    if start.line == end.line:
+        return first[start.col:end.col]
+    return '\n'.join([first[start.col:]] +
+                     lines[start.line - initial_line + 1:end.line - initial_line] +
+                     [lines[end.line - initial_line][:end.col]])
+
+
+def _guess_insertion(initial_line, last_text, current_text, ppos, pos):
+    """Text typed, pasted or completed in insert mode between the previous
+    and the current cursor position, which can span lines."""
+    if (not ppos < pos or
+            not _has_line(current_text, initial_line, ppos.line) or
+            not _has_line(current_text, initial_line, pos.line)):
+        return None
+    return (('I', ppos.line, ppos.col,
+             _text_between(current_text, initial_line, ppos, pos)),)
+
+
+def _guess_replacement(initial_line, last_text, current_text, ppos, pos):
+    """The text before the cursor on its line was replaced, as when the
+    completion menu cycles through its matches."""
+    if (ppos.line != pos.line or len(last_text) != len(current_text) or
+            not _has_line(current_text, initial_line, pos.line)):
+        return None
+    last = last_text[pos.line - initial_line]
+    current = current_text[pos.line - initial_line]
+    if last[ppos.col:] != current[pos.col:]:
+        return None
+    start = 0
+    limit = min(ppos.col, pos.col)
+    while start < limit and last[start] == current[start]:
+        start += 1
+    es = []
+    if start < ppos.col:
+        es.append(('D', pos.line, start, last[start:ppos.col]))
+    if start < pos.col:
+        es.append(('I', pos.line, start, current[start:pos.col]))
+    return tuple(es)
+
+
+def _guess_new_lines(initial_line, last_text, current_text, ppos, pos):
+    """Whole lines were added at the cursor line, which is what 'o', 'O' and
+    pasting lines with 'p' or 'P' do."""
+    count = len(current_text) - len(last_text)
+    first = pos.line - initial_line
+    if count <= 0 or first < 0 or first + count > len(current_text):
+        return None
+    lines = '\n'.join(current_text[first:first + count])
+    if pos.line > ppos.line and first > 0:
+        # Below the line of the cursor: the new lines are appended to the line
+        # before, like pressing <CR> at its end.
+        return (('I', pos.line - 1, len(last_text[first - 1]), '\n' + lines),)
+    if first < len(last_text):
+        return (('I', pos.line, 0, lines + '\n'),)
+    return None
+
+
+# Tried in this order when the specific cases in guess_edit() do not match.
+_GUESSERS = (_guess_insertion, _guess_new_lines, _guess_replacement)
 
 
 def guess_edit(initial_line, last_text, current_text, vim_state):
@@ -134,93 +272,228 @@ def guess_edit(initial_line, last_text, current_text, vim_state):
             if is_complete_edit(initial_line, last_text,
                                 current_text, es):
                 return True, es
+    for guesser in _GUESSERS:
+        es = guesser(initial_line, last_text, current_text, ppos, pos)
+        if es is not None and is_complete_edit(initial_line, last_text,
+                                               current_text, es):
+            return True, es
     return False, None
 
 
+def _common_prefix(a, b, a_end, b_end):
+    """Returns the length of the common prefix of a[:a_end] and b[:b_end]."""
+    length = 0
+    limit = min(a_end, b_end)
+    while length < limit and a[length] == b[length]:
+        length += 1
+    return length
+
+
+def _common_suffix(a, b):
+    """Returns the length of the common suffix of 'a' and 'b'."""
+    length = 0
+    limit = min(len(a), len(b))
+    while length < limit and a[-1 - length] == b[-1 - length]:
+        length += 1
+    return length
+
+
+def _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi):
+    """Finds the middle snake of the shortest edit script between a[a_lo:a_hi]
+    and b[b_lo:b_hi] by searching forwards and backwards at the same time.
+
+    Returns the start and end of the snake as (x, y, u, v).
+
+    """
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 == 1
+    forward = {1: 0}
+    backward = {1: 0}
+    for d in range((n + m + 1) // 2 + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[k - 1] < forward[k + 1]):
+                x = forward[k + 1]
+            else:
+                x = forward[k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[k] = x
+            if (odd and delta - (d - 1) <= k <= delta + (d - 1) and
+                    x + backward[delta - k] >= n):
+                return (a_lo + x_start, b_lo + y_start, a_lo + x, b_lo + y)
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[k - 1] < backward[k + 1]):
+                x = backward[k + 1]
+            else:
+                x = backward[k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[k] = x
+            if (not odd and -d <= delta - k <= d and
+                    x + forward[delta - k] >= n):
+                return (a_hi - x, b_hi - y, a_hi - x_start, b_hi - y_start)
+
+
+def _matching_items(a, b):
+    """Returns the (i, j) with a[i] == b[j] of a longest common subsequence of
+    the sequences 'a' and 'b'.
+
+    This is Myers' O(ND) algorithm in its linear space variant: the middle
+    snake of the edit script is found and the parts before and after it are
+    solved recursively.
+
+    """
+    matches = []
+
+    def _solve(a_lo, a_hi, b_lo, b_hi):
+        """Adds the matches between a[a_lo:a_hi] and b[b_lo:b_hi]."""
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        suffix = 0
+        while (a_lo < a_hi - suffix and b_lo < b_hi - suffix and
+               a[a_hi - 1 - suffix] == b[b_hi - 1 - suffix]):
+            suffix += 1
+        a_hi -= suffix
+        b_hi -= suffix
+        if a_lo < a_hi and b_lo < b_hi:
+            x, y, u, v = _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi)
+            _solve(a_lo, x, b_lo, y)
+            matches.extend((x + i, y + i) for i in range(u - x))
+            _solve(u, a_hi, v, b_hi)
+        matches.extend((a_hi + i, b_hi + i) for i in range(suffix))
+
+    _solve(0, len(a), 0, len(b))
+    return matches
+
+
+def _advance(line, col, text):
+    """Returns the position after 'text' when it starts at (line, col)."""
+    newlines = text.count('\n')
+    if not newlines:
+        return line, col + len(text)
+    return line + newlines, len(text) - text.rfind('\n') - 1
+
+
+# Characters that did not change inside a changed text are only kept in runs
+# of at least this length, shorter ones are deleted and inserted again with
+# the text around them.
+_MIN_KEPT_RUN = 3
+
+# The characters of changed texts are only compared when both together are at
+# most this long. The diff takes time quadratic in the number of differences.
+_MAX_CHARACTER_DIFF = 512
+
+
+def _kept_runs(a, b):
+    """Returns the (i, j, length) with a[i:i + length] == b[j:j + length] of
+    the runs of characters that are kept when 'a' is turned into 'b'."""
+    if len(a) + len(b) > _MAX_CHARACTER_DIFF:
+        return []
+    runs = []
+    for i, j in _matching_items(a, b):
+        if runs and runs[-1][0] + runs[-1][2] == i and \
+                runs[-1][1] + runs[-1][2] == j:
+            runs[-1][2] += 1
+        else:
+            runs.append([i, j, 1])
+    return [run for run in runs if run[2] >= _MIN_KEPT_RUN]
+
+
+def _replace(a, b, line, col, edits):
+    """Appends the edits that turn 'a' into 'b' at (line, col) to 'edits'.
+
+    Text at the end and then at the start that did not change is kept. The
+    characters in between are compared again and long enough runs that did
+    not change are kept too, the rest is deleted and inserted as a whole.
+    Newlines are deleted and inserted on their own. Returns the position after
+    'b'.
+
+    """
+    suffix = _common_suffix(a, b)
+    prefix = _common_prefix(a, b, len(a) - suffix, len(b) - suffix)
+    line, col = _advance(line, col, b[:prefix])
+    a_changed = a[prefix:len(a) - suffix]
+    b_changed = b[prefix:len(b) - suffix]
+    a_index = b_index = 0
+    for i, j, length in _kept_runs(a_changed, b_changed) + [
+            (len(a_changed), len(b_changed), 0)]:
+        for piece in _split_newlines(a_changed[a_index:i]):
+            edits.append(('D', line, col, piece))
+        for piece in _split_newlines(b_changed[b_index:j]):
+            edits.append(('I', line, col, piece))
+            line, col = _advance(line, col, piece)
+        line, col = _advance(line, col, b_changed[j:j + length])
+        a_index, b_index = i + length, j + length
+    return _advance(line, col, b[len(b) - suffix:])
+
+
+def _split_newlines(text):
+    """Splits 'text' into its lines and the newlines between them."""
+    pieces = []
+    for index, piece in enumerate(text.split('\n')):
+        if index:
+            pieces.append('\n')
+        if piece:
+            pieces.append(piece)
+    return pieces
+
+
 def diff(a, b, sline=0):
     """
-    Return a list of deletions and insertions that will turn 'a' into 'b'. This
-    is done by traversing an implicit edit graph and searching for the shortest
-    route. The basic idea is as follows:
-
-        - Matching a character is free as long as there was no
-          deletion/insertion before. Then, matching will be seen as delete +
-          insert [1].
-        - Deleting one character has the same cost everywhere. Each additional
-          character costs only have of the first deletion.
-        - Insertion is cheaper the earlier it happens. The first character is
-          more expensive that any later [2].
-
-    [1] This is that world -> aolsa will be "D" world + "I" aolsa instead of
-        "D" w , "D" rld, "I" a, "I" lsa
-    [2] This is that "hello\n\n" -> "hello\n\n\n" will insert a newline after
-        hello and not after \n
+    Return a list of deletions and insertions that will turn 'a' into 'b'.
+
+    Text that did not change at the end and at the start is skipped first.
+    If the rest spans several lines, its lines are matched with Myers' diff
+    algorithm, so that lines that did not change in between are kept. Each
+    run of changed lines is then handled like a single change: again the
+    unchanged end and start are kept, the characters in between are diffed
+    the same way and the rest is deleted and inserted. If as many lines were
+    removed as added, this is done line by line.
+
+    Keeping the end before the start makes insertions happen as early as
+    possible, e.g. "hello\n\n" -> "hello\n\n\n" will insert a newline
+    after hello and not after \n. Keeping only longer runs of unchanged
+    characters rather than single ones makes e.g. world -> aolsa a "D" world
+    + "I" aolsa instead of "D" w , "D" rld, "I" a, "I" lsa.
     """
-    d = defaultdict(list)  # pylint:disable=invalid-name
-    seen = defaultdict(lambda: sys.maxsize)
-
-    d[0] = [(0, 0, sline, 0, ())]
-    cost = 0
-    deletion_cost = len(a) + len(b)
-    insertion_cost = len(a) + len(b)
-    while True:
-        while len(d[cost]):
-            x, y, line, col, what = d[cost].pop()
-
-            if a[x:] == b[y:]:
-                return what
-
-            if x < len(a) and y < len(b) and a[x] == b[y]:
-                ncol = col + 1
-                nline = line
-                if a[x] == '\n':
-                    ncol = 0
-                    nline += 1
-                lcost = cost + 1
-                if (what and what[-1][0] == 'D' and what[-1][1] == line and
-                        what[-1][2] == col and a[x] != '\n'):
-                    # Matching directly after a deletion should be as costly as
-                    # DELETE + INSERT + a bit
-                    lcost = (deletion_cost + insertion_cost) * 1.5
-                if seen[x + 1, y + 1] > lcost:
-                    d[lcost].append((x + 1, y + 1, nline, ncol, what))
-                    seen[x + 1, y + 1] = lcost
-            if y < len(b):  # INSERT
-                ncol = col + 1
-                nline = line
-                if b[y] == '\n':
-                    ncol = 0
-                    nline += 1
-                if (what and what[-1][0] == 'I' and what[-1][1] == nline and
-                            what[-1][2] + len(what[-1][-1]) == col and b[y] != '\n' and
-                            seen[x, y + 1] > cost + (insertion_cost + ncol) // 2
-                        ):
-                    seen[x, y + 1] = cost + (insertion_cost + ncol) // 2
-                    d[cost + (insertion_cost + ncol) // 2].append(
-                        (x, y + 1, line, ncol, what[:-1] + (
-                            ('I', what[-1][1], what[-1][2],
-                             what[-1][-1] + b[y]),)
-                         )
-                    )
-                elif seen[x, y + 1] > cost + insertion_cost + ncol:
-                    seen[x, y + 1] = cost + insertion_cost + ncol
-                    d[cost + ncol + insertion_cost].append((x, y + 1, nline, ncol,
-                                                            what + (('I', line, col, b[y]),))
-                                                           )
-            if x < len(a):  # DELETE
-                if (what and what[-1][0] == 'D' and what[-1][1] == line and
-                            what[-1][2] == col and a[x] != '\n' and
-                            what[-1][-1] != '\n' and
-                            seen[x + 1, y] > cost + deletion_cost // 2
-                        ):
-                    seen[x + 1, y] = cost + deletion_cost // 2
-                    d[cost + deletion_cost // 2].append(
-                        (x + 1, y, line, col, what[:-1] + (
-                            ('D', line, col, what[-1][-1] + a[x]),))
-                    )
-                elif seen[x + 1, y] > cost + deletion_cost:
-                    seen[x + 1, y] = cost + deletion_cost
-                    d[cost + deletion_cost].append((x + 1, y, line, col, what +
-                                                    (('D', line, col, a[x]),))
-                                                   )
-        cost += 1
+    edits = []
+    suffix = _common_suffix(a, b)
+    prefix = _common_prefix(a, b, len(a) - suffix, len(b) - suffix)
+    line, col = _advance(sline, 0, a[:prefix])
+    a = a[prefix:len(a) - suffix]
+    b = b[prefix:len(b) - suffix]
+    if '\n' not in a and '\n' not in b:
+        _replace(a, b, line, col, edits)
+        return tuple(edits)
+
+    a_lines = a.splitlines(True)
+    b_lines = b.splitlines(True)
+    # Compare lines by number rather than by text.
+    numbers = {}
+    a_numbers = [numbers.setdefault(text, len(numbers)) for text in a_lines]
+    b_numbers = [numbers.setdefault(text, len(numbers)) for text in b_lines]
+    a_index = b_index = 0
+    for a_match, b_match in _matching_items(a_numbers, b_numbers) + [
+            (len(a_lines), len(b_lines))]:
+        a_changed = a_lines[a_index:a_match]
+        b_changed = b_lines[b_index:b_match]
+        if len(a_changed) == len(b_changed):
+            for a_text, b_text in zip(a_changed, b_changed):
+                line, col = _replace(a_text, b_text, line, col, edits)
+        else:
+            line, col = _replace(''.join(a_changed), ''.join(b_changed),
+                                 line, col, edits)
+        if b_match < len(b_lines):
+            line, col = _advance(line, col, b_lines[b_match])
+        a_index, b_index = a_match + 1, b_match + 1
+    return tuple(edits)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""A mark on a line of the buffer that Vim or Neovim moves along when lines
+are added or removed above it, stored as a text property in Vim and as an
+extmark in Neovim.
+
+UltiSnips moves the positions of its text objects itself while it replays the
+edits of the user, but only edits inside the snippet are replayed. The mark
+tells how far the snippet moved when lines above it changed.
+
+"""
+
+from UltiSnips import _vim
+
+# The id of all marks of UltiSnips, there is at most one per buffer.
+_MARK_ID = 1
+
+
+class _TextProperty(object):
+
+    """The mark as a text property of length 0 at the start of its line."""
+
+    def __init__(self):
+        _vim.command('silent! call prop_type_add("UltiSnipsMark", {})')
+
+    def place(self, buffer, line):  # pylint:disable=no-self-use
+        """Puts the mark of 'buffer' on 'line'."""
+        _vim.command(
+            'call prop_remove({"type": "UltiSnipsMark", "id": %i, '
+            '"bufnr": %i, "all": 1}) | '
+            'call prop_add(%i, 1, {"type": "UltiSnipsMark", "id": %i, '
+            '"bufnr": %i, "length": 0})' %
+            (_MARK_ID, buffer, line + 1, _MARK_ID, buffer))
+
+    def line(self, buffer):  # pylint:disable=no-self-use
+        """Returns the line of the mark of 'buffer', or None if it was deleted
+        with its line."""
+        found = _vim.eval(
+            'prop_find({"type": "UltiSnipsMark", "id": %i, "bufnr": %i, '
+            '"lnum": 1, "col": 1}, "f")' % (_MARK_ID, buffer))
+        if not found:
+            return None
+        return int(found['lnum']) - 1
+
+    def remove(self, buffer):  # pylint:disable=no-self-use
+        """Removes the mark of 'buffer'."""
+        _vim.command(
+            'call prop_remove({"type": "UltiSnipsMark", "id": %i, '
+            '"bufnr": %i, "all": 1})' % (_MARK_ID, buffer))
+
+
+class _Extmark(object):
+
+    """The mark as an extmark at the start of its line. It does not move when
+    text is inserted right at it."""
+
+    def __init__(self):
+        self._namespace = int(_vim.eval('nvim_create_namespace("UltiSnips")'))
+
+    def place(self, buffer, line):
+        """Puts the mark of 'buffer' on 'line'."""
+        _vim.eval(
+            'nvim_buf_set_extmark(%i, %i, %i, 0, '
+            '{"id": %i, "right_gravity": v:false})' %
+            (buffer, self._namespace, line, _MARK_ID))
+
+    def line(self, buffer):
+        """Returns the line of the mark of 'buffer', or None if it is
+        gone."""
+        found = _vim.eval('nvim_buf_get_extmark_by_id(%i, %i, %i, {})' %
+                          (buffer, self._namespace, _MARK_ID))
+        if not found:
+            return None
+        return int(found[0])
+
+    def remove(self, buffer):
+        """Removes the mark of 'buffer'."""
+        _vim.eval('nvim_buf_del_extmark(%i, %i, %i)' %
+                  (buffer, self._namespace, _MARK_ID))
+
+
+def _select_backend():
+    """Returns the kind of mark this Vim supports, or None if it supports
+    none or they are disabled through g:UltiSnipsNativeMarks."""
+    if _vim.eval('get(g:, "UltiSnipsNativeMarks", 1)') == '0':
+        return None
+    if _vim.eval('exists("*prop_find")') == '1':
+        return _TextProperty()
+    if _vim.eval('has("nvim-0.5")') == '1':
+        return _Extmark()
+    return None
+
+
+class NativeMark(object):
+
+    """Remembers a line of a buffer in a mark that the editor keeps up to
+    date. Without support for marks, the line is unknown once it was
+    placed."""
+
+    def __init__(self):
+        self._backend = None
+        self._selected = False
+        self._buffer = None
+        self._line = None
+
+    def place(self, buffer, line):
+        """Puts the mark on 'line' of 'buffer'. Nothing is sent to Vim if the
+        mark is there already."""
+        if not self._selected:
+            self._backend = _select_backend()
+            self._selected = True
+        if self._backend is None or (buffer, line) == (self._buffer,
+                                                       self._line):
+            return
+        if self._buffer is not None and self._buffer != buffer:
+            self._backend.remove(self._buffer)
+        self._backend.place(buffer, line)
+        self._buffer = buffer
+        self._line = line
+
+    def remove(self):
+        """Removes the mark."""
+        if self._buffer is None:
+            return
+        self._backend.remove(self._buffer)
+        self._buffer = self._line = None
+
+    def lines_moved(self, buffer):
+        """Returns by how many lines the editor moved the mark since it was
+        placed or this was last asked, or None if this is unknown."""
+        if self._buffer is None or buffer != self._buffer:
+            return None
+        line = self._backend.line(buffer)
+        if line is None:
+            # Place it again the next time.
+            self._buffer = self._line = None
+            return None
+        lines, self._line = line - self._line, line
+        return lines
@@ -53,7 +53,12 @@ class VimBuffer(object):
 
     @property
     def filetypes(self):
-        return [ft for ft in vim.eval('&filetype').split('.') if ft]
+        return split_filetypes(vim.eval('&filetype'))
+
+    def options(self, *names):  # pylint:disable=no-self-use
+        """The values of the options 'names' for the current buffer, fetched
+        with a single eval()."""
+        return vim.eval('[%s]' % ', '.join('&' + name for name in names))
 
     @property
     def cursor(self):  # pylint:disable=no-self-use
@@ -94,6 +99,12 @@ def save_mark(name):
         else:
             set_mark_from_pos(name, old_pos)
 
+
+def split_filetypes(filetype):
+    """Returns the filetypes in the value of a 'filetype' option."""
+    return [ft for ft in filetype.split('.') if ft]
+
+
 def escape(inp):
     """Creates a vim-friendly string from a group of
     dicts, lists and strings."""
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Compiles the Python code of snippets once instead of on every
+execution."""
+
+from collections import OrderedDict
+
+# Executed before the 'global !p' sections of a snippet file.
+_PRELUDE = 'import re, os, vim, string, random'
+
+# Filename of the compiled 'global !p' sections in tracebacks, if they are
+# not from a file.
+_GLOBALS_FILENAME = '<global !p>'
+
+# Number of distinct 'global !p' sections to keep compiled.
+_GLOBALS_CACHE_SIZE = 64
+
+# Number of code objects to keep for interpolations, contexts and actions.
+_CODE_CACHE_SIZE = 1024
+
+_globals_cache = OrderedDict()
+_code_cache = OrderedDict()
+
+
+def _lookup(cache, size, key, create):
+    """Returns the value for 'key' in the LRU 'cache', calling 'create' with
+    'key' if it is missing."""
+    value = cache.pop(key, None)
+    if value is None:
+        value = create(key)
+        if len(cache) >= size:
+            cache.popitem(last=False)
+    cache[key] = value
+    return value
+
+
+def code_filename(location, line_offset=0):
+    """Returns the filename to compile code with that is defined at
+    'location', 'line_offset' lines below the start of the snippet.
+
+    Locations of snippets from files look like 'path:line', all others are
+    put in angle brackets.
+
+    """
+    filename, _, line = (location or '').rpartition(':')
+    if filename and line.isdigit():
+        return '%s:%i' % (filename, int(line) + line_offset)
+    return '<%s>' % (location or 'anonymous')
+
+
+def compile_code(source, filename):
+    """Returns 'source' compiled with 'filename'."""
+    return _lookup(
+        _code_cache, _CODE_CACHE_SIZE, (source, filename),
+        lambda key: compile(key[0], key[1], 'exec', dont_inherit=True))
+
+
+def run_code(source, filename, namespace):
+    """Executes 'source' compiled with 'filename' in 'namespace'.
+
+    Errors are annotated with the source and filename, so that
+    err_to_scratch_buffer can show which line failed.
+
+    """
+    try:
+        exec(compile_code(source, filename), namespace)  # pylint:disable=exec-used
+    except Exception as e:
+        if not hasattr(e, 'snippet_code'):
+            e.snippet_code = source
+            e.snippet_filename = filename
+        raise
+
+
+class CompiledGlobals(object):
+
+    """The 'global !p' sections of one snippet file."""
+
+    def __init__(self, sections, filename=None):
+        self.source = '\n'.join([
+            _PRELUDE,
+            '\n'.join(sections).replace('\r\n', '\n'),
+        ])
+        self.filename = _GLOBALS_FILENAME
+        if filename:
+            self.filename = '<global !p of %s>' % filename
+
+    def execute(self, namespace):
+        """Executes the globals in 'namespace'. Functions defined by them see
+        the variables in it."""
+        run_code(self.source, self.filename, namespace)
+
+
+def compiled_globals(globals, location=None):
+    """Returns the CompiledGlobals for the 'global !p' sections in 'globals'
+    of the snippet defined at 'location'.
+
+    Snippets share them only if they come from the same file, so that errors
+    name the file.
+
+    """
+    filename = (location or '').rpartition(':')[0] or location
+    return _lookup(_globals_cache, _GLOBALS_CACHE_SIZE,
+                   (filename, tuple(globals.get('!p', ()))),
+                   lambda key: CompiledGlobals(key[1], key[0]))
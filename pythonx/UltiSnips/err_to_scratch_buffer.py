@@ -29,18 +29,25 @@ Following is the full stack trace:
                 msg += re.sub(
                     '^(?=\S)', '  ', e.snippet_info, flags=re.MULTILINE
                 )
-            # snippet_code comes from _python_code.py, it's set manually for
+            # snippet_code comes from compiled_code.py, it's set manually for
             # providing error message with stacktrace of failed python code
             # inside of the snippet.
             if hasattr(e, 'snippet_code'):
                 _, _, tb = sys.exc_info()
-                tb_top = traceback.extract_tb(tb)[-1]
+                frames = traceback.extract_tb(tb)
+                # The error might be raised by a function called from the
+                # snippet code, mark the line of the snippet code instead.
+                filename = getattr(e, 'snippet_filename', None)
+                code_frames = [f for f in frames if f[0] == filename]
+                error_line = (code_frames or frames)[-1][1]
+                if isinstance(e, SyntaxError) and e.filename == filename:
+                    error_line = e.lineno
                 msg += "\nExecuted snippet code:\n"
                 lines = e.snippet_code.split("\n")
                 for number, line in enumerate(lines, 1):
                     msg += str(number).rjust(3)
                     prefix = "   " if line else ""
-                    if tb_top[1] == number:
+                    if error_line == number:
                         prefix = " > "
                     msg += prefix + line + "\n"
 
@@ -10,6 +10,8 @@ import textwrap
 
 from UltiSnips import _vim
 from UltiSnips.compatibility import as_unicode
+from UltiSnips.compiled_code import code_filename, compiled_globals, \
+    run_code
 from UltiSnips.indent_util import IndentUtil
 from UltiSnips.text import escape
 from UltiSnips.text_objects import SnippetInstance
@@ -18,13 +20,17 @@ from UltiSnips.text_objects._python_code import \
 
 __WHITESPACE_SPLIT = re.compile(r"\s")
 
+# How often the result of a context was taken from the cache of its snippet
+# or had to be computed.
+context_cache_stats = {'hits': 0, 'misses': 0}
+
 
 def split_at_whitespace(string):
     """Like string.split(), but keeps empty words as empty words."""
     return re.split(__WHITESPACE_SPLIT, string)
 
 
-def _words_for_line(trigger, before, num_words=None):
+def words_for_line(trigger, before, num_words=None):
     """Gets the final 'num_words' words from 'before'.
 
     If num_words is None, then use the number of words in 'trigger'.
@@ -55,32 +61,47 @@ class SnippetDefinition(object):
                  options, globals, location, context, actions):
         self._priority = int(priority)
         self._trigger = as_unicode(trigger)
-        self._value = as_unicode(value)
-        self._description = as_unicode(description)
+        # Either the text or an object whose read() returns it, the same for
+        # the description.
+        self._value = value
+        self._description = description
         self._opts = options
-        self._matched = ''
+        self._matched = None  # Not matched yet, see 'matched'.
         self._last_re = None
+        self._trigger_re = None
         self._globals = globals
         self._location = location
         self._context_code = context
         self._context = None
+        self._context_key = None
+        self._context_value = None
         self._actions = actions
 
-        # Make sure that we actually match our trigger in case we are
-        # immediately expanded.
-        self.matches(self._trigger)
-
     def __repr__(self):
         return '_SnippetDefinition(%r,%s,%s,%s)' % (
             self._priority, self._trigger, self._description, self._opts)
 
+    def __getstate__(self):
+        """Drops the transient match state when pickled for the snippet file
+        cache; match objects cannot be pickled."""
+        state = self.__dict__.copy()
+        state['_matched'] = None
+        state['_last_re'] = None
+        state['_trigger_re'] = None
+        state['_context'] = None
+        state['_context_key'] = None
+        state['_context_value'] = None
+        return state
+
     def _re_match(self, trigger):
         """Test if a the current regex trigger matches `trigger`.
 
         If so, set _last_re and _matched.
 
         """
-        for match in re.finditer(self._trigger, trigger):
+        if self._trigger_re is None:
+            self._trigger_re = re.compile(self._trigger)
+        for match in self._trigger_re.finditer(trigger):
             if match.end() != len(trigger):
                 continue
             else:
@@ -95,6 +116,12 @@ class SnippetDefinition(object):
         if len(vim.current.buffer) == 1 and vim.current.buffer[0] == "":
             return
 
+        key = self._context_cache_key(visual_content)
+        if key is not None and key == self._context_key:
+            context_cache_stats['hits'] += 1
+            return self._context_value
+        context_cache_stats['misses'] += 1
+
         locals = {
             'context': None,
             'visual_mode': '',
@@ -107,16 +134,28 @@ class SnippetDefinition(object):
             locals['visual_text'] = visual_content.text
             locals['last_placeholder'] = visual_content.placeholder
 
-        return self._eval_code('snip.context = ' + self._context_code,
-                               locals).context
+        value = self._eval_code('snip.context = ' + self._context_code,
+                                locals).context
+        self._context_key = key
+        self._context_value = value
+        return value
+
+    def _context_cache_key(self, visual_content):
+        """Returns what the result of the context is assumed to depend on or
+        None if it must not be cached."""
+        if 'u' in self._opts:
+            return None
+        state = _vim.eval('[bufnr("%"), b:changedtick, '
+                          'get(g:, "UltiSnipsContextCache", 1)]')
+        if state[2] == '0':
+            return None
+        visual = None
+        if visual_content:
+            visual = (visual_content.mode, visual_content.text,
+                      id(visual_content.placeholder))
+        return (state[0], state[1], tuple(vim.current.window.cursor), visual)
 
     def _eval_code(self, code, additional_locals={}):
-        code = "\n".join([
-            'import re, os, vim, string, random',
-            '\n'.join(self._globals.get('!p', [])).replace('\r\n', '\n'),
-            code
-        ])
-
         current = vim.current
 
         locals = {
@@ -132,9 +171,14 @@ class SnippetDefinition(object):
         snip = SnippetUtilForAction(locals)
 
         try:
-            exec(code, {'snip': snip})
+            # Each evaluation gets a fresh namespace, so that the functions of
+            # the globals see the variables assigned by the code and nothing
+            # outlives it. Only compiling is done once.
+            namespace = {'snip': snip}
+            compiled_globals(self._globals, self._location).execute(namespace)
+            run_code(code, code_filename(self._location), namespace)
         except Exception as e:
-            self._make_debug_exception(e, code)
+            self._make_debug_exception(e, getattr(e, 'snippet_code', code))
             raise
 
         return snip
@@ -184,6 +228,10 @@ class SnippetDefinition(object):
         return snip
 
     def _make_debug_exception(self, e, code=''):
+        try:
+            description = self._read_description()
+        except Exception:  # pylint:disable=broad-except
+            description = '<unknown>'
         e.snippet_info = textwrap.dedent("""
             Defined in: {}
             Trigger: {}
@@ -194,7 +242,7 @@ class SnippetDefinition(object):
         """).format(
             self._location,
             self._trigger,
-            self._description,
+            description,
             self._context_code if self._context_code else '<none>',
             self._actions['pre_expand'] if 'pre_expand' in self._actions
                 else '<none>',
@@ -209,10 +257,17 @@ class SnippetDefinition(object):
         """Check if the named option is set."""
         return opt in self._opts
 
+    def _read_description(self):
+        """Returns the description given when the snippet was defined. It is
+        read on first use if it was not given as text."""
+        if hasattr(self._description, 'read'):
+            self._description = self._description.read()
+        return as_unicode(self._description)
+
     @property
     def description(self):
         """Descriptive text for this snippet."""
-        return ('(%s) %s' % (self._trigger, self._description)).strip()
+        return ('(%s) %s' % (self._trigger, self._read_description())).strip()
 
     @property
     def priority(self):
@@ -225,17 +280,46 @@ class SnippetDefinition(object):
         """The trigger text for the snippet."""
         return self._trigger
 
+    @property
+    def value(self):
+        """The text of the snippet. It is read on first use if it was not
+        given when the snippet was defined."""
+        if hasattr(self._value, 'read'):
+            self._value = self._value.read()
+        return as_unicode(self._value)
+
     @property
     def matched(self):
         """The last text that matched this snippet in match() or
         could_match()."""
+        if self._matched is None:
+            # Never matched, e.g. because a snippet source handed us out
+            # directly. Match our own trigger in case we are expanded right
+            # away.
+            self.matches(self._trigger)
         return self._matched
 
+    @property
+    def match_state(self):
+        """What the last matches() or could_match() remembered about the
+        text, see restore_match_state()."""
+        return self._matched, self._last_re
+
+    def restore_match_state(self, state):
+        """Makes this snippet look like it matched the text again that it
+        matched when 'state' was taken from match_state, without matching."""
+        self._matched, self._last_re = state
+
     @property
     def location(self):
         """Where this snippet was defined."""
         return self._location
 
+    @property
+    def has_context(self):
+        """True if the snippet only matches if its context code agrees."""
+        return bool(self._context_code)
+
     @property
     def context(self):
         """The matched context."""
@@ -249,7 +333,7 @@ class SnippetDefinition(object):
         # boundary).
         self._matched = ''
 
-        words = _words_for_line(self._trigger, before)
+        words = words_for_line(self._trigger, before)
 
         if 'r' in self._opts:
             try:
@@ -304,7 +388,7 @@ class SnippetDefinition(object):
         if before and before.rstrip() is not before:
             return False
 
-        words = _words_for_line(self._trigger, before)
+        words = words_for_line(self._trigger, before)
 
         if 'r' in self._opts:
             # Test for full match only
@@ -413,7 +497,7 @@ class SnippetDefinition(object):
 
         """
         indent = self._INDENT.match(text_before).group(0)
-        lines = (self._value + '\n').splitlines()
+        lines = (self.value + '\n').splitlines()
         ind_util = IndentUtil()
 
         # Replace leading tabs in the snippet definition via proper indenting
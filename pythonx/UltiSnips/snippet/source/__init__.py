@@ -4,7 +4,11 @@
 """Sources of snippet definitions."""
 
 from UltiSnips.snippet.source._base import SnippetSource
+from UltiSnips.snippet.source._merged_view import MergedSnippetView, \
+    is_cleared, merge_cleared
+from UltiSnips.snippet.source._preloader import SnippetPreloader
 from UltiSnips.snippet.source.added import AddedSnippetsSource
+from UltiSnips.snippet.source.file._common import SnippetFileChanged
 from UltiSnips.snippet.source.file.snipmate import SnipMateFileSource
 from UltiSnips.snippet.source.file.ultisnips import UltiSnipsFileSource, \
     find_all_snippet_files, find_snippet_files
@@ -12,9 +12,30 @@ class SnippetSource(object):
 
     """See module docstring."""
 
+    # Sources that only change their snippets through self._snippets and do
+    # not create snippets on the fly in get_snippets() can set this to True,
+    # see generation. Subclasses of such a source that override get_snippets()
+    # must set it back to False.
+    cache_lookups = False
+
     def __init__(self):
         self._snippets = defaultdict(SnippetDictionary)
         self._extends = defaultdict(set)
+        # Increased by sources that set cache_lookups.
+        self._generation = 0
+
+    @property
+    def generation(self):
+        """A number that is increased whenever the snippets of this source
+        change. Lookups of snippets are only cached while it stays the same.
+
+        None if the source did not opt in by setting cache_lookups, its
+        snippets are never cached.
+
+        """
+        if not self.cache_lookups:
+            return None
+        return self._generation
 
     def ensure(self, filetypes, cached):
         """Update/reload the snippets in the source when needed.
@@ -23,6 +44,15 @@ class SnippetSource(object):
 
         """
 
+    def preload(self, ft):
+        """Returns an iterator that makes sure the snippets for 'ft' (without
+        its parents) are loaded, doing a small amount of work per step.
+
+        Used to load snippets in the background before they are needed.
+
+        """
+        return iter(())
+
     def loaded(self, filetypes):
         return len(self._snippets) > 0
 
@@ -49,6 +79,12 @@ class SnippetSource(object):
                                                       visual_content))
         return result
 
+    def get_snippet_dictionaries(self, filetypes):
+        """Returns the SnippetDictionary s for all 'filetypes' and their
+        parents, in the order get_snippets() queries them."""
+        return [self._snippets[ft]
+                for ft in self._get_existing_deep_extends(filetypes)]
+
     def get_clear_priority(self, filetypes):
         """Get maximum clearsnippets priority without arguments for specified
         filetypes, if any.
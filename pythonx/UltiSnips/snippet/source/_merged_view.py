@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""The snippets of several sources for one stack of filetypes, merged into a
+single SnippetDictionary."""
+
+from collections import defaultdict
+
+from UltiSnips.snippet.source._snippet_dictionary import SnippetDictionary
+
+# The options that change which texts a snippet matches.
+_MATCH_OPTIONS = 'rwibA'
+
+
+def is_cleared(snippet, clear_priority, cleared):
+    """True if 'snippet' is removed by clearsnippets, given the highest
+    'clear_priority' of clearsnippets without triggers and the highest
+    priorities in 'cleared' of those with triggers."""
+    return ((clear_priority is not None and
+             snippet.priority <= clear_priority) or
+            (snippet.trigger in cleared and
+             snippet.priority <= cleared[snippet.trigger]))
+
+
+def merge_cleared(sources, filetypes):
+    """Returns the highest clear priority and the highest priorities of
+    cleared triggers of 'sources' for 'filetypes'."""
+    clear_priority = None
+    cleared = {}
+    for source in sources:
+        source_clear_priority = source.get_clear_priority(filetypes)
+        if source_clear_priority is not None and (
+                clear_priority is None or
+                source_clear_priority > clear_priority):
+            clear_priority = source_clear_priority
+        for key, value in source.get_cleared(filetypes).items():
+            if key not in cleared or value > cleared[key]:
+                cleared[key] = value
+    return clear_priority, cleared
+
+
+def _match_key(snippet):
+    """Returns what decides whether 'snippet' matches a text or None if this
+    also depends on the state of Vim. Snippets with the same key match the
+    same texts."""
+    if snippet.has_context:
+        return None
+    return snippet.trigger, tuple(snippet.has_option(option)
+                                  for option in _MATCH_OPTIONS)
+
+
+class MergedSnippetView(object):
+
+    """All snippets of 'sources' for 'filetypes' and their parents that are
+    not cleared and not always outranked, in the order the sources return
+    them.
+
+    Of the snippets that match the same texts, only those with the highest
+    priority are kept. If afterwards all snippets with a trigger have the
+    same priority, 'resolved' is True and the snippets matching a text need
+    no priority resolution per trigger.
+
+    Buffers with the same filetypes share one view. It is rebuilt when the
+    generation of a source changes.
+
+    """
+
+    def __init__(self, sources, filetypes):
+        self.generations = tuple(source.generation for source in sources)
+        self._clear_priority, self._cleared = merge_cleared(
+            sources, filetypes)
+        snippets = []
+        # _match_key() -> highest priority
+        highest_priorities = {}
+        for source in sources:
+            for dictionary in source.get_snippet_dictionaries(filetypes):
+                for snippet in dictionary:
+                    if is_cleared(snippet, self._clear_priority,
+                                  self._cleared):
+                        continue
+                    snippets.append(snippet)
+                    key = _match_key(snippet)
+                    if key is not None and snippet.priority > \
+                            highest_priorities.get(key, float('-inf')):
+                        highest_priorities[key] = snippet.priority
+        self._snippets = SnippetDictionary()
+        # trigger -> priorities
+        priorities = defaultdict(set)
+        for snippet in snippets:
+            key = _match_key(snippet)
+            if key is not None and \
+                    snippet.priority < highest_priorities[key]:
+                continue
+            self._snippets.add_snippet(snippet)
+            priorities[snippet.trigger].add(snippet.priority)
+        self.resolved = all(len(priorities_of_trigger) == 1
+                            for priorities_of_trigger in priorities.values())
+        self.has_context_snippets = self._snippets.has_context_snippets
+
+    def get_clear_priority(self, filetypes):
+        """See SnippetSource.get_clear_priority()."""
+        return self._clear_priority
+
+    def get_cleared(self, filetypes):
+        """See SnippetSource.get_cleared()."""
+        return self._cleared
+
+    def get_matching_snippets(self, before, possible, autotrigger_only,
+                              visual_content):
+        """See SnippetDictionary.get_matching_snippets()."""
+        return self._snippets.get_matching_snippets(
+            before, possible, autotrigger_only, visual_content)
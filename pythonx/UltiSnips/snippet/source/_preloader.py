@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Loads snippets in the background, in small slices driven by Vim timers,
+so that the first expansion in a buffer does not have to parse them."""
+
+from collections import defaultdict, deque
+import time
+
+from UltiSnips import _vim
+
+# How long one slice of preloading may take before control goes back to Vim.
+SLICE_SECONDS = 0.005
+
+# Delay between two slices so that Vim can process pending input.
+SLICE_DELAY_MS = 10
+
+
+class SnippetPreloader(object):
+
+    """See module docstring."""
+
+    def __init__(self):
+        self._jobs = deque()  # (ft, source, iterator)
+        self._queued = set()  # (ft, id(source)) of all jobs in self._jobs
+        self._done = set()  # (ft, id(source)) of finished jobs
+        self._outstanding = defaultdict(int)
+        self._failed = set()
+        self._timer_started = False
+
+    def schedule(self, sources, filetypes):
+        """Loads 'filetypes' and the filetypes they extend from all
+        'sources'."""
+        for ft in filetypes:
+            self._failed.discard(ft)
+            for source in sources:
+                self._done.discard((ft, id(source)))
+                self._add_job(ft, source)
+        self._start_timer()
+
+    def status(self):
+        """Returns a dict from filetype to 'pending', 'failed' or
+        'loaded'."""
+        status = {}
+        for ft, _ in self._done:
+            status[ft] = 'loaded'
+        for ft in self._failed:
+            status[ft] = 'failed'
+        for ft, count in self._outstanding.items():
+            if count:
+                status[ft] = 'pending'
+        return status
+
+    def run_slice(self):
+        """Does preloading work until the time of one slice is used up."""
+        self._timer_started = False
+        deadline = time.time() + SLICE_SECONDS
+        while self._jobs and time.time() < deadline:
+            ft, source, steps = self._jobs[0]
+            try:
+                next(steps)
+                continue
+            except StopIteration:
+                self._finish_job(ft, source)
+                for parent_ft in source.get_deep_extends([ft]):
+                    self._add_job(parent_ft, source)
+            except Exception:  # pylint:disable=broad-except
+                # The error is reported when the snippets are really needed.
+                self._failed.add(ft)
+                self._finish_job(ft, source)
+        self._start_timer()
+
+    def _add_job(self, ft, source):
+        """Queues loading 'ft' from 'source' unless already done."""
+        key = (ft, id(source))
+        if key in self._queued or key in self._done:
+            return
+        self._queued.add(key)
+        self._outstanding[ft] += 1
+        self._jobs.append((ft, source, iter(source.preload(ft))))
+
+    def _finish_job(self, ft, source):
+        """Removes the first job, which is for 'ft' and 'source'."""
+        self._jobs.popleft()
+        key = (ft, id(source))
+        self._queued.discard(key)
+        self._done.add(key)
+        self._outstanding[ft] -= 1
+
+    def _start_timer(self):
+        """Makes sure run_slice() is called again if there is work left."""
+        if not self._jobs or self._timer_started:
+            return
+        self._timer_started = True
+        _vim.command('call timer_start(%i, "UltiSnips#PreloadStep")' %
+                     SLICE_DELAY_MS)
@@ -3,18 +3,344 @@
 
 """Implements a container for parsed snippets."""
 
+from collections import defaultdict
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from UltiSnips.snippet.definition._base import split_at_whitespace, \
+    words_for_line
+
+# Ranges in character sets up to this size are expanded when indexing
+# regular expression triggers.
+_MAX_RANGE = 128
+
+# Python 2 allows at most 100 groups per regular expression.
+_MAX_GROUPS = 90
+
+# Regular expression triggers with longer matches are searched for in the
+# whole text before the cursor, see _RegexTriggers.
+_MAX_TAIL = 256
+
+# Triggers referring to groups by number or using global flags cannot be
+# combined with others.
+_NOT_COMBINABLE = re.compile(r'\\[1-9]|\(\?\(|\(\?[aiLmsux]+\)')
+
+
+def _parse_regex(pattern):
+    """Returns the parsed 'pattern' and its state, which holds the flags and
+    groups."""
+    parsed = sre_parse.parse(pattern)
+    # Python < 3.11 calls the state 'pattern'.
+    return parsed, getattr(parsed, 'state', None) or parsed.pattern
+
+
+_DEFAULT_FLAGS = _parse_regex('')[1].flags
+
+
+def _is_plain(snippet):
+    """True if 'snippet' matches only the exact words of its trigger."""
+    return not (snippet.has_option('r') or snippet.has_option('i') or
+                snippet.has_option('w'))
+
+
+def _set_chars(items):
+    """Returns the characters matched by the items of a character set or None
+    if they cannot be enumerated."""
+    chars = set()
+    for op, av in items:
+        op = str(op).upper()
+        if op == 'LITERAL':
+            chars.add(u'%c' % av)
+        elif op == 'RANGE' and av[1] - av[0] < _MAX_RANGE:
+            chars.update(u'%c' % code for code in range(av[0], av[1] + 1))
+        else:
+            return None
+    return chars
+
+
+def _regex_last_chars(items):
+    """Returns the characters a match of the parsed regular expression 'items'
+    can end with or None if this is unknown or it can match the empty
+    string."""
+    items = list(items)
+    # Skip zero width assertions like '$' or '\b' at the end.
+    while items and str(items[-1][0]).upper() in (
+            'AT', 'ASSERT', 'ASSERT_NOT'):
+        items.pop()
+    if not items:
+        return None
+    op, av = items[-1]
+    op = str(op).upper()
+    if op == 'LITERAL':
+        return set([u'%c' % av])
+    elif op == 'IN':
+        return _set_chars(av)
+    elif op == 'SUBPATTERN':
+        if len(av) == 4 and av[1] & re.IGNORECASE:
+            return None
+        return _regex_last_chars(av[-1])
+    elif op == 'BRANCH':
+        chars = set()
+        for alternative in av[1]:
+            alternative_chars = _regex_last_chars(alternative)
+            if alternative_chars is None:
+                return None
+            chars.update(alternative_chars)
+        return chars
+    elif op in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+        if av[0] == 0:
+            return None
+        return _regex_last_chars(av[2])
+    return None
+
+
+def _last_chars(snippet):
+    """Returns the characters that the text before the cursor can end with
+    when 'snippet' matches or None if this is unknown."""
+    if snippet.has_option('r'):
+        try:
+            parsed, state = _parse_regex(snippet.trigger)
+        except Exception:  # pylint:disable=broad-except
+            # Reported when the snippet is matched.
+            return None
+        if state.flags & re.IGNORECASE:
+            return None
+        return _regex_last_chars(parsed)
+    last_char = snippet.trigger[-1:]
+    if not last_char or last_char.isspace():
+        return None
+    return set([last_char])
+
+
+class _RegexTriggers(object):
+
+    """Finds the regular expression triggers that can match at the end of a
+    text with one search per chunk of triggers.
+
+    Each trigger becomes an optional lookahead with a named group, so a single
+    match tells which triggers can match up to the end of the text. The
+    snippets still do the actual matching, this only rules out the ones that
+    cannot match.
+
+    A match of a trigger can be no longer than its maximum width, so triggers
+    are chunked by that width and the search for a chunk starts that far
+    before the end of the text. Within this tail each lookahead still tries
+    every start position, and chunks with triggers like 'a.*' whose matches
+    can be arbitrarily long search the whole text.
+
+    """
+
+    def __init__(self, entries):
+        self._uncombined = []
+        # Entries are (regex, maximum width of a match or None).
+        self._regexes = []
+        # group name -> entry
+        self._entries = {}
+        combinable = []
+        for entry in entries:
+            try:
+                parsed = self._parse(entry[1].trigger)
+            except Exception:  # pylint:disable=broad-except
+                parsed = None
+            if parsed is None:
+                self._uncombined.append(entry)
+            else:
+                combinable.append(parsed + (entry,))
+        # Unbounded widths last, so that they do not extend other chunks.
+        combinable.sort(key=lambda item: (item[1] is None, item[1] or 0))
+        parts = []
+        groups = 0
+        for num_groups, width, entry in combinable:
+            if parts and (groups + num_groups + 1 > _MAX_GROUPS or
+                          (width is None) != (parts[-1][1] is None)):
+                self._compile(parts)
+                parts, groups = [], 0
+            name = '_ultisnips_%i' % len(self._entries)
+            self._entries[name] = entry
+            parts.append((r'(?:(?=[\s\S]*?(?P<%s>%s)\Z))?' % (
+                name, entry[1].trigger), width, entry))
+            groups += num_groups + 1
+        if parts:
+            self._compile(parts)
+
+    @staticmethod
+    def _parse(trigger):
+        """Returns the number of groups of 'trigger' and the maximum width of
+        its matches (None if unbounded) or None if it cannot be combined with
+        other triggers."""
+        if _NOT_COMBINABLE.search(trigger):
+            return None
+        parsed, state = _parse_regex(trigger)
+        if state.flags != _DEFAULT_FLAGS or state.groupdict:
+            return None
+        width = parsed.getwidth()[1]
+        return state.groups - 1, width if width <= _MAX_TAIL else None
+
+    def _compile(self, parts):
+        """Compiles 'parts' into one regular expression."""
+        try:
+            regex = re.compile(''.join(pattern for pattern, _, _ in parts))
+        except Exception:  # pylint:disable=broad-except
+            self._uncombined.extend(entry for _, _, entry in parts)
+            return
+        self._regexes.append((regex, parts[-1][1]))
+
+    def candidates(self, before):
+        """Returns the entries whose trigger might match the end of
+        'before'."""
+        entries = list(self._uncombined)
+        for regex, width in self._regexes:
+            # Unlike slicing 'before', this keeps '^', '\b' and lookbehinds
+            # looking at the whole text.
+            start = 0 if width is None else max(0, len(before) - width)
+            groups = regex.match(before, start).groupdict()
+            entries.extend(self._entries[name] for name, value in
+                           groups.items() if value is not None)
+        return entries
+
+
+class _TrieNode(object):
+
+    """A node in the prefix trie of plain triggers."""
+
+    __slots__ = ('children', 'snippets')
+
+    def __init__(self):
+        self.children = {}
+        self.snippets = []
+
+    def insert(self, trigger, entry):
+        """Adds 'entry' for 'trigger' below this node."""
+        node = self
+        for char in trigger:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+        node.snippets.append(entry)
+
+    def with_prefix(self, prefix):
+        """Returns all entries whose trigger starts with 'prefix'."""
+        node = self
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        entries = []
+        todo = [node]
+        while todo:
+            node = todo.pop()
+            entries.extend(node.snippets)
+            todo.extend(node.children.values())
+        return entries
+
+
 class SnippetDictionary(object):
 
-    """See module docstring."""
+    """See module docstring.
+
+    Snippets with plain triggers (no 'r', 'i' or 'w' option) can only match
+    if the last words before the cursor equal or start their trigger. They are
+    indexed by trigger and by number of words in the trigger, so that only
+    those need to be checked. Regular expression triggers are prefiltered
+    together, see _RegexTriggers. All other snippets are checked one by one.
+
+    Autotrigger snippets are additionally indexed by the characters a match
+    can end with, which is all that is needed to check on every keystroke.
+
+    """
 
     def __init__(self):
         self._snippets = []
         self._cleared = {}
         self._clear_priority = float("-inf")
 
+        # Entries are (position in self._snippets, snippet).
+        self._linear = []
+        self._regex = []
+        self._regex_triggers = None
+        # number of words -> trigger -> entries
+        self._by_trigger = defaultdict(lambda: defaultdict(list))
+        # number of words -> trie of triggers
+        self._tries = defaultdict(_TrieNode)
+        # Autotrigger snippets by the last character of a match and those
+        # where this is unknown.
+        self._autotrigger_by_char = defaultdict(list)
+        self._autotrigger_any = []
+        self._autotrigger_any_regex = []
+        self._autotrigger_regex_triggers = None
+        self._num_context_snippets = 0
+
     def add_snippet(self, snippet):
         """Add 'snippet' to this dictionary."""
+        entry = (len(self._snippets), snippet)
         self._snippets.append(snippet)
+        if snippet.has_context:
+            self._num_context_snippets += 1
+        if snippet.has_option('A'):
+            last_chars = _last_chars(snippet)
+            if last_chars is None and snippet.has_option('r'):
+                self._autotrigger_any_regex.append(entry)
+                self._autotrigger_regex_triggers = None
+            elif last_chars is None:
+                self._autotrigger_any.append(entry)
+            else:
+                for char in last_chars:
+                    self._autotrigger_by_char[char].append(entry)
+        if snippet.has_option('r'):
+            self._regex.append(entry)
+            self._regex_triggers = None
+            return
+        if not _is_plain(snippet):
+            self._linear.append(entry)
+            return
+        num_words = len(split_at_whitespace(snippet.trigger))
+        self._by_trigger[num_words][snippet.trigger].append(entry)
+        self._tries[num_words].insert(snippet.trigger, entry)
+
+    def _autotrigger_candidates(self, before):
+        """Returns the autotrigger snippets that might match 'before', in the
+        order they were added."""
+        entries = list(self._autotrigger_any)
+        if self._autotrigger_any_regex:
+            if self._autotrigger_regex_triggers is None:
+                self._autotrigger_regex_triggers = _RegexTriggers(
+                    self._autotrigger_any_regex)
+            entries.extend(self._autotrigger_regex_triggers.candidates(before))
+        last_chars = set([before[-1:], before.rstrip()[-1:]])
+        for char in last_chars:
+            entries.extend(self._autotrigger_by_char.get(char, ()))
+        if len(last_chars) > 1:
+            entries = list(set(entries))
+        entries.sort(key=lambda entry: entry[0])
+        return [snippet for _, snippet in entries]
+
+    def _candidates(self, before, potentially):
+        """Returns the snippets that might match 'before', in the order they
+        were added."""
+        entries = list(self._linear)
+        if potentially:
+            # Listing on whitespace lists all, see could_match().
+            if before and before[-1] in (' ', '\t'):
+                before = ''
+        if self._regex:
+            if self._regex_triggers is None:
+                self._regex_triggers = _RegexTriggers(self._regex)
+            entries.extend(self._regex_triggers.candidates(before))
+        if potentially:
+            for num_words, trie in self._tries.items():
+                words = words_for_line('', before, num_words)
+                entries.extend(trie.with_prefix(words))
+        else:
+            for num_words, by_trigger in self._by_trigger.items():
+                words = words_for_line('', before, num_words)
+                entries.extend(by_trigger.get(words, ()))
+        entries.sort(key=lambda entry: entry[0])
+        return [snippet for _, snippet in entries]
 
     def get_matching_snippets(self, trigger, potentially, autotrigger_only,
                               visual_content):
@@ -30,9 +356,12 @@ class SnippetDictionary(object):
         made in insert mode.
 
         """
-        all_snippets = self._snippets
-        if autotrigger_only:
-            all_snippets = [s for s in all_snippets if s.has_option('A')]
+        if autotrigger_only and not potentially:
+            all_snippets = self._autotrigger_candidates(trigger)
+        else:
+            all_snippets = self._candidates(trigger, potentially)
+            if autotrigger_only:
+                all_snippets = [s for s in all_snippets if s.has_option('A')]
 
         if not potentially:
             return [s for s in all_snippets if s.matches(trigger,
@@ -40,6 +369,11 @@ class SnippetDictionary(object):
         else:
             return [s for s in all_snippets if s.could_match(trigger)]
 
+    @property
+    def has_context_snippets(self):
+        """True if any snippet has a context."""
+        return self._num_context_snippets > 0
+
     def clear_snippets(self, priority, triggers):
         """Clear the snippets by mark them as cleared.
 
@@ -56,5 +390,8 @@ class SnippetDictionary(object):
                         priority > self._cleared[trigger]):
                     self._cleared[trigger] = priority
 
+    def __iter__(self):
+        return iter(self._snippets)
+
     def __len__(self):
         return len(self._snippets)
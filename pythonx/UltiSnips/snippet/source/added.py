@@ -10,6 +10,12 @@ class AddedSnippetsSource(SnippetSource):
 
     """See module docstring."""
 
+    cache_lookups = True
+
+    def __init__(self):
+        SnippetSource.__init__(self)
+
     def add_snippet(self, ft, snippet):
         """Adds the given 'snippet' for 'ft'."""
         self._snippets[ft].add_snippet(snippet)
+        self._generation += 1
@@ -4,19 +4,33 @@
 """Code to provide access to UltiSnips files from disk."""
 
 from collections import defaultdict
-import hashlib
+from multiprocessing.pool import ThreadPool
 import os
+import threading
 
 from UltiSnips import _vim
 from UltiSnips import compatibility
 from UltiSnips.snippet.source._base import SnippetSource
+from UltiSnips.snippet.source._snippet_dictionary import SnippetDictionary
+from UltiSnips.snippet.source.file._cache import SnippetFileCache, \
+    hash_file, stat_file
+from UltiSnips.snippet.source.file._common import changed_files
+from UltiSnips.snippet.source.file._watcher import InotifyWatcher
 
 
-def _hash_file(path):
-    """Returns a hashdigest of 'path'."""
-    if not os.path.isfile(path):
-        return False
-    return hashlib.sha1(open(path, 'rb').read()).hexdigest()
+def watchable_directories(directory, prefix):
+    """Returns the (directory, prefix) pairs to watch for files starting with
+    'prefix' in 'directory'.
+
+    If 'directory' does not exist, its parent is watched for its creation.
+
+    """
+    if os.path.isdir(directory):
+        return [(directory, prefix)]
+    parent = os.path.dirname(directory)
+    if parent != directory and os.path.isdir(parent):
+        return [(parent, os.path.basename(directory))]
+    return []
 
 
 class SnippetSyntaxError(RuntimeError):
@@ -30,24 +44,151 @@ class SnippetSyntaxError(RuntimeError):
 
 class SnippetFileSource(SnippetSource):
 
-    """Base class that abstracts away 'extends' info and file hashes."""
+    """Base class that abstracts away 'extends' info and file hashes.
+
+    Files are only hashed when their stat() information changed since they
+    were last parsed. If g:UltiSnipsHashSnippetFiles is 0, a changed stat()
+    alone triggers a reload.
+
+    If g:UltiSnipsWatchSnippetDirectories is 1 and inotify is available, the
+    directories of a filetype are watched after it has been checked once.
+    Until a change is reported for them, ensure() does not touch the disk for
+    this filetype. Filetypes whose directories cannot be watched are polled.
+
+    Files are always merged in sorted order, so that the result does not
+    depend on whether they were read in parallel.
+
+    """
+
+    cache_lookups = True
 
     def __init__(self):
         SnippetSource.__init__(self)
         self._files_for_ft = defaultdict(set)
         self._file_hashes = defaultdict(lambda: None)
+        self._file_stats = defaultdict(lambda: None)
         self._ensure_cached = False
+        self._load_generations = defaultdict(int)
+        self._cache = SnippetFileCache(self.__class__.__name__)
+        self._hash_files = True
+        if _vim.eval("exists('g:UltiSnipsHashSnippetFiles')") == '1':
+            self._hash_files = _vim.eval('g:UltiSnipsHashSnippetFiles') != '0'
+        self._ensure_statistics = {
+            'stats': 0, 'hashes': 0, 'reparses': 0, 'cached': 0}
+        self._parallel_load = 0
+        if _vim.eval("exists('g:UltiSnipsParallelLoad')") == '1':
+            self._parallel_load = int(_vim.eval('g:UltiSnipsParallelLoad'))
+        self._pool = None
+
+        self._watch_lock = threading.Lock()
+        self._watcher = None
+        if _vim.eval("exists('g:UltiSnipsWatchSnippetDirectories')") == '1' \
+                and _vim.eval('g:UltiSnipsWatchSnippetDirectories') != '0':
+            self._watcher = InotifyWatcher.create(self._on_directory_changed)
+        # ft -> search path key under which its directories are watched.
+        self._watched_fts = {}
+        # directory -> set of (ft, prefix of the files relevant for ft).
+        self._watched_directories = defaultdict(set)
+
+    @property
+    def ensure_statistics(self):
+        """How many files the last non-cached ensure() stat'ed, hashed and
+        reparsed, and how many of the reparsed ones were read from the on-disk
+        cache."""
+        return dict(self._ensure_statistics)
 
     def ensure(self, filetypes, cached):
         if cached and self._ensure_cached:
             return
 
+        self._ensure_statistics = {
+            'stats': 0, 'hashes': 0, 'reparses': 0, 'cached': 0}
+        if changed_files:
+            self._forget_changed_files()
+        search_path_key = None
+        if self._watcher is not None:
+            search_path_key = self._get_search_path_key()
         for ft in self.get_deep_extends(filetypes):
-            if self._needs_update(ft):
-                self._load_snippets_for(ft)
+            if search_path_key is not None:
+                if self._watched_fts.get(ft) == search_path_key:
+                    continue
+                # Watch before checking, changes made while we check are then
+                # reported and picked up on the next call.
+                self._watch_filetype(ft, search_path_key)
+            try:
+                if self._needs_update(ft):
+                    self._load_snippets_for(ft)
+            except:
+                with self._watch_lock:
+                    self._watched_fts.pop(ft, None)
+                raise
 
         self._ensure_cached = True
 
+    def _forget_changed_files(self):
+        """Makes the files of this source that were found to differ from what
+        was parsed look changed, even if their stat() is the same."""
+        for filename in list(changed_files):
+            if filename not in self._file_stats:
+                continue
+            changed_files.discard(filename)
+            del self._file_stats[filename]
+            self._file_hashes.pop(filename, None)
+            self._cache.remove(filename)
+            with self._watch_lock:
+                for ft, filenames in self._files_for_ft.items():
+                    if filename in filenames:
+                        self._watched_fts.pop(ft, None)
+
+    def _get_search_path_key(self):
+        """Returns a value that changes whenever the directories searched for
+        snippet files change."""
+        return _vim.eval('&runtimepath')
+
+    def _get_watch_directories_for(self, ft):
+        """Returns (directory, prefix) pairs. A change of a file starting with
+        'prefix' in 'directory' affects the snippets of 'ft'."""
+        raise NotImplementedError()
+
+    def _get_all_watch_directories_for(self, ft):
+        """Returns the directories of _get_watch_directories_for() and those
+        of the targets of symlinked snippet files for 'ft'. Changes of a
+        target are not reported for the directory of its link."""
+        directories = set(self._get_watch_directories_for(ft))
+        real_directories = set(os.path.realpath(directory)
+                               for directory, _ in directories)
+        for filename in self._get_all_snippet_files_for(ft):
+            target = os.path.realpath(filename)
+            directory = os.path.dirname(target)
+            if directory not in real_directories:
+                directories.add((directory, os.path.basename(target)))
+        return directories
+
+    def _watch_filetype(self, ft, search_path_key):
+        """Watches all directories of 'ft', marks it as clean if this worked
+        for all of them."""
+        with self._watch_lock:
+            self._watched_fts[ft] = search_path_key
+        all_watched = True
+        for directory, prefix in self._get_all_watch_directories_for(ft):
+            with self._watch_lock:
+                self._watched_directories[directory].add((ft, prefix))
+            if not self._watcher.watch(directory):
+                all_watched = False
+        if not all_watched:
+            with self._watch_lock:
+                self._watched_fts.pop(ft, None)
+
+    def _on_directory_changed(self, directory, name):
+        """Called by the watcher thread for every change."""
+        with self._watch_lock:
+            if directory is None:
+                self._watched_fts.clear()
+                return
+            for ft, prefix in self._watched_directories.get(directory, ()):
+                if name is None or name.startswith(prefix):
+                    self._watched_fts.pop(ft, None)
+
     def _get_all_snippet_files_for(self, ft):
         """Returns a set of all files that define snippets for 'ft'."""
         raise NotImplementedError()
@@ -65,48 +206,174 @@ class SnippetFileSource(SnippetSource):
             return True
 
         for filename in self._files_for_ft[ft]:
-            if _hash_file(filename) != self._file_hashes[filename]:
+            if self._file_has_changed(filename):
                 return True
 
         return False
 
+    def _file_has_changed(self, filename):
+        """Returns true if 'filename' changed since it was last parsed."""
+        self._ensure_statistics['stats'] += 1
+        stat = stat_file(filename)
+        if stat is not None and stat == self._file_stats[filename]:
+            return False
+        if not self._hash_files:
+            return True
+
+        self._ensure_statistics['hashes'] += 1
+        if hash_file(filename) != self._file_hashes[filename]:
+            return True
+        # Only the stat() changed, e.g. through 'touch'. Do not hash again
+        # until it changes once more.
+        self._file_stats[filename] = stat
+        return False
+
+    def preload(self, ft):
+        if not self._needs_update(ft):
+            return
+        for _ in self._iter_load_snippets_for(ft, load_parents=False):
+            yield
+
     def _load_snippets_for(self, ft):
         """Load all snippets for the given 'ft'."""
-        if ft in self._snippets:
-            del self._snippets[ft]
-            del self._extends[ft]
+        for _ in self._iter_load_snippets_for(ft):
+            pass
+
+    def _iter_load_snippets_for(self, ft, load_parents=True):
+        """Loads all snippets for the given 'ft' and, if 'load_parents' is
+        true, for the filetypes it extends that need an update. Yields after
+        each event of the snippet files.
+
+        The files of all filetypes of one level of extends are fetched
+        together, see _fetch_files().
+
+        """
+        loaded = set()
+        filetypes = [ft]
+        while filetypes:
+            filenames = [sorted(self._files_for_ft[f]) for f in filetypes]
+            fetched = self._fetch_files(
+                [fn for names in filenames for fn in names])
+            for f, names in zip(filetypes, filenames):
+                for _ in self._iter_load_fetched(f, names, fetched):
+                    yield
+            loaded.update(filetypes)
+            if not load_parents:
+                return
+            filetypes = [parent_ft for parent_ft in
+                         self.get_deep_extends(filetypes)
+                         if parent_ft not in loaded and
+                         self._needs_update(parent_ft)]
+
+    def _iter_load_fetched(self, ft, filenames, fetched):
+        """Loads the snippets of 'ft' from 'filenames', whose
+        _fetch_snippet_file() results are the next items of 'fetched'.
+
+        The source is only changed once all files are parsed, so an abandoned
+        iteration leaves it untouched. If 'ft' was loaded by someone else in
+        the meantime, the result is discarded.
+
+        """
+        generation = self._load_generations[ft]
+        snippets = SnippetDictionary()
+        extends = set()
+        file_states = {}
+        cached = 0
         try:
-            for fn in self._files_for_ft[ft]:
-                self._parse_snippets(ft, fn)
+            for fn in filenames:
+                stat, digest, stamp, events, file_data = next(fetched)
+                file_states[fn] = (stat, digest)
+                if events is None:
+                    events = self._iter_parsed_events(
+                        fn, stamp, digest, file_data)
+                else:
+                    cached += 1
+                for event, data in events:
+                    self._handle_event(snippets, extends, fn, event, data)
+                    yield
         except:
-            del self._files_for_ft[ft]
+            if generation == self._load_generations[ft]:
+                self._snippets.pop(ft, None)
+                self._extends.pop(ft, None)
+                self._files_for_ft.pop(ft, None)
+                self._generation += 1
             raise
-        # Now load for the parents
-        for parent_ft in self.get_deep_extends([ft]):
-            if parent_ft != ft and self._needs_update(parent_ft):
-                self._load_snippets_for(parent_ft)
-
-    def _parse_snippets(self, ft, filename):
-        """Parse the 'filename' for the given 'ft' and watch it for changes in
-        the future."""
-        self._file_hashes[filename] = _hash_file(filename)
-        file_data = compatibility.open_ascii_file(filename, 'r').read()
+        if generation != self._load_generations[ft]:
+            return
+
+        self._load_generations[ft] += 1
+        self._generation += 1
+        self._snippets[ft] = snippets
+        self._extends[ft] = extends
+        for fn, (stat, digest) in file_states.items():
+            self._file_stats[fn] = stat
+            self._file_hashes[fn] = digest
+        self._ensure_statistics['reparses'] += len(file_states)
+        self._ensure_statistics['cached'] += cached
+
+    def _fetch_files(self, filenames):
+        """Returns an iterator over the _fetch_snippet_file() results for
+        'filenames', in order.
+
+        With g:UltiSnipsParallelLoad set, the files are fetched by a pool of
+        threads while the results are consumed.
+
+        """
+        # Resolve the cache directory here, the workers must not talk to Vim.
+        self._cache.directory  # pylint:disable=pointless-statement
+        if self._parallel_load < 2 or len(filenames) < 2:
+            return (self._fetch_snippet_file(fn) for fn in filenames)
+        if self._pool is None:
+            self._pool = ThreadPool(self._parallel_load)
+        return self._pool.imap(self._fetch_snippet_file, filenames)
+
+    def _fetch_snippet_file(self, filename):
+        """Does all the work for loading 'filename' that does not need Vim.
+
+        Returns (stat, hash, stamp, events, file_data). 'events' are the cached
+        events or None, then 'file_data' is the content to parse. The file is
+        only hashed if it is not cached.
+
+        """
+        stat = stat_file(filename)
+        stamp = stat[1:] if stat is not None else None
+        cached = self._cache.load(filename, stamp)
+        if cached is not None:
+            digest, events = cached
+            return stat, digest, stamp, events, None
+        digest = hash_file(filename) if self._hash_files else None
+        with compatibility.open_ascii_file(filename, 'r') as snippet_file:
+            return stat, digest, stamp, None, snippet_file.read()
+
+    def _iter_parsed_events(self, filename, stamp, digest, file_data):
+        """Parses 'file_data' of 'filename' and yields its events. The events
+        are cached if the file had no errors."""
+        events = []
         for event, data in self._parse_snippet_file(file_data, filename):
-            if event == 'error':
-                msg, line_index = data
-                filename = _vim.eval("""fnamemodify(%s, ":~:.")""" %
-                                     _vim.escape(filename))
-                raise SnippetSyntaxError(filename, line_index, msg)
-            elif event == 'clearsnippets':
-                priority, triggers = data
-                self._snippets[ft].clear_snippets(priority, triggers)
-            elif event == 'extends':
-                # TODO(sirver): extends information is more global
-                # than one snippet source.
-                filetypes, = data
-                self.update_extends(ft, filetypes)
-            elif event == 'snippet':
-                snippet, = data
-                self._snippets[ft].add_snippet(snippet)
-            else:
-                assert False, 'Unhandled %s: %r' % (event, data)
+            events.append((event, data))
+            yield event, data
+        # Errors are raised while handling the event above, so we only get
+        # here for files without them.
+        self._cache.store(filename, stamp, digest, events)
+
+    def _handle_event(self, snippets, extends, filename, event, data):
+        """Applies one parse 'event' of 'filename' to 'snippets' and
+        'extends'."""
+        if event == 'error':
+            msg, line_index = data
+            filename = _vim.eval("""fnamemodify(%s, ":~:.")""" %
+                                 _vim.escape(filename))
+            raise SnippetSyntaxError(filename, line_index, msg)
+        elif event == 'clearsnippets':
+            priority, triggers = data
+            snippets.clear_snippets(priority, triggers)
+        elif event == 'extends':
+            # TODO(sirver): extends information is more global
+            # than one snippet source.
+            filetypes, = data
+            extends.update(filetypes)
+        elif event == 'snippet':
+            snippet, = data
+            snippets.add_snippet(snippet)
+        else:
+            assert False, 'Unhandled %s: %r' % (event, data)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Persistent on-disk cache for the events of parsed snippet files."""
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+from UltiSnips import _vim
+
+# Bump this whenever the parsers or the pickled definitions change in a way
+# that makes old cache entries invalid.
+CACHE_VERSION = 7
+
+_PICKLE_PROTOCOL = 2  # Readable by Python 2 and 3.
+
+# A file modified this close to the time its entry was stored could change
+# again without changing its size and mtime. Such 'racy' entries are checked
+# against the hash of the file before they are used.
+_RACY_NS = 2 * 10**9
+
+
+def _default_cache_directory():
+    """Returns the directory used when g:UltiSnipsCacheDirectory is unset."""
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'UltiSnips')
+
+
+def is_racy(stamp, when):
+    """True if the file with the file_stamp() 'stamp' could have changed
+    after the time 'when' (in ns) without getting a new stamp."""
+    return when - stamp[1] < _RACY_NS
+
+
+def hash_file(path):
+    """Returns a hashdigest of 'path'."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as hashed_file:
+        return hashlib.sha1(hashed_file.read()).hexdigest()
+
+
+def stat_file(path):
+    """Returns (st_ino, st_size, st_mtime_ns) of 'path' or None if it cannot
+    be stat'ed."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return stat.st_ino, stat.st_size, mtime_ns
+
+
+def file_stamp(path):
+    """Returns (size, mtime in ns) of 'path' or None if it cannot be
+    stat'ed."""
+    stat = stat_file(path)
+    if stat is None:
+        return None
+    return stat[1:]
+
+
+class SnippetFileCache(object):
+
+    """Stores the events yielded while parsing a snippet file, keyed by the
+    path, size and mtime of the file and the parser version.
+
+    'kind' distinguishes the parsers of different snippet sources. The hash of
+    the file is stored with the events, so that it does not need to be read
+    when the entry is used.
+
+    """
+
+    def __init__(self, kind):
+        self._kind = kind
+        self._directory = None
+
+    @property
+    def directory(self):
+        """The versioned directory holding the cache entries or '' if caching
+        is disabled."""
+        if self._directory is None:
+            if _vim.eval("exists('g:UltiSnipsCacheDirectory')") == '1':
+                directory = _vim.eval('g:UltiSnipsCacheDirectory')
+            else:
+                directory = _default_cache_directory()
+            if directory:
+                directory = os.path.join(
+                    os.path.expanduser(directory),
+                    'v%i-py%i.%i' % ((CACHE_VERSION,) + sys.version_info[:2]))
+            self._directory = directory
+        return self._directory
+
+    def _entry_for(self, filename):
+        """Returns the path of the cache entry for 'filename'."""
+        key = '%s:%s' % (self._kind, os.path.realpath(filename))
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.pickle')
+
+    def _header_for(self, filename, stamp):
+        """Returns the header that must match for an entry to be valid."""
+        return (CACHE_VERSION, self._kind, os.path.realpath(filename), stamp)
+
+    def load(self, filename, stamp):
+        """Returns (hash, events) cached for 'filename' or None if there is no
+        valid entry. 'stamp' is the current file_stamp() of the file."""
+        if not self.directory or stamp is None:
+            return None
+        try:
+            with open(self._entry_for(filename), 'rb') as cache_file:
+                header, racy, digest, events = pickle.load(cache_file)
+        except Exception:  # pylint:disable=broad-except
+            # Missing, truncated or otherwise corrupt entries are simply
+            # reparsed.
+            return None
+        if header != self._header_for(filename, stamp):
+            return None
+        if racy and (digest is None or hash_file(filename) != digest):
+            return None
+        return digest, events
+
+    def remove(self, filename):
+        """Removes the cache entry for 'filename' if there is one."""
+        if not self.directory:
+            return
+        try:
+            os.remove(self._entry_for(filename))
+        except OSError:
+            pass
+
+    def store(self, filename, stamp, digest, events):
+        """Writes 'events' as the cache entry for 'filename'.
+
+        'stamp' is the file_stamp() and 'digest' the hash_file() of the file
+        (or None) taken before it was read. Failures are silently ignored, the
+        cache is an optimization only.
+
+        """
+        if not self.directory or stamp is None:
+            return
+        racy = is_racy(stamp, time.time() * 10**9)
+        tmp_path = None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            handle, tmp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(handle, 'wb') as cache_file:
+                pickle.dump((self._header_for(filename, stamp), racy, digest,
+                             events), cache_file, _PICKLE_PROTOCOL)
+            entry = self._entry_for(filename)
+            if os.name == 'nt' and os.path.exists(entry):
+                os.remove(entry)
+            os.rename(tmp_path, entry)
+        except Exception:  # pylint:disable=broad-except
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -3,6 +3,13 @@
 
 """Common code for snipMate and UltiSnips snippet files."""
 
+from collections import OrderedDict
+import time
+import zlib
+
+from UltiSnips.compatibility import open_ascii_file
+from UltiSnips.snippet.source.file._cache import file_stamp, is_racy
+
 
 def handle_extends(tail, line_index):
     """Handles an extends line in a snippet."""
@@ -27,3 +34,131 @@ def handle_context(tail, line_index):
             .replace(r'\\\\', r'\\')
     else:
         return 'error', ("'context' without body", line_index)
+
+
+def line_checksum(line, checksum=0):
+    """Returns the running 'checksum' of the lines of a snippet with 'line'
+    added."""
+    if not isinstance(line, bytes):
+        line = line.encode('utf-8')
+    return zlib.crc32(line, checksum) & 0xffffffff
+
+
+# Files that were found to differ from what was parsed. The snippet sources
+# parse them again the next time they are ensured, even if their stat() is
+# unchanged.
+changed_files = set()
+
+# Number of snippet files whose lines are kept after they were read, so that
+# listing many snippets of a file reads it only once. They are read again if
+# their stamp changed or they could have changed without a new stamp.
+_RECENT_FILES_SIZE = 8
+
+# filename -> (file_stamp(), time of reading in ns, lines) of the files read
+# last.
+_recent_files = OrderedDict()
+
+
+class SnippetFileChanged(RuntimeError):
+
+    """Thrown when a snippet is read from a file whose content changed since
+    it was parsed. The file must be parsed again."""
+
+    def __init__(self, filename):
+        RuntimeError.__init__(
+            self, '%s changed since it was loaded, please try again.' %
+            filename)
+
+
+class SnippetFile(object):
+
+    """A snippet file that was parsed. The snippets read their lines from it
+    when they are needed."""
+
+    __slots__ = ('filename',)
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def read_lines(self):
+        """Returns the lines of the file, with line endings."""
+        stamp = file_stamp(self.filename)
+        recent = _recent_files.pop(self.filename, None)
+        if (recent is None or stamp is None or recent[0] != stamp or
+                is_racy(stamp, recent[1])):
+            now = time.time() * 10**9
+            try:
+                with open_ascii_file(self.filename, 'r') as snippet_file:
+                    recent = (stamp, now, snippet_file.read().splitlines(True))
+            except (IOError, OSError):
+                raise self.changed()
+            if len(_recent_files) >= _RECENT_FILES_SIZE:
+                _recent_files.popitem(last=False)
+        _recent_files[self.filename] = recent
+        return recent[2]
+
+    def changed(self):
+        """Marks the file as changed since it was parsed and returns the
+        exception to raise."""
+        _recent_files.pop(self.filename, None)
+        changed_files.add(self.filename)
+        return SnippetFileChanged(self.filename)
+
+
+class SnippetBody(object):
+
+    """The text of a snippet, given as the lines 'start' up to 'end' (0 based,
+    exclusive) of a SnippetFile. It is only read from the file when the
+    snippet is expanded. The line before 'start' is its header.
+
+    'checksum' is the line_checksum() of the header and the text as they were
+    parsed. If they changed, the file is marked as changed. If 'strip_tab' is
+    true, one leading tab is removed from each line.
+
+    """
+
+    __slots__ = ('snippet_file', 'start', 'end', 'checksum', 'strip_tab')
+
+    def __init__(self, snippet_file, start, end, checksum, strip_tab=False):
+        self.snippet_file = snippet_file
+        self.start = start
+        self.end = end
+        self.checksum = checksum
+        self.strip_tab = strip_tab
+
+    def _read_lines(self):
+        """Returns the header and the lines of the snippet."""
+        lines = self.snippet_file.read_lines()[self.start - 1:self.end]
+        checksum = 0
+        for line in lines:
+            checksum = line_checksum(line, checksum)
+        if checksum != self.checksum:
+            raise self.snippet_file.changed()
+        return lines
+
+    def read_header(self):
+        """Returns the header line of the snippet."""
+        return self._read_lines()[0]
+
+    def read(self):
+        """Returns the text of the snippet."""
+        lines = self._read_lines()[1:]
+        if self.strip_tab:
+            lines = [line[1:] if line[0] == '\t' else line for line in lines]
+        return ''.join(lines)[:-1]  # Chomp the last newline
+
+
+class SnippetDescription(object):
+
+    """The description of a snippet, parsed from the header line of its
+    SnippetBody by the function 'parse' when it is needed."""
+
+    __slots__ = ('body', 'parse')
+
+    def __init__(self, body, parse):
+        self.body = body
+        self.parse = parse
+
+    def read(self):
+        """Returns the description."""
+        return self.parse(self.body.read_header())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""An index of the snippet directories in the runtime path that is shared by
+all file based snippet sources.
+
+Instead of globbing several patterns in every runtime path entry, each
+directory is listed once and the listing is reused until the directory's
+mtime changes.
+
+"""
+
+import os
+import time
+
+from UltiSnips.snippet.source.file._cache import stat_file
+
+# Listings of directories modified less than this many seconds before they
+# were read are not kept: another change in the same mtime tick would go
+# unnoticed.
+_RACY_SECONDS = 2
+
+
+def _scan_directory(directory):
+    """Returns {name: is_dir} for all entries of 'directory' that a glob for
+    '*' would return, i.e. without hidden ones."""
+    entries = {}
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(directory):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                entries[entry.name] = entry.is_dir()
+            except OSError:
+                entries[entry.name] = False
+    else:
+        for name in os.listdir(directory):
+            if name.startswith('.'):
+                continue
+            entries[name] = os.path.isdir(os.path.join(directory, name))
+    return entries
+
+
+class SnippetDirectoryIndex(object):
+
+    """Caches directory listings and the lists of searched directories."""
+
+    def __init__(self):
+        # directory -> (stat_file() of directory, {name: is_dir})
+        self._listings = {}
+        # (kind, key) -> list of directories
+        self._search_paths = {}
+
+    def search_path(self, kind, key, compute):
+        """Returns the directories for 'kind' that 'compute()' returned for
+        'key' before, calling it only if 'key' changed."""
+        cached = self._search_paths.get(kind)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        directories = compute()
+        self._search_paths[kind] = (key, directories)
+        return directories
+
+    def listing(self, directory):
+        """Returns {name: is_dir} for the entries in 'directory'. Missing
+        directories are empty."""
+        stat = stat_file(directory)
+        if stat is None:
+            self._listings.pop(directory, None)
+            return {}
+        cached = self._listings.get(directory)
+        if cached is not None and cached[0] == stat:
+            return cached[1]
+        try:
+            entries = _scan_directory(directory)
+        except OSError:
+            return {}
+        if stat[2] < (time.time() - _RACY_SECONDS) * 1e9:
+            self._listings[directory] = (stat, entries)
+        else:
+            self._listings.pop(directory, None)
+        return entries
+
+    def ultisnips_files_for(self, ft, directory):
+        """Returns the files for 'ft' in the UltiSnips 'directory', the same
+        as globbing 'ft.snippets', 'ft_*.snippets' and 'ft/*'."""
+        ret = set()
+        listing = self.listing(directory)
+        exact = ft + '.snippets'
+        prefix = ft + '_'
+        for name in listing:
+            if name == exact or (name.startswith(prefix) and
+                                 name.endswith('.snippets') and
+                                 len(name) >= len(prefix) + len('.snippets')):
+                ret.add(os.path.join(directory, name))
+        if listing.get(ft):
+            ft_dir = os.path.join(directory, ft)
+            for name in self.listing(ft_dir):
+                ret.add(os.path.join(ft_dir, name))
+        return ret
+
+    def snipmate_files_for(self, ft, directory):
+        """Returns the files for 'ft' in the snipMate 'directory', the same as
+        globbing 'ft.snippets', 'ft/*.snippets', 'ft/*.snippet' and
+        'ft/*/*.snippet'."""
+        ret = set()
+        listing = self.listing(directory)
+        if ft + '.snippets' in listing:
+            ret.add(os.path.join(directory, ft + '.snippets'))
+        if listing.get(ft):
+            ft_dir = os.path.join(directory, ft)
+            for name, is_dir in self.listing(ft_dir).items():
+                if name.endswith('.snippets') or name.endswith('.snippet'):
+                    ret.add(os.path.join(ft_dir, name))
+                if is_dir:
+                    trigger_dir = os.path.join(ft_dir, name)
+                    for trigger_name in self.listing(trigger_dir):
+                        if trigger_name.endswith('.snippet'):
+                            ret.add(os.path.join(trigger_dir, trigger_name))
+        return ret
+
+
+directory_index = SnippetDirectoryIndex()  # pylint:disable=invalid-name
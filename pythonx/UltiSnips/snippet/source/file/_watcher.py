@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Watches snippet directories through Linux' inotify so that changed files
+are pushed to the snippet sources instead of being polled for."""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+               IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+               IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _fs_encode(path):
+    """Returns 'path' as bytes for passing it to libc."""
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding() or 'utf-8')
+
+
+def _fs_decode(name):
+    """Returns the bytes 'name' from an event as text."""
+    return name.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')
+
+
+def _load_libc():
+    """Returns libc with the inotify functions or None if unavailable."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        for name in ('inotify_init1', 'inotify_add_watch', 'inotify_rm_watch'):
+            getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class InotifyWatcher(object):
+
+    """Watches directories and calls 'callback(directory, name)' from a
+    background thread whenever an entry 'name' of a watched 'directory'
+    changes.
+
+    'name' is None if the directory itself went away, 'directory' is None if
+    events were lost and everything must be considered changed.
+
+    """
+
+    def __init__(self, libc, callback):
+        self._libc = libc
+        self._callback = callback
+        self._fd = libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._lock = threading.Lock()
+        self._wd_to_directory = {}
+        self._directory_to_wd = {}
+        self._limit_reached = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='UltiSnipsWatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @classmethod
+    def create(cls, callback):
+        """Returns a running watcher or None if inotify is not available."""
+        libc = _load_libc()
+        if libc is None:
+            return None
+        try:
+            return cls(libc, callback)
+        except OSError:
+            return None
+
+    @property
+    def limit_reached(self):
+        """True if a watch could not be added because the kernel limit of
+        watches or memory was exhausted."""
+        return self._limit_reached
+
+    def watch(self, directory):
+        """Starts watching 'directory'. Returns False if it can not be
+        watched, callers must then poll it."""
+        with self._lock:
+            if directory in self._directory_to_wd:
+                return True
+            if self._stopped:
+                return False
+            wd = self._libc.inotify_add_watch(
+                self._fd, _fs_encode(directory), _WATCH_MASK)
+            if wd < 0:
+                if ctypes.get_errno() in (errno.ENOSPC, errno.ENOMEM):
+                    self._limit_reached = True
+                return False
+            self._wd_to_directory[wd] = directory
+            self._directory_to_wd[directory] = wd
+            return True
+
+    def stop(self):
+        """Stops the background thread and releases all watches."""
+        with self._lock:
+            self._stopped = True
+        self._thread.join()
+        os.close(self._fd)
+
+    def _run(self):
+        """Reads and dispatches events until stop() is called."""
+        while not self._stopped:
+            try:
+                readable, _, _ = select.select([self._fd], [], [], 0.5)
+                if not readable:
+                    continue
+                data = os.read(self._fd, 64 * 1024)
+            except (OSError, select.error) as e:
+                if getattr(e, 'errno', None) == errno.EINTR or \
+                        (e.args and e.args[0] == errno.EINTR):
+                    continue
+                # The watcher is unusable, have the sources poll again.
+                with self._lock:
+                    self._stopped = True
+                self._callback(None, None)
+                return
+            self._dispatch(data)
+
+    def _dispatch(self, data):
+        """Calls the callback for all events in 'data'."""
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self._callback(None, None)
+                continue
+            with self._lock:
+                directory = self._wd_to_directory.get(wd)
+                if mask & IN_IGNORED and directory is not None:
+                    del self._wd_to_directory[wd]
+                    del self._directory_to_wd[directory]
+            if directory is None:
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF) or not name:
+                self._callback(directory, None)
+            else:
+                self._callback(directory, _fs_decode(name))
@@ -4,12 +4,14 @@
 """Parses snipMate files."""
 
 import os
-import glob
 
 from UltiSnips import _vim
 from UltiSnips.snippet.definition import SnipMateSnippetDefinition
-from UltiSnips.snippet.source.file._base import SnippetFileSource
-from UltiSnips.snippet.source.file._common import handle_extends
+from UltiSnips.snippet.source.file._base import SnippetFileSource, \
+    watchable_directories
+from UltiSnips.snippet.source.file._directory_index import directory_index
+from UltiSnips.snippet.source.file._common import handle_extends, \
+    line_checksum, SnippetBody, SnippetDescription, SnippetFile
 from UltiSnips.text import LineIterator, head_tail
 
 
@@ -32,23 +34,21 @@ def _splitall(path):
     return allparts
 
 
+def _snipmate_directories():
+    """Returns all 'snippets' directories in the runtime path."""
+    runtimepath = _vim.eval('&runtimepath')
+    return directory_index.search_path('snipmate', runtimepath, lambda: [
+        os.path.realpath(os.path.expanduser(os.path.join(rtp, 'snippets')))
+        for rtp in runtimepath.split(',')])
+
+
 def snipmate_files_for(ft):
     """Returns all snipMate files we need to look at for 'ft'."""
     if ft == 'all':
         ft = '_'
-    patterns = [
-        '%s.snippets' % ft,
-        os.path.join(ft, '*.snippets'),
-        os.path.join(ft, '*.snippet'),
-        os.path.join(ft, '*/*.snippet'),
-    ]
     ret = set()
-    for rtp in _vim.eval('&runtimepath').split(','):
-        path = os.path.realpath(os.path.expanduser(
-            os.path.join(rtp, 'snippets')))
-        for pattern in patterns:
-            for fn in glob.glob(os.path.join(path, pattern)):
-                ret.add(fn)
+    for path in _snipmate_directories():
+        ret.update(directory_index.snipmate_files_for(ft, path))
     return ret
 
 
@@ -69,24 +69,36 @@ def _parse_snippet_file(content, full_filename):
                                                 description, full_filename),)
 
 
-def _parse_snippet(line, lines, filename):
+def _split_header(line):
+    """Returns the trigger and the description in the header 'line' of a
+    snippet."""
+    return head_tail(line[len('snippet'):].lstrip())
+
+
+def _description(header):
+    """Returns the description in the 'header' line of a snippet."""
+    return _split_header(header)[1]
+
+
+def _parse_snippet(line, lines, snippet_file):
     """Parse a snippet defintions."""
     start_line_index = lines.line_index
-    trigger, description = head_tail(line[len('snippet'):].lstrip())
-    content = ''
+    trigger, description = _split_header(line)
+    checksum = line_checksum(line)
     while True:
         next_line = lines.peek()
         if next_line is None:
             break
         if next_line.strip() and not next_line.startswith('\t'):
             break
-        line = next(lines)
-        if line[0] == '\t':
-            line = line[1:]
-        content += line
-    content = content[:-1]  # Chomp the last newline
+        checksum = line_checksum(next(lines), checksum)
+    body = SnippetBody(snippet_file, start_line_index, lines.line_index,
+                       checksum, strip_tab=True)
+    if description:
+        description = SnippetDescription(body, _description)
     return 'snippet', (SnipMateSnippetDefinition(
-        trigger, content, description, '%s:%i' % (filename, start_line_index)),)
+        trigger, body, description,
+        '%s:%i' % (snippet_file.filename, start_line_index)),)
 
 
 def _parse_snippets_file(data, filename):
@@ -95,6 +107,7 @@ def _parse_snippets_file(data, filename):
     Yields events in the file.
 
     """
+    snippet_file = SnippetFile(filename)
     lines = LineIterator(data)
     for line in lines:
         if not line.strip():
@@ -104,7 +117,7 @@ def _parse_snippets_file(data, filename):
         if head == 'extends':
             yield handle_extends(tail, lines.line_index)
         elif head in 'snippet':
-            snippet = _parse_snippet(line, lines, filename)
+            snippet = _parse_snippet(line, lines, snippet_file)
             if snippet is not None:
                 yield snippet
         elif head and not head.startswith('#'):
@@ -118,6 +131,20 @@ class SnipMateFileSource(SnippetFileSource):
     def _get_all_snippet_files_for(self, ft):
         return snipmate_files_for(ft)
 
+    def _get_watch_directories_for(self, ft):
+        if ft == 'all':
+            ft = '_'
+        directories = set()
+        for path in _snipmate_directories():
+            directories.update(watchable_directories(path, ft))
+            ft_dir = os.path.join(path, ft)
+            directories.update(watchable_directories(ft_dir, ''))
+            # Single snippets live in one directory per trigger.
+            for name, is_dir in directory_index.listing(ft_dir).items():
+                if is_dir:
+                    directories.add((os.path.join(ft_dir, name), ''))
+        return directories
+
     def _parse_snippet_file(self, filedata, filename):
         if filename.lower().endswith('snippet'):
             for event, data in _parse_snippet_file(filedata, filename):
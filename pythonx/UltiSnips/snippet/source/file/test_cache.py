@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import _cache
+from _cache import SnippetFileCache, file_stamp, hash_file
+
+_EVENTS = [('extends', (['c'], 1)), ('clearsnippets', (0, ['a']))]
+
+
+class TestSnippetFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'all.snippets')
+        self._write('content')
+        self.cache = self._cache('UltiSnipsFileSource')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _cache(self, kind):
+        cache = SnippetFileCache(kind)
+        cache._directory = os.path.join(self.directory, 'cache')
+        return cache
+
+    def _write(self, content):
+        with open(self.filename, 'w') as snippet_file:
+            snippet_file.write(content)
+
+    def _store(self, digest=True):
+        if digest is True:
+            digest = hash_file(self.filename)
+        self.cache.store(self.filename, file_stamp(self.filename), digest,
+                         _EVENTS)
+
+    def _load(self, cache=None):
+        cached = (cache or self.cache).load(
+            self.filename, file_stamp(self.filename))
+        return cached[1] if cached is not None else None
+
+    def _make_old(self):
+        mtime = os.stat(self.filename).st_mtime - 10
+        os.utime(self.filename, (mtime, mtime))
+
+    def _write_keeping_stamp(self, content):
+        stat = os.stat(self.filename)
+        stamp = file_stamp(self.filename)
+        self._write(content)
+        if hasattr(stat, 'st_mtime_ns'):
+            os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        else:
+            os.utime(self.filename, (stat.st_atime, stat.st_mtime))
+        self.assertEqual(stamp, file_stamp(self.filename))
+
+    def _entries(self):
+        return [os.path.join(self.cache.directory, name)
+                for name in os.listdir(self.cache.directory)]
+
+    def test_empty(self):
+        self.assertEqual(None, self._load())
+
+    def test_stored(self):
+        self._store()
+        self.assertEqual(_EVENTS, self._load())
+        self.assertEqual(_EVENTS, self._load(self._cache(
+            'UltiSnipsFileSource')))
+
+    def test_hash_is_stored(self):
+        self._store()
+        self.assertEqual(
+            (hash_file(self.filename), _EVENTS),
+            self.cache.load(self.filename, file_stamp(self.filename)))
+
+    def test_old_file_is_not_hashed(self):
+        self._make_old()
+        self._store()
+        real_hash_file = _cache.hash_file
+        _cache.hash_file = None
+        try:
+            self.assertEqual(_EVENTS, self._load())
+        finally:
+            _cache.hash_file = real_hash_file
+
+    def test_old_file_changed_with_same_stamp_is_not_detected(self):
+        self._make_old()
+        self._store()
+        self._write_keeping_stamp('CONTENT')
+        self.assertEqual(_EVENTS, self._load())
+
+    def test_racy_file_changed_with_same_stamp(self):
+        self._store()
+        self._write_keeping_stamp('CONTENT')
+        self.assertEqual(None, self._load())
+
+    def test_racy_file_without_hash(self):
+        self._store(digest=None)
+        self.assertEqual(None, self._load())
+
+    def test_one_entry_per_file(self):
+        self._store()
+        self._store()
+        self.assertEqual(1, len(self._entries()))
+
+    def test_keyed_by_kind(self):
+        self._store()
+        self.assertEqual(None, self._load(self._cache(
+            'SnipMateFileSource')))
+
+    def test_changed_file(self):
+        self._store()
+        self._write('changed content')
+        self.assertEqual(None, self._load())
+
+    def test_touched_file(self):
+        self._store()
+        mtime = os.stat(self.filename).st_mtime + 10
+        os.utime(self.filename, (mtime, mtime))
+        self.assertEqual(None, self._load())
+
+    def test_removed_file(self):
+        self._store()
+        os.remove(self.filename)
+        self.assertEqual(None, self._load())
+
+    def test_truncated_entry(self):
+        self._store()
+        for entry in self._entries():
+            with open(entry, 'rb+') as entry_file:
+                entry_file.truncate(os.path.getsize(entry) // 2)
+        self.assertEqual(None, self._load())
+
+    def test_corrupt_entry(self):
+        self._store()
+        for entry in self._entries():
+            with open(entry, 'wb') as entry_file:
+                entry_file.write(b'This is not a pickle.')
+        self.assertEqual(None, self._load())
+
+    def test_corrupt_entry_is_replaced(self):
+        self.test_corrupt_entry()
+        self._store()
+        self.assertEqual(_EVENTS, self._load())
+
+    def test_disabled(self):
+        self.cache._directory = ''
+        self._store()
+        self.assertEqual(None, self._load())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'cache')))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from UltiSnips.snippet.source.file import _common
+from UltiSnips.snippet.source.file._common import changed_files, \
+    SnippetFileChanged
+from UltiSnips.snippet.source.file.snipmate import \
+    _parse_snippets_file as parse_snipmate
+from UltiSnips.snippet.source.file.ultisnips import \
+    _parse_snippets_file as parse_ultisnips
+
+_ULTISNIPS = """snippet a "first snippet" b
+first
+endsnippet
+
+context "True"
+snippet b "second snippet" e
+second
+endsnippet
+
+snippet c "third snippet" "True" e
+third
+endsnippet
+
+snippet d
+fourth
+endsnippet
+"""
+
+_SNIPMATE = """snippet a first snippet
+\tfirst
+snippet b
+\tsecond
+\tlines
+"""
+
+
+class _FileTest(object):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'all.snippets')
+        self._write(self.content)
+        self._make_old()
+        _common._recent_files.clear()
+        changed_files.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        _common._recent_files.clear()
+        changed_files.clear()
+
+    def _write(self, content):
+        with open(self.filename, 'w') as snippet_file:
+            snippet_file.write(content)
+
+    def _make_old(self):
+        mtime = time.time() - 10
+        os.utime(self.filename, (mtime, mtime))
+
+    def _snippets(self):
+        return dict((data[0].trigger, data[0]) for event, data in
+                    self.parse(self.content, self.filename)
+                    if event == 'snippet')
+
+    def _write_keeping_stamp(self, content):
+        stat = os.stat(self.filename)
+        self.assertEqual(len(self.content), len(content))
+        self._write(content)
+        if hasattr(stat, 'st_mtime_ns'):
+            os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        else:
+            os.utime(self.filename, (stat.st_atime, stat.st_mtime))
+
+
+class TestUltiSnipsFile(_FileTest, unittest.TestCase):
+    content = _ULTISNIPS
+    parse = staticmethod(parse_ultisnips)
+
+    def test_values(self):
+        snippets = self._snippets()
+        self.assertEqual('first', snippets['a'].value)
+        self.assertEqual('second', snippets['b'].value)
+        self.assertEqual('third', snippets['c'].value)
+        self.assertEqual('fourth', snippets['d'].value)
+
+    def test_descriptions(self):
+        snippets = self._snippets()
+        self.assertEqual('(a) "first snippet"', snippets['a'].description)
+        self.assertEqual('(b) "second snippet"', snippets['b'].description)
+        self.assertEqual('(c) "third snippet"', snippets['c'].description)
+        self.assertEqual('(d)', snippets['d'].description)
+
+    def test_nothing_is_read_while_parsing(self):
+        snippets = self._snippets()
+        self.assertEqual({}, dict(_common._recent_files))
+        for snippet in snippets.values():
+            self.assertTrue(isinstance(snippet._value, _common.SnippetBody))
+        self.assertTrue(isinstance(snippets['a']._description,
+                                   _common.SnippetDescription))
+
+    def test_file_is_read_once(self):
+        snippets = self._snippets()
+        reads = []
+        real_open = _common.open_ascii_file
+
+        def _open(filename, mode):
+            reads.append(filename)
+            return real_open(filename, mode)
+        _common.open_ascii_file = _open
+        try:
+            for snippet in snippets.values():
+                snippet.description
+                snippet.value
+        finally:
+            _common.open_ascii_file = real_open
+        self.assertEqual([self.filename], reads)
+
+    def test_changed_with_same_stamp(self):
+        snippets = self._snippets()
+        self._write_keeping_stamp(self.content.replace('second', 'SECOND'))
+        self.assertRaises(SnippetFileChanged, lambda: snippets['b'].value)
+        self.assertEqual(set([self.filename]), changed_files)
+
+    def test_changed_description_with_same_stamp(self):
+        snippets = self._snippets()
+        self._write_keeping_stamp(self.content.replace('first s', 'FIRST s'))
+        self.assertRaises(SnippetFileChanged,
+                          lambda: snippets['a'].description)
+
+    def test_other_snippets_changed(self):
+        snippets = self._snippets()
+        self._write(self.content.replace('fourth', 'FOURTH'))
+        self.assertEqual('first', snippets['a'].value)
+        self.assertEqual(set(), changed_files)
+
+    def test_lines_inserted_before(self):
+        snippets = self._snippets()
+        self._write('\n' + self.content)
+        self.assertRaises(SnippetFileChanged, lambda: snippets['a'].value)
+
+    def test_removed(self):
+        snippets = self._snippets()
+        os.remove(self.filename)
+        self.assertRaises(SnippetFileChanged, lambda: snippets['a'].value)
+        self.assertEqual(set([self.filename]), changed_files)
+
+    def test_racy_file_is_read_again(self):
+        snippets = self._snippets()
+        snippets['a'].value
+        self._write(self.content)
+        self._write_keeping_stamp(self.content.replace('second', 'SECOND'))
+        self.assertRaises(SnippetFileChanged, lambda: snippets['b'].value)
+
+
+class TestSnipMateFile(_FileTest, unittest.TestCase):
+    content = _SNIPMATE
+    parse = staticmethod(parse_snipmate)
+
+    def test_values(self):
+        snippets = self._snippets()
+        self.assertEqual('first', snippets['a'].value)
+        self.assertEqual('second\nlines', snippets['b'].value)
+
+    def test_descriptions(self):
+        snippets = self._snippets()
+        self.assertEqual('(a) first snippet', snippets['a'].description)
+        self.assertEqual('(b)', snippets['b'].description)
+
+    def test_changed_with_same_stamp(self):
+        snippets = self._snippets()
+        self._write_keeping_stamp(self.content.replace('lines', 'LINES'))
+        self.assertRaises(SnippetFileChanged, lambda: snippets['b'].value)
+        self.assertEqual('first', snippets['a'].value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import _directory_index
+from _directory_index import SnippetDirectoryIndex
+
+
+class _BaseIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = SnippetDirectoryIndex()
+        self.scans = 0
+        self.real_scan_directory = _directory_index._scan_directory
+
+        def count_scans(directory):
+            self.scans += 1
+            return self.real_scan_directory(directory)
+        _directory_index._scan_directory = count_scans
+
+    def tearDown(self):
+        _directory_index._scan_directory = self.real_scan_directory
+        shutil.rmtree(self.directory)
+
+    def create(self, *names):
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith('/'):
+                os.makedirs(path)
+            else:
+                with open(path, 'w'):
+                    pass
+
+    def set_age(self, seconds, name=''):
+        """Sets the mtime of 'name' to 'seconds' ago."""
+        mtime = int(time.time()) - seconds
+        os.utime(os.path.join(self.directory, name), (mtime, mtime))
+
+    def path(self, *names):
+        return set(os.path.join(self.directory, name) for name in names)
+
+
+class TestListing(_BaseIndex):
+
+    def test_entries(self):
+        self.create('a.snippets', 'b/', '.hidden')
+        self.assertEqual({'a.snippets': False, 'b': True},
+                         self.index.listing(self.directory))
+
+    def test_missing_directory(self):
+        missing = os.path.join(self.directory, 'missing')
+        self.assertEqual({}, self.index.listing(missing))
+
+    def test_old_listing_is_reused(self):
+        self.create('a.snippets')
+        self.set_age(10)
+        self.index.listing(self.directory)
+        self.index.listing(self.directory)
+        self.assertEqual(1, self.scans)
+
+    def test_changed_directory_is_listed_again(self):
+        self.create('a.snippets')
+        self.set_age(10)
+        self.index.listing(self.directory)
+        self.create('b.snippets')
+        self.set_age(5)
+        self.assertIn('b.snippets', self.index.listing(self.directory))
+        self.assertEqual(2, self.scans)
+
+    def test_recent_listing_is_not_reused(self):
+        # A file created in the same mtime tick as the listing would go
+        # unnoticed, so directories changed just now are always listed.
+        self.create('a.snippets')
+        self.set_age(0)
+        self.index.listing(self.directory)
+        self.create('b.snippets')
+        self.set_age(0)
+        self.assertIn('b.snippets', self.index.listing(self.directory))
+        self.assertEqual(2, self.scans)
+
+    def test_removed_directory(self):
+        self.create('ft/', 'ft/a.snippets')
+        self.set_age(10, 'ft')
+        ft_dir = os.path.join(self.directory, 'ft')
+        self.index.listing(ft_dir)
+        shutil.rmtree(ft_dir)
+        self.assertEqual({}, self.index.listing(ft_dir))
+
+
+class TestSearchPath(_BaseIndex):
+
+    def test_computed_once_per_key(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return ['dir']
+        self.assertEqual(['dir'], self.index.search_path('a', 1, compute))
+        self.assertEqual(['dir'], self.index.search_path('a', 1, compute))
+        self.assertEqual(1, len(calls))
+        self.index.search_path('a', 2, compute)
+        self.index.search_path('b', 2, compute)
+        self.assertEqual(3, len(calls))
+
+
+class TestUltiSnipsFiles(_BaseIndex):
+
+    def test_files(self):
+        self.create('all.snippets', 'all_more.snippets', 'allx.snippets',
+                    'all_.snippets', 'python.snippets', 'all/',
+                    'all/a.snippets', 'all/b')
+        self.assertEqual(
+            self.path('all.snippets', 'all_more.snippets', 'all_.snippets',
+                      'all/a.snippets', 'all/b'),
+            self.index.ultisnips_files_for('all', self.directory))
+
+
+class TestSnipMateFiles(_BaseIndex):
+
+    def test_files(self):
+        self.create('c.snippets', 'c_more.snippets', 'c/', 'c/a.snippets',
+                    'c/for.snippet', 'c/other', 'c/while/',
+                    'c/while/1.snippet', 'c/while/2.txt')
+        self.assertEqual(
+            self.path('c.snippets', 'c/a.snippets', 'c/for.snippet',
+                      'c/while/1.snippet'),
+            self.index.snipmate_files_for('c', self.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
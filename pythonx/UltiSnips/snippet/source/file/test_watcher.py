@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from _watcher import InotifyWatcher
+
+
+class TestInotifyWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.changes = []
+        self.changed = threading.Event()
+        self.watcher = InotifyWatcher.create(self._on_change)
+        if self.watcher is None:
+            self.skipTest('inotify is not available.')
+
+    def tearDown(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        shutil.rmtree(self.directory)
+
+    def _on_change(self, directory, name):
+        self.changes.append((directory, name))
+        self.changed.set()
+
+    def _wait_for(self, change):
+        while change not in self.changes:
+            self.changed.clear()
+            if not self.changed.wait(5):
+                self.fail('%r was not reported, got %r.' %
+                          (change, self.changes))
+
+    def test_file_created(self):
+        self.assertTrue(self.watcher.watch(self.directory))
+        with open(os.path.join(self.directory, 'all.snippets'), 'w'):
+            pass
+        self._wait_for((self.directory, 'all.snippets'))
+
+    def test_file_touched(self):
+        path = os.path.join(self.directory, 'all.snippets')
+        with open(path, 'w'):
+            pass
+        self.assertTrue(self.watcher.watch(self.directory))
+        os.utime(path, (0, 0))
+        self._wait_for((self.directory, 'all.snippets'))
+
+    def test_directory_removed(self):
+        watched = os.path.join(self.directory, 'us')
+        os.mkdir(watched)
+        self.assertTrue(self.watcher.watch(watched))
+        os.rmdir(watched)
+        self._wait_for((watched, None))
+
+    def test_missing_directory(self):
+        self.assertFalse(
+            self.watcher.watch(os.path.join(self.directory, 'missing')))
+
+    def test_watched_twice(self):
+        self.assertTrue(self.watcher.watch(self.directory))
+        self.assertTrue(self.watcher.watch(self.directory))
+
+    def test_stopped(self):
+        self.watcher.stop()
+        self.assertFalse(self.watcher.watch(self.directory))
+        self.watcher = None
+
+
+if __name__ == '__main__':
+    unittest.main()
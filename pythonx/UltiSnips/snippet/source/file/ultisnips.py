@@ -9,9 +9,12 @@ import os
 
 from UltiSnips import _vim
 from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
-from UltiSnips.snippet.source.file._base import SnippetFileSource
+from UltiSnips.snippet.source.file._base import SnippetFileSource, \
+    watchable_directories
+from UltiSnips.snippet.source.file._directory_index import directory_index
 from UltiSnips.snippet.source.file._common import handle_extends, \
-    handle_action, handle_context
+    handle_action, handle_context, line_checksum, SnippetBody, \
+    SnippetDescription, SnippetFile
 from UltiSnips.text import LineIterator, head_tail
 
 
@@ -26,19 +29,30 @@ def find_snippet_files(ft, directory):
     return ret
 
 
-def find_all_snippet_files(ft):
-    """Returns all snippet files matching 'ft' in the given runtime path
-    directory."""
+def _get_snippet_directories_setting():
+    """Returns the value of (b|g):UltiSnipsSnippetDirectories."""
     if _vim.eval("exists('b:UltiSnipsSnippetDirectories')") == '1':
-        snippet_dirs = _vim.eval('b:UltiSnipsSnippetDirectories')
-    else:
-        snippet_dirs = _vim.eval('g:UltiSnipsSnippetDirectories')
+        return _vim.eval('b:UltiSnipsSnippetDirectories')
+    return _vim.eval('g:UltiSnipsSnippetDirectories')
+
+
+def find_all_snippet_directories():
+    """Returns all directories in the runtime path that can contain snippet
+    files."""
+    snippet_dirs = _get_snippet_directories_setting()
     if len(snippet_dirs) == 1 and os.path.isabs(snippet_dirs[0]):
-        check_dirs = ['']
+        runtimepath = ''
     else:
-        check_dirs = _vim.eval('&runtimepath').split(',')
-    patterns = ['%s.snippets', '%s_*.snippets', os.path.join('%s', '*')]
-    ret = set()
+        runtimepath = _vim.eval('&runtimepath')
+    return directory_index.search_path(
+        'ultisnips', (runtimepath, tuple(snippet_dirs)),
+        lambda: _resolve_snippet_directories(runtimepath, snippet_dirs))
+
+
+def _resolve_snippet_directories(runtimepath, snippet_dirs):
+    """Returns the real paths of all 'snippet_dirs' in 'runtimepath'."""
+    check_dirs = runtimepath.split(',')
+    all_dirs = []
     for rtp in check_dirs:
         for snippet_dir in snippet_dirs:
             if snippet_dir == 'snippets':
@@ -48,17 +62,23 @@ def find_all_snippet_files(ft):
                     'directory for UltiSnips snippets.')
             pth = os.path.realpath(os.path.expanduser(
                 os.path.join(rtp, snippet_dir)))
-            for pattern in patterns:
-                for fn in glob.glob(os.path.join(pth, pattern % ft)):
-                    ret.add(fn)
+            all_dirs.append(pth)
+    return all_dirs
+
+
+def find_all_snippet_files(ft):
+    """Returns all snippet files matching 'ft' in the given runtime path
+    directory."""
+    ret = set()
+    for pth in find_all_snippet_directories():
+        ret.update(directory_index.ultisnips_files_for(ft, pth))
     return ret
 
 
-def _handle_snippet_or_global(
-    filename, line, lines, python_globals, priority, pre_expand, context
-):
-    """Parses the snippet that begins at the current line."""
-    start_line_index = lines.line_index
+def _split_header(line, context):
+    """Splits the header 'line' of a snippet or global into its type, trigger,
+    description, options and context. 'context' is the context given in a
+    'context' line before the snippet, if any."""
     descr = ''
     opts = ''
 
@@ -88,33 +108,66 @@ def _handle_snippet_or_global(
             descr, remain = remain[left:], remain[:left]
 
     # The rest is the trigger
-    trig = remain.strip()
+    return snip, remain.strip(), descr, opts, context
+
+
+def _description(header):
+    """Returns the description in the 'header' line of a snippet."""
+    return _split_header(header, None)[2]
+
+
+def _description_after_context(header):
+    """Returns the description in the 'header' line of a snippet whose
+    context was given in a 'context' line."""
+    return _split_header(header, True)[2]
+
+
+def _handle_snippet_or_global(
+    snippet_file, line, lines, python_globals, priority, pre_expand, context
+):
+    """Parses the snippet that begins at the current line."""
+    filename = snippet_file.filename
+    start_line_index = lines.line_index
+    context_given = bool(context)
+    snip, trig, descr, opts, context = _split_header(line, context)
+
     if len(trig.split()) > 1 or 'r' in opts:
         if trig[0] != trig[-1]:
             return 'error', ("Invalid multiword trigger: '%s'" % trig,
                              lines.line_index)
         trig = trig[1:-1]
     end = 'end' + snip
-    content = ''
+    content_lines = []
+    checksum = line_checksum(line)
 
     found_end = False
     for line in lines:
         if line.rstrip() == end:
-            content = content[:-1]  # Chomp the last newline
             found_end = True
             break
-        content += line
+        # Only globals are needed right away, snippet bodies are read from
+        # the file when they are expanded.
+        if snip == 'global':
+            content_lines.append(line)
+        else:
+            checksum = line_checksum(line, checksum)
 
     if not found_end:
         return 'error', ("Missing 'endsnippet' for %r" %
                          trig, lines.line_index)
 
     if snip == 'global':
-        python_globals[trig].append(content)
+        # Chomp the last newline
+        python_globals[trig].append(''.join(content_lines)[:-1])
     elif snip == 'snippet':
+        body = SnippetBody(snippet_file, start_line_index,
+                           lines.line_index - 1, checksum)
+        if descr:
+            descr = SnippetDescription(
+                body, _description_after_context if context_given
+                else _description)
         definition = UltiSnipsSnippetDefinition(
-            priority, trig, content,
-            descr, opts, python_globals,
+            priority, trig, body, descr, opts, python_globals,
             '%s:%i' % (filename, start_line_index),
             context, pre_expand)
         return 'snippet', (definition,)
@@ -130,6 +183,7 @@ def _parse_snippets_file(data, filename):
     """
 
     python_globals = defaultdict(list)
+    snippet_file = SnippetFile(filename)
     lines = LineIterator(data)
     current_priority = 0
     actions = {}
@@ -141,7 +195,7 @@ def _parse_snippets_file(data, filename):
         head, tail = head_tail(line)
         if head in ('snippet', 'global'):
             snippet = _handle_snippet_or_global(
-                filename, line, lines,
+                snippet_file, line, lines,
                 python_globals,
                 current_priority,
                 actions,
@@ -182,6 +236,18 @@ class UltiSnipsFileSource(SnippetFileSource):
     def _get_all_snippet_files_for(self, ft):
         return find_all_snippet_files(ft)
 
+    def _get_search_path_key(self):
+        return (_vim.eval('&runtimepath'),
+                tuple(_get_snippet_directories_setting()))
+
+    def _get_watch_directories_for(self, ft):
+        directories = set()
+        for pth in find_all_snippet_directories():
+            directories.update(watchable_directories(pth, ft))
+            directories.update(
+                watchable_directories(os.path.join(pth, ft), ''))
+        return directories
+
     def _parse_snippet_file(self, filedata, filename):
         for event, data in _parse_snippets_file(filedata, filename):
             yield event, data
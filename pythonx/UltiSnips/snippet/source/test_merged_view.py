@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import unittest
+
+from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
+from UltiSnips.snippet.source._base import SnippetSource
+
+from _merged_view import MergedSnippetView
+
+
+def _snippet(trigger, priority=0, options='', context=None):
+    return UltiSnipsSnippetDefinition(
+        priority, trigger, 'body', '', options, {}, 'test:1', context, {})
+
+
+class _Source(SnippetSource):
+
+    cache_lookups = True
+
+    def __init__(self):
+        SnippetSource.__init__(self)
+
+    def add(self, ft, snippet):
+        self._snippets[ft].add_snippet(snippet)
+        self._generation += 1
+        return snippet
+
+    def clear(self, ft, priority, *triggers):
+        self._snippets[ft].clear_snippets(priority, list(triggers))
+
+
+class TestMergedSnippetView(unittest.TestCase):
+
+    def setUp(self):
+        self.first = _Source()
+        self.second = _Source()
+        self.sources = [self.first, self.second]
+
+    def matching(self, before, filetypes=('all',)):
+        view = MergedSnippetView(self.sources, list(filetypes))
+        return view.get_matching_snippets(before, False, False, None)
+
+    def test_order_of_sources(self):
+        second = self.second.add('all', _snippet('t'))
+        first = self.first.add('all', _snippet('t'))
+        self.assertEqual([first, second], self.matching('t'))
+
+    def test_parents(self):
+        for source in self.sources:
+            source.update_extends('python', ['all'])
+        python = self.first.add('python', _snippet('t'))
+        all_ = self.second.add('all', _snippet('t'))
+        self.assertEqual(set([python, all_]),
+                         set(self.matching('t', ['python'])))
+        self.assertEqual([all_], self.matching('t'))
+
+    def test_cleared_trigger_in_other_source(self):
+        self.first.add('all', _snippet('t', 1))
+        high = self.first.add('all', _snippet('t', 3))
+        self.first.add('all', _snippet('u', 0))
+        self.second.clear('all', 2, 't', 'u')
+        self.assertEqual([high], self.matching('t'))
+        self.assertEqual([], self.matching('u'))
+
+    def test_highest_clear_priority_wins(self):
+        self.first.add('all', _snippet('t', 1))
+        self.first.clear('all', 0, 't')
+        self.second.clear('all', 1, 't')
+        self.assertEqual([], self.matching('t'))
+
+    def test_clear_all(self):
+        self.first.add('all', _snippet('t', -1))
+        kept = self.second.add('all', _snippet('u', 1))
+        self.second.clear('all', 0)
+        self.assertEqual([], self.matching('t'))
+        self.assertEqual([kept], self.matching('u'))
+
+    def test_clear_in_parent(self):
+        self.first.update_extends('python', ['all'])
+        self.first.add('python', _snippet('t'))
+        self.first.clear('all', 0, 't')
+        self.assertEqual([], self.matching('t', ['python']))
+
+    def test_cleared_are_reported(self):
+        self.first.clear('all', 2, 't')
+        self.second.clear('all', 1)
+        view = MergedSnippetView(self.sources, ['all'])
+        self.assertEqual(1, view.get_clear_priority(['all']))
+        self.assertEqual({'t': 2}, view.get_cleared(['all']))
+
+    def test_outranked_are_dropped(self):
+        self.first.add('all', _snippet('t', 0))
+        high = self.second.add('all', _snippet('t', 1))
+        view = MergedSnippetView(self.sources, ['all'])
+        self.assertEqual([high], list(view._snippets))
+        self.assertTrue(view.resolved)
+
+    def test_outranked_with_other_options_are_kept(self):
+        low = self.first.add('all', _snippet('t', 0))
+        high = self.second.add('all', _snippet('t', 1, 'b'))
+        view = MergedSnippetView(self.sources, ['all'])
+        self.assertEqual([low, high], list(view._snippets))
+        self.assertFalse(view.resolved)
+        self.assertEqual([low], self.matching('x t'))
+
+    def test_outranking_context_snippets_keep_others(self):
+        low = self.first.add('all', _snippet('t', 0))
+        high = self.second.add('all', _snippet('t', 1, 'e', 'False'))
+        view = MergedSnippetView(self.sources, ['all'])
+        self.assertEqual([low, high], list(view._snippets))
+        self.assertFalse(view.resolved)
+
+    def test_has_context_snippets(self):
+        self.first.add('all', _snippet('t'))
+        self.assertFalse(
+            MergedSnippetView(self.sources, ['all']).has_context_snippets)
+        self.second.add('all', _snippet('u', 0, 'e', 'True'))
+        self.assertTrue(
+            MergedSnippetView(self.sources, ['all']).has_context_snippets)
+
+    def test_cleared_context_snippets_are_not_counted(self):
+        self.first.add('all', _snippet('t', 0, 'e', 'True'))
+        self.second.clear('all', 0, 't')
+        self.assertFalse(
+            MergedSnippetView(self.sources, ['all']).has_context_snippets)
+
+    def test_generations(self):
+        self.first.add('all', _snippet('t'))
+        view = MergedSnippetView(self.sources, ['all'])
+        self.assertEqual((1, 0), view.generations)
+
+
+if __name__ == '__main__':
+    unittest.main()
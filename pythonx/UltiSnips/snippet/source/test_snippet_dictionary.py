@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import unittest
+
+from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
+
+import _snippet_dictionary
+from _snippet_dictionary import SnippetDictionary, _RegexTriggers
+
+
+def _snippet(trigger, options=''):
+    return UltiSnipsSnippetDefinition(
+        0, trigger, 'body', '', options, {}, 'test:1', None, {})
+
+
+# Triggers of all kinds, the indexes must find the same snippets as checking
+# every one of them.
+_SNIPPETS = [
+    ('for', ''), ('fo', ''), ('for', 'b'), ('if else', ''), ('else', 'A'),
+    ('x', 'A'), ('ing', 'i'), ('ing', 'iA'), ('a b c', ''), (' ', ''),
+    (r'\d+x', 'r'), (r'(a|b)c$', 'r'), (r'k(.)\1', 'r'), (r'(?i)up', 'r'),
+    (r'[0-9]z', 'rA'), (r'.*q?', 'rA'), (r'(?P<name>n)m', 'rA'),
+    (r'(a|bb)+', 'rA'), (r'[^y]', 'rA'), (r'ab\b', 'rA'),
+]
+
+_BEFORES = [
+    '', ' ', 'f', 'fo', 'for', '  for', 'x for', 'xfor', 'if else', 'else',
+    'if', 'if ', 'ing', 'sing', 'a b c', 'b c', 'a b', '12x', 'x12x', 'ac',
+    'bc', 'bc ', 'kaa', 'kab', 'UP', 'up', 'foo bar ', '7z', 'zz', 'q',
+    'nm', 'aabb', 'bbb', 'y', 'ab', 'ab ', 'x', 'x ',
+]
+
+
+class TestMatchesLikeLinearSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.snippets = [_snippet(trigger, options)
+                         for trigger, options in _SNIPPETS]
+        self.dictionary = SnippetDictionary()
+        for snippet in self.snippets:
+            self.dictionary.add_snippet(snippet)
+
+    def _check(self, potentially, autotrigger_only):
+        for before in _BEFORES:
+            if potentially:
+                wanted = [s for s in self.snippets if s.could_match(before)]
+            else:
+                wanted = [s for s in self.snippets if s.matches(before)]
+            if autotrigger_only:
+                wanted = [s for s in wanted if s.has_option('A')]
+            self.assertEqual(
+                wanted, self.dictionary.get_matching_snippets(
+                    before, potentially, autotrigger_only, None),
+                'for %r' % before)
+
+    def test_matches(self):
+        self._check(False, False)
+
+    def test_could_match(self):
+        self._check(True, False)
+
+    def test_autotrigger_matches(self):
+        self._check(False, True)
+
+    def test_autotrigger_could_match(self):
+        self._check(True, True)
+
+    def test_added_after_lookup(self):
+        self.dictionary.get_matching_snippets('12x', False, False, None)
+        snippet = _snippet(r'2x', 'r')
+        self.snippets.append(snippet)
+        self.dictionary.add_snippet(snippet)
+        self._check(False, False)
+
+
+class TestRegexTriggers(unittest.TestCase):
+
+    def _triggers(self, triggers):
+        entries = list(enumerate(_snippet(t, 'r') for t in triggers))
+        return entries, _RegexTriggers(entries)
+
+    def test_candidates(self):
+        entries, regex_triggers = self._triggers(
+            [r'a(b)', r'\d+', r'c$', r'x'])
+        self.assertEqual(set([entries[0]]),
+                         set(regex_triggers.candidates('zab')))
+        self.assertEqual(set([entries[1], entries[2]]),
+                         set(regex_triggers.candidates('1c') +
+                             regex_triggers.candidates('12')))
+
+    def test_past_the_group_limit(self):
+        count = 3 * _snippet_dictionary._MAX_GROUPS
+        entries, regex_triggers = self._triggers(
+            [r'(t)(%i)' % i for i in range(count)])
+        self.assertTrue(len(regex_triggers._regexes) > 3)
+        self.assertEqual([], regex_triggers._uncombined)
+        for i in range(count):
+            self.assertEqual([entries[i]],
+                             regex_triggers.candidates('at%i' % i))
+
+    def test_search_starts_in_tail(self):
+        entries, regex_triggers = self._triggers([r'ab', r'x{1,3}'])
+        self.assertEqual([3], [width for _, width in regex_triggers._regexes])
+        self.assertEqual([entries[1]],
+                         regex_triggers.candidates('ab' * 1000 + 'xx'))
+        self.assertEqual([entries[0]],
+                         regex_triggers.candidates('x' * 1000 + 'ab'))
+
+    def test_text_before_tail_is_seen(self):
+        entries, regex_triggers = self._triggers(
+            [r'(?<=y)ab', r'^ab', r'\bab'])
+        self.assertEqual([], regex_triggers.candidates('xyzab'))
+        self.assertEqual([entries[0]], regex_triggers.candidates('xyab'))
+        self.assertEqual(set([entries[1], entries[2]]),
+                         set(regex_triggers.candidates('ab')))
+
+    def test_unbounded_triggers(self):
+        entries, regex_triggers = self._triggers(
+            [r'a.*b', r'c', r'd' * (_snippet_dictionary._MAX_TAIL + 1)])
+        self.assertEqual([1, None],
+                         [width for _, width in regex_triggers._regexes])
+        self.assertEqual([entries[0]],
+                         regex_triggers.candidates('a' + 'x' * 1000 + 'b'))
+        self.assertEqual([entries[2]], regex_triggers.candidates(
+            'd' * (_snippet_dictionary._MAX_TAIL + 1)))
+
+    def test_uncombinable_triggers(self):
+        triggers = [r'(a)\1', r'(?i)up', r'(?P<x>a)', r'(?(1)a|b)', r'(x']
+        entries, regex_triggers = self._triggers(triggers + [r'z'])
+        self.assertEqual(entries[:len(triggers)], regex_triggers._uncombined)
+        # Those are always candidates, the snippets decide.
+        self.assertEqual(entries, sorted(regex_triggers.candidates('z')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,7 @@
 
 """Contains the SnippetManager facade used by all Vim Functions."""
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from functools import wraps
 import os
 import platform
@@ -15,17 +15,25 @@ from contextlib import contextmanager
 
 from UltiSnips import _vim
 from UltiSnips import err_to_scratch_buffer
-from UltiSnips._diff import diff, guess_edit
+from UltiSnips._diff import diff, edit_stats, guess_edit
 from UltiSnips.compatibility import as_unicode
 from UltiSnips.position import Position
 from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
+from UltiSnips.snippet.definition._base import context_cache_stats
 from UltiSnips.snippet.source import UltiSnipsFileSource, SnipMateFileSource, \
-    find_all_snippet_files, find_snippet_files, AddedSnippetsSource
+    find_all_snippet_files, find_snippet_files, AddedSnippetsSource, \
+    SnippetPreloader, MergedSnippetView, is_cleared, merge_cleared, \
+    SnippetFileChanged
 from UltiSnips.text import escape
+from UltiSnips.text_objects._watchdog import slow_interpolations
 from UltiSnips.vim_state import VimState, VisualContentPreserver
 from UltiSnips.buffer_proxy import use_proxy_buffer, suspend_proxy_edits
 
 
+# How many results of _snips() are remembered.
+_SNIPS_CACHE_SIZE = 32
+
+
 def _ask_user(a, formatted):
     """Asks the user using inputlist() and returns the selected element or
     None."""
@@ -77,6 +85,10 @@ class SnippetManager(object):
         self._visual_content = VisualContentPreserver()
 
         self._snippet_sources = []
+        self._preloader = SnippetPreloader()
+        self._snips_cache = OrderedDict()
+        # tuple of filetypes -> MergedSnippetView
+        self._merged_views = {}
 
         self._snip_expanded_in_action = False
         self._inside_action = False
@@ -205,6 +217,10 @@ class SnippetManager(object):
         if not snippet:
             return True
 
+        snippet = self._read_body(snippet, before, True)
+        if snippet is None:
+            self._handle_failure(self.backward_trigger)
+            return True
         self._do_snippet(snippet, before)
 
         return True
@@ -234,6 +250,55 @@ class SnippetManager(object):
         else:
             return False
 
+    @err_to_scratch_buffer.wrap
+    def preload(self, filetype):
+        """Starts loading the snippets for the dotted 'filetype' in the
+        background."""
+        filetypes = [ft.strip() for ft in filetype.split('.') if ft.strip()]
+        self._preloader.schedule(
+            [source for _, source in self._snippet_sources],
+            filetypes + ['all'])
+
+    @err_to_scratch_buffer.wrap
+    def preload_step(self):
+        """Does one slice of the background loading."""
+        self._preloader.run_slice()
+
+    @err_to_scratch_buffer.wrap
+    def preload_status(self):
+        """Fills g:current_ulti_preload_status with the state of the
+        background loading per filetype."""
+        for ft, state in self._preloader.status().items():
+            _vim.command(as_unicode(
+                "let g:current_ulti_preload_status['{ft}'] = '{state}'").format(
+                    ft=ft.replace("'", "''"), state=state))
+
+    @err_to_scratch_buffer.wrap
+    def context_cache_stats(self):
+        """Fills g:current_ulti_context_cache_stats with the number of hits
+        and misses of the cached context results."""
+        for name, count in context_cache_stats.items():
+            _vim.command("let g:current_ulti_context_cache_stats['%s'] = %i" %
+                         (name, count))
+
+    @err_to_scratch_buffer.wrap
+    def interpolation_stats(self):
+        """Fills g:current_ulti_interpolation_stats with the interpolations
+        that made their snippets exceed the time budget."""
+        for location, stats in slow_interpolations.items():
+            _vim.command(as_unicode(
+                "let g:current_ulti_interpolation_stats['{location}'] = "
+                "{{'count': {count}, 'seconds': {seconds:f}}}").format(
+                    location=location.replace("'", "''"), **stats))
+
+    @err_to_scratch_buffer.wrap
+    def edit_stats(self):
+        """Fills g:current_ulti_edit_stats with the number of edits inside
+        snippets that were guessed and that needed a full diff."""
+        for name, count in edit_stats.items():
+            _vim.command("let g:current_ulti_edit_stats['%s'] = %i" %
+                         (name, count))
+
     def register_snippet_source(self, name, snippet_source):
         """Registers a new 'snippet_source' with the given 'name'.
 
@@ -242,6 +307,8 @@ class SnippetManager(object):
 
         """
         self._snippet_sources.append((name, snippet_source))
+        self._snips_cache.clear()
+        self._merged_views.clear()
 
     def unregister_snippet_source(self, name):
         """Unregister the source with the given 'name'.
@@ -253,11 +320,19 @@ class SnippetManager(object):
             if name == source_name:
                 self._snippet_sources = self._snippet_sources[:index] + \
                     self._snippet_sources[index + 1:]
+                self._snips_cache.clear()
+                self._merged_views.clear()
                 break
 
-    def get_buffer_filetypes(self):
+    def get_buffer_filetypes(self, filetype=None):
+        """Returns the filetypes of the current buffer. 'filetype' is the
+        value of &filetype if it was already fetched."""
+        if filetype is None:
+            filetypes = _vim.buf.filetypes
+        else:
+            filetypes = _vim.split_filetypes(filetype)
         return (self._added_buffer_filetypes[_vim.buf.number] +
-                _vim.buf.filetypes + ['all'])
+                filetypes + ['all'])
 
     def add_buffer_filetypes(self, ft):
         buf_fts = self._added_buffer_filetypes[_vim.buf.number]
@@ -288,60 +363,126 @@ class SnippetManager(object):
             self._ignore_movements = False
             return
 
-        if self._csnippets:
-            cstart = self._csnippets[0].start.line
-            cend = self._csnippets[0].end.line + \
-                self._vstate.diff_in_buffer_length
-            ct = _vim.buf[cstart:cend + 1]
-            lt = self._vstate.remembered_buffer
-            pos = _vim.buf.cursor
-
-            lt_span = [0, len(lt)]
-            ct_span = [0, len(ct)]
-            initial_line = cstart
-
-            # Cut down on lines searched for changes. Start from behind and
-            # remove all equal lines. Then do the same from the front.
-            if lt and ct:
-                while (lt[lt_span[1] - 1] == ct[ct_span[1] - 1] and
-                        self._vstate.ppos.line < initial_line + lt_span[1] - 1 and
-                        pos.line < initial_line + ct_span[1] - 1 and
-                        (lt_span[0] < lt_span[1]) and
-                        (ct_span[0] < ct_span[1])):
-                    ct_span[1] -= 1
-                    lt_span[1] -= 1
-                while (lt_span[0] < lt_span[1] and
-                       ct_span[0] < ct_span[1] and
-                       lt[lt_span[0]] == ct[ct_span[0]] and
-                       self._vstate.ppos.line >= initial_line and
-                       pos.line >= initial_line):
-                    ct_span[0] += 1
-                    lt_span[0] += 1
-                    initial_line += 1
-            ct_span[0] = max(0, ct_span[0] - 1)
-            lt_span[0] = max(0, lt_span[0] - 1)
-            initial_line = max(cstart, initial_line - 1)
-
-            lt = lt[lt_span[0]:lt_span[1]]
-            ct = ct[ct_span[0]:ct_span[1]]
+        if self._csnippets and not self._vstate.buffer_changed():
+            # Only the cursor moved, there is nothing to replay or update.
+            self._check_if_still_inside_snippet()
+            return
 
-            try:
-                rv, es = guess_edit(initial_line, lt, ct, self._vstate)
-                if not rv:
-                    lt = '\n'.join(lt)
-                    ct = '\n'.join(ct)
-                    es = diff(lt, ct, initial_line)
-                self._csnippets[0].replay_user_edits(es, self._ctab)
-            except IndexError:
-                # Rather do nothing than throwing an error. It will be correct
-                # most of the time
-                pass
+        if self._csnippets:
+            changed = self._vstate.changed_lines()
+            if changed != ():
+                self._replay_user_edits(changed)
 
         self._check_if_still_inside_snippet()
         if self._csnippets:
             self._csnippets[0].update_textobjects()
             self._vstate.remember_buffer(self._csnippets[0])
 
+    def _replay_user_edits(self, changed):
+        """Finds out what the user changed in the current snippet since the
+        buffer was remembered and applies it to the snippet. 'changed' is the
+        range of changed lines reported by Vim, or None if it is unknown."""
+        lt = self._vstate.remembered_buffer
+        start = self._csnippets[0].start.line
+        if ((changed is None or changed[0] < start) and
+                self._follow_lines_moved(lt)):
+            if changed is not None and changed[1] <= start:
+                return  # All changes were above the snippet.
+            changed = None
+        cstart = self._csnippets[0].start.line
+        cend = self._csnippets[0].end.line + \
+            self._vstate.diff_in_buffer_length
+        ct = _vim.buf[cstart:cend + 1]
+        pos = _vim.buf.cursor
+
+        if (changed is not None and changed[0] >= cstart and
+                changed[1] <= cstart + len(lt)):
+            lt_span, ct_span = self._spans_of_changed_lines(
+                cstart, changed, pos)
+        else:
+            lt_span, ct_span = self._spans_of_different_lines(
+                lt, ct, cstart, pos)
+        initial_line = cstart + lt_span[0]
+
+        lt = lt[lt_span[0]:lt_span[1]]
+        ct = ct[ct_span[0]:ct_span[1]]
+
+        try:
+            rv, es = guess_edit(initial_line, lt, ct, self._vstate)
+            if rv:
+                edit_stats['guessed'] += 1
+            else:
+                edit_stats['diffed'] += 1
+                lt = '\n'.join(lt)
+                ct = '\n'.join(ct)
+                es = diff(lt, ct, initial_line)
+            self._csnippets[0].replay_user_edits(es, self._ctab)
+        except IndexError:
+            # Rather do nothing than throwing an error. It will be correct
+            # most of the time
+            pass
+
+    def _follow_lines_moved(self, lt):
+        """Moves the current snippet along if lines above it were added or
+        removed, which the editor tells through a mark on its first line.
+        The snippet is only moved if its first and last line, as remembered
+        in 'lt', are found at the new place. Returns True if it was
+        moved."""
+        lines = self._vstate.lines_moved()
+        if not lines:
+            return False
+        snippet = self._csnippets[0]
+        start = snippet.start.line + lines
+        end = snippet.end.line + lines
+        if (start < 0 or end >= len(_vim.buf) or
+                _vim.buf[start] != lt[0] or _vim.buf[end] != lt[-1]):
+            return False
+        pivot = Position(snippet.start.line, 0)
+        snippet._move(pivot, Position(lines, 0))
+        self._vstate.follow_lines_moved(pivot.line, lines)
+        return True
+
+    def _spans_of_changed_lines(self, cstart, changed, pos):
+        """Returns the spans of the remembered and the current lines of the
+        snippet starting in 'cstart' that contain the lines 'changed' and
+        the lines of the cursor."""
+        first, last, new_last = changed
+        ppos = self._vstate.ppos
+        # guess_edit() needs the lines of the cursor and the line before.
+        first = max(cstart, min(first, ppos.line, pos.line) - 1)
+        below = max(0, ppos.line + 1 - last, pos.line + 1 - new_last)
+        return ([first - cstart, last + below - cstart],
+                [first - cstart, new_last + below - cstart])
+
+    def _spans_of_different_lines(self, lt, ct, cstart, pos):
+        """Returns the spans of the remembered lines 'lt' and the current
+        lines 'ct' of the snippet starting in 'cstart' that differ."""
+        lt_span = [0, len(lt)]
+        ct_span = [0, len(ct)]
+        initial_line = cstart
+
+        # Cut down on lines searched for changes. Start from behind and
+        # remove all equal lines. Then do the same from the front.
+        if lt and ct:
+            while (lt[lt_span[1] - 1] == ct[ct_span[1] - 1] and
+                    self._vstate.ppos.line < initial_line + lt_span[1] - 1 and
+                    pos.line < initial_line + ct_span[1] - 1 and
+                    (lt_span[0] < lt_span[1]) and
+                    (ct_span[0] < ct_span[1])):
+                ct_span[1] -= 1
+                lt_span[1] -= 1
+            while (lt_span[0] < lt_span[1] and
+                   ct_span[0] < ct_span[1] and
+                   lt[lt_span[0]] == ct[ct_span[0]] and
+                   self._vstate.ppos.line >= initial_line and
+                   pos.line >= initial_line):
+                ct_span[0] += 1
+                lt_span[0] += 1
+                initial_line += 1
+        ct_span[0] = max(0, ct_span[0] - 1)
+        lt_span[0] = max(0, lt_span[0] - 1)
+        return lt_span, ct_span
+
     def _setup_inner_state(self):
         """Map keys and create autocommands that should only be defined when a
         snippet is active."""
@@ -384,6 +525,7 @@ class SnippetManager(object):
         """Reverse _setup_inner_state."""
         if not self._inner_state_up:
             return
+        self._vstate.forget_buffer()
         try:
             _vim.command('silent doautocmd <nomodeline> User UltiSnipsExitLastSnippet')
             if self.expand_trigger != self.forward_trigger:
@@ -492,6 +634,8 @@ class SnippetManager(object):
                     self._cs.current_placeholder = \
                         self._visual_content.placeholder
                     self._should_reset_visual = False
+                    # Interpolations skipped while typing run again.
+                    self._csnippets[0].degraded = False
                     self._csnippets[0].update_textobjects()
                     self._vstate.remember_buffer(self._csnippets[0])
 
@@ -566,40 +710,112 @@ class SnippetManager(object):
 
         If partial is True, then get also return partial matches.
 
+        The result is remembered until the snippets of a source change, unless
+        a source creates snippets on the fly or a snippet with a context is
+        involved.
+
         """
-        filetypes = self.get_buffer_filetypes()[::-1]
-        matching_snippets = defaultdict(list)
-        clear_priority = None
-        cleared = {}
+        filetype, iskeyword = _vim.buf.options('filetype', 'iskeyword')
+        filetypes = self.get_buffer_filetypes(filetype)[::-1]
         for _, source in self._snippet_sources:
             source.ensure(filetypes, cached=autotrigger_only)
 
-        # Collect cleared information from sources.
+        key = self._snips_cache_key(filetypes, before, partial,
+                                    autotrigger_only, iskeyword)
+        if key is not None:
+            entry = self._snips_cache.pop(key, None)
+            if entry is not None:
+                self._snips_cache[key] = entry
+                # The snippets remember what they matched last, which might
+                # have been another text since.
+                for snippet, state in entry:
+                    snippet.restore_match_state(state)
+                return [snippet for snippet, _ in entry]
+
+        snippets = self._find_snips(filetypes, before, partial,
+                                    autotrigger_only)
+        if key is not None:
+            self._snips_cache[key] = [
+                (snippet, snippet.match_state) for snippet in snippets]
+            while len(self._snips_cache) > _SNIPS_CACHE_SIZE:
+                self._snips_cache.popitem(last=False)
+        return snippets
+
+    def _merged_view(self, sources, filetypes):
+        """Returns the MergedSnippetView of 'sources' for 'filetypes',
+        building it if the snippets of any source changed."""
+        key = tuple(filetypes)
+        view = self._merged_views.get(key)
+        if view is None or view.generations != tuple(
+                source.generation for source in sources):
+            view = MergedSnippetView(sources, filetypes)
+            self._merged_views[key] = view
+        return view
+
+    def _snips_cache_key(self, filetypes, before, partial, autotrigger_only,
+                         iskeyword):
+        """Returns the key under which the result of _snips() is remembered
+        or None if it must not be."""
+        sources = [source for _, source in self._snippet_sources]
+        if any(source.generation is None for source in sources):
+            return None
+        view = self._merged_view(sources, filetypes)
+        # Whether a context matches depends on the state of Vim.
+        if view.has_context_snippets:
+            return None
+        # Word boundaries for the 'w' option depend on 'iskeyword'.
+        return (tuple(filetypes), before, partial, autotrigger_only,
+                view.generations, iskeyword)
+
+    def _find_snips(self, filetypes, before, partial, autotrigger_only):
+        """Queries all sources for _snips()."""
+        static_sources = []
+        dynamic_sources = []
         for _, source in self._snippet_sources:
-            sclear_priority = source.get_clear_priority(filetypes)
-            if sclear_priority is not None and (clear_priority is None
-                                                or sclear_priority > clear_priority):
-                clear_priority = sclear_priority
-            for key, value in source.get_cleared(filetypes).items():
-                if key not in cleared or value > cleared[key]:
-                    cleared[key] = value
+            if source.generation is None:
+                dynamic_sources.append(source)
+            else:
+                static_sources.append(source)
+
+        view = self._merged_view(static_sources, filetypes)
+        snippets = view.get_matching_snippets(
+            before, partial, autotrigger_only, self._visual_content)
+        if dynamic_sources or not view.resolved:
+            snippets = self._resolve_priorities(
+                view, dynamic_sources, filetypes, snippets, before, partial,
+                autotrigger_only)
+        if not snippets:
+            return []
 
-        for _, source in self._snippet_sources:
-            possible_snippets = source.get_snippets(
+        # For partial matches we are done, but if we want to expand a snippet,
+        # we have to go over them again and only keep those with the maximum
+        # priority.
+        if partial:
+            return snippets
+
+        highest_priority = max(s.priority for s in snippets)
+        return [s for s in snippets if s.priority == highest_priority]
+
+    def _resolve_priorities(self, view, dynamic_sources, filetypes, snippets,
+                            before, partial, autotrigger_only):
+        """Adds the snippets of 'dynamic_sources' to those of 'view' that
+        match and keeps those with the highest priority per trigger."""
+        possible_snippets = list(snippets)
+        for source in dynamic_sources:
+            possible_snippets.extend(source.get_snippets(
                 filetypes,
                 before,
                 partial,
                 autotrigger_only,
                 self._visual_content
-            )
-
-            for snippet in possible_snippets:
-                if ((clear_priority is None or snippet.priority > clear_priority)
-                        and (snippet.trigger not in cleared or
-                             snippet.priority > cleared[snippet.trigger])):
-                    matching_snippets[snippet.trigger].append(snippet)
-        if not matching_snippets:
-            return []
+            ))
+        clear_priority, cleared = merge_cleared(
+            [view] + dynamic_sources, filetypes)
+
+        matching_snippets = defaultdict(list)
+        for snippet in possible_snippets:
+            if not is_cleared(snippet, clear_priority, cleared):
+                matching_snippets[snippet.trigger].append(snippet)
 
         # Now filter duplicates and only keep the one with the highest
         # priority.
@@ -608,15 +824,7 @@ class SnippetManager(object):
             highest_priority = max(s.priority for s in snippets_with_trigger)
             snippets.extend(s for s in snippets_with_trigger
                             if s.priority == highest_priority)
-
-        # For partial matches we are done, but if we want to expand a snippet,
-        # we have to go over them again and only keep those with the maximum
-        # priority.
-        if partial:
-            return snippets
-
-        highest_priority = max(s.priority for s in snippets)
-        return [s for s in snippets if s.priority == highest_priority]
+        return snippets
 
     def _do_snippet(self, snippet, before):
         """Expands the given snippet, and handles everything that needs to be
@@ -696,6 +904,35 @@ class SnippetManager(object):
                 self._snip_expanded_in_action = True
 
 
+    def _read_body(self, snippet, before, partial):
+        """Reads the body of 'snippet' if it is still in its snippet file.
+
+        If the file changed since it was parsed, even without a change of its
+        stat(), the snippets are reloaded and the snippet with the same
+        trigger from the same file is read instead. Returns None if there is
+        no such snippet anymore or the file keeps changing.
+
+        """
+        try:
+            snippet.value  # pylint:disable=pointless-statement
+            return snippet
+        except SnippetFileChanged:
+            pass
+        # The file is marked as changed, so this parses it again.
+        filetypes = self.get_buffer_filetypes()[::-1]
+        for _, source in self._snippet_sources:
+            source.ensure(filetypes, cached=False)
+        filename = snippet.location.rsplit(':', 1)[0]
+        for candidate in self._snips(before, partial):
+            if (candidate.trigger == snippet.trigger and
+                    candidate.location.rsplit(':', 1)[0] == filename):
+                try:
+                    candidate.value  # pylint:disable=pointless-statement
+                except SnippetFileChanged:
+                    return None
+                return candidate
+        return None
+
     def _try_expand(self, autotrigger_only=False):
         """Try to expand a snippet in the current place."""
         before = _vim.buf.line_till_cursor
@@ -715,6 +952,9 @@ class SnippetManager(object):
             snippet = _ask_snippets(snippets)
             if not snippet:
                 return True
+        snippet = self._read_body(snippet, before, False)
+        if snippet is None:
+            return False
         self._do_snippet(snippet, before)
         _vim.command('let &undolevels = &undolevels')
         return True
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import random
+import re
+import unittest
+
+import _change_tracker
+from _change_tracker import ChangeTracker, merge_changes
+
+
+class _FakeVim(object):
+
+    """Answers the calls of the change tracker like Vim or Neovim would and
+    emits change events for the changes made with change()."""
+
+    def __init__(self, neovim=False, enabled='1'):
+        self.neovim = neovim
+        self.enabled = enabled
+        self.variables = {}
+        self.listeners = set()
+        self.listener_ids = {}  # id -> buffer (Vim only)
+        self.last_listener = 0
+        self.pending = {}  # buffer -> changes not flushed yet (Vim only)
+        self.recorded = []
+        self.lost = False  # Neovim only
+        self.attaches = 0
+
+    def change(self, buffer, first, last, new_last):
+        """Replaces the lines 'first' up to 'last' of 'buffer'."""
+        if buffer not in self.listeners:
+            return
+        if self.neovim:
+            self._record(buffer, [first, last, new_last])
+        else:
+            # Vim collects the changes until listener_flush().
+            self.pending.setdefault(buffer, []).append(
+                {'lnum': first + 1, 'end': last + 1,
+                 'added': new_last - last})
+
+    def reload(self, buffer):
+        """Reloads 'buffer', e.g. through :edit! (Neovim only)."""
+        if buffer in self.listeners:
+            self._lose(buffer)
+
+    def detach(self, buffer):
+        """Detaches the change events from 'buffer' (Neovim only)."""
+        self.listeners.discard(buffer)
+        self._lose(buffer)
+
+    def _lose(self, buffer):
+        if buffer == self.variables.get('tracked', -1):
+            self.lost = True
+
+    def _attach(self, buffer):
+        if buffer not in self.listeners:
+            self.listeners.add(buffer)
+            self.attaches += 1
+
+    def _record(self, buffer, change):
+        if buffer == self.variables.get('tracked', -1):
+            self.recorded.append([str(i) for i in change])
+
+    def _flush(self, buffer):
+        for change in self.pending.pop(buffer, []):
+            self._record(buffer, [change['lnum'] - 1, change['end'] - 1,
+                                  change['end'] - 1 + change['added']])
+
+    def _take(self):
+        changes, self.recorded = self.recorded, []
+        return changes
+
+    def eval(self, expr):
+        if expr == 'get(g:, "UltiSnipsTrackChanges", 1)':
+            return self.enabled
+        if expr == 'exists("*listener_add")':
+            return '0' if self.neovim else '1'
+        if expr == 'has("nvim-0.4")':
+            return '1' if self.neovim else '0'
+        match = re.match(r'listener_add\("UltiSnips#TrackChanges", (\d+)\)',
+                         expr)
+        if match:
+            self.last_listener += 1
+            self.listener_ids[self.last_listener] = int(match.group(1))
+            self.listeners.add(int(match.group(1)))
+            return str(self.last_listener)
+        match = re.match(r'listener_remove\((\d+)\)', expr)
+        if match:
+            buffer = self.listener_ids.pop(int(match.group(1)), None)
+            if buffer is None:
+                return '0'
+            if buffer not in self.listener_ids.values():
+                self.listeners.discard(buffer)
+            return '1'
+        match = re.match(r'UltiSnips#TakeChanges\((\d+)\)', expr)
+        if match:
+            self._flush(int(match.group(1)))
+            return self._take()
+        if expr == 'luaeval("UltiSnipsChanges.take()")':
+            return {'changes': self._take(), 'lost': '1' if self.lost else '0'}
+        raise AssertionError('Unexpected eval: ' + expr)
+
+    def command(self, cmd):
+        match = re.match(r'(?:let g:_ultisnips_tracked_buffer = |'
+                         r'lua UltiSnipsChanges\.track\()(-?\d+)', cmd)
+        if match:
+            self.variables['tracked'] = int(match.group(1))
+            self.recorded = []
+            if self.neovim:
+                self.lost = False
+                if self.variables['tracked'] >= 0:
+                    self._attach(self.variables['tracked'])
+            return
+        match = re.match(r'lua UltiSnipsChanges\.attach\((\d+)\)', cmd)
+        if match:
+            self._attach(int(match.group(1)))
+            return
+        if cmd == 'let g:_ultisnips_changes = []':
+            self.recorded = []
+            return
+        if cmd.startswith('lua UltiSnipsChanges = '):
+            return
+        raise AssertionError('Unexpected command: ' + cmd)
+
+
+class _BaseTracking(object):
+    neovim = False
+
+    def setUp(self):
+        self.vim = _FakeVim(self.neovim)
+        self.real_vim = _change_tracker._vim
+        _change_tracker._vim = self.vim
+        self.tracker = ChangeTracker()
+
+    def tearDown(self):
+        _change_tracker._vim = self.real_vim
+
+    def test_no_changes(self):
+        self.tracker.start(1)
+        self.assertEqual((), self.tracker.changed_lines(1))
+
+    def test_unknown_before_start(self):
+        self.assertEqual(None, self.tracker.changed_lines(1))
+
+    def test_changes_before_start_are_ignored(self):
+        self.tracker.start(1)
+        self.vim.change(1, 3, 4, 4)
+        self.tracker.start(1)
+        self.vim.change(1, 5, 6, 8)
+        self.assertEqual((5, 6, 8), self.tracker.changed_lines(1))
+
+    def test_changes_are_merged(self):
+        self.tracker.start(1)
+        self.vim.change(1, 3, 4, 4)
+        self.assertEqual((3, 4, 4), self.tracker.changed_lines(1))
+        self.vim.change(1, 6, 6, 7)
+        self.assertEqual((3, 6, 7), self.tracker.changed_lines(1))
+
+    def test_other_buffers(self):
+        self.tracker.start(1)
+        self.tracker.start(2)
+        self.vim.change(1, 3, 4, 4)
+        self.assertEqual((), self.tracker.changed_lines(2))
+        self.assertEqual(None, self.tracker.changed_lines(1))
+
+    def test_stop(self):
+        self.tracker.start(1)
+        self.vim.change(1, 3, 4, 4)
+        self.tracker.stop()
+        self.assertEqual(None, self.tracker.changed_lines(1))
+        self.vim.change(1, 3, 4, 4)
+        self.tracker.start(1)
+        self.assertEqual((), self.tracker.changed_lines(1))
+
+
+class TestVimListener(_BaseTracking, unittest.TestCase):
+    neovim = False
+
+    def test_listeners_are_removed_on_stop(self):
+        self.tracker.start(1)
+        self.tracker.start(2)
+        self.tracker.start(1)
+        self.assertEqual(2, len(self.vim.listener_ids))
+        self.tracker.stop()
+        self.assertEqual({}, self.vim.listener_ids)
+        self.assertEqual(set(), self.vim.listeners)
+        self.tracker.start(1)
+        self.vim.change(1, 5, 6, 6)
+        self.assertEqual((5, 6, 6), self.tracker.changed_lines(1))
+        self.assertEqual(1, len(self.vim.listener_ids))
+
+    def test_stop_without_start(self):
+        self.tracker.stop()
+        self.assertEqual({}, self.vim.listener_ids)
+
+
+class TestNeovimAttach(_BaseTracking, unittest.TestCase):
+    neovim = True
+
+    def test_reload(self):
+        self.tracker.start(1)
+        self.vim.change(1, 3, 4, 4)
+        self.vim.reload(1)
+        self.assertEqual(None, self.tracker.changed_lines(1))
+        self.vim.change(1, 5, 6, 6)
+        self.assertEqual(None, self.tracker.changed_lines(1))
+        self.tracker.start(1)
+        self.vim.change(1, 5, 6, 6)
+        self.assertEqual((5, 6, 6), self.tracker.changed_lines(1))
+        self.assertEqual(1, self.vim.attaches)
+
+    def test_detach(self):
+        self.tracker.start(1)
+        self.vim.detach(1)
+        self.assertEqual(None, self.tracker.changed_lines(1))
+        self.assertEqual(None, self.tracker.changed_lines(1))
+        self.tracker.start(1)
+        self.vim.change(1, 5, 6, 6)
+        self.assertEqual((5, 6, 6), self.tracker.changed_lines(1))
+        self.assertEqual(2, self.vim.attaches)
+
+    def test_detach_of_other_buffer(self):
+        self.tracker.start(1)
+        self.tracker.start(2)
+        self.vim.detach(1)
+        self.assertEqual((), self.tracker.changed_lines(2))
+        self.tracker.start(1)
+        self.vim.change(1, 5, 6, 6)
+        self.assertEqual((5, 6, 6), self.tracker.changed_lines(1))
+
+
+class TestDisabled(unittest.TestCase):
+
+    def setUp(self):
+        self.vim = _FakeVim(enabled='0')
+        self.real_vim = _change_tracker._vim
+        _change_tracker._vim = self.vim
+
+    def tearDown(self):
+        _change_tracker._vim = self.real_vim
+
+    def runTest(self):
+        tracker = ChangeTracker()
+        tracker.start(1)
+        self.vim.change(1, 3, 4, 4)
+        self.assertEqual(None, tracker.changed_lines(1))
+        self.assertEqual(set(), self.vim.listeners)
+
+
+class TestMergeChanges(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual((), merge_changes([]))
+
+    def test_random_changes(self):
+        rand = random.Random(5)
+        for _ in range(500):
+            original = [str(i) for i in range(20)]
+            lines = list(original)
+            changes = []
+            for _ in range(rand.randint(1, 4)):
+                first = rand.randint(0, len(lines))
+                last = rand.randint(first, min(len(lines), first + 3))
+                new = ['new'] * rand.randint(0, 3)
+                lines[first:last] = new
+                changes.append((first, last, first + len(new)))
+            first, last, new_last = merge_changes(changes)
+            self.assertEqual(original[:first], lines[:first])
+            self.assertEqual(original[last:], lines[new_last:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import unittest
+
+import compiled_code
+from compiled_code import code_filename, compile_code, compiled_globals, \
+    run_code
+
+
+class TestCodeFilename(unittest.TestCase):
+
+    def test_file(self):
+        self.assertEqual('/a/all.snippets:12',
+                         code_filename('/a/all.snippets:10', 2))
+
+    def test_no_line(self):
+        self.assertEqual('<added>', code_filename('added'))
+
+    def test_anonymous(self):
+        self.assertEqual('<anonymous>', code_filename(None))
+
+
+class TestCompileCode(unittest.TestCase):
+
+    def test_compiled_once(self):
+        code = compile_code('a = 1', '<test>')
+        self.assertTrue(code is compile_code('a = 1', '<test>'))
+        self.assertFalse(code is compile_code('a = 1', '<other>'))
+
+    def test_least_recently_used_is_dropped(self):
+        first = compile_code('a = 0', '<test>')
+        for i in range(1, compiled_code._CODE_CACHE_SIZE):
+            compile_code('a = %i' % i, '<test>')
+        self.assertTrue(first is compile_code('a = 0', '<test>'))
+        compile_code('a = -1', '<test>')
+        compile_code('a = 0', '<test>')
+        self.assertFalse(('a = 1', '<test>') in compiled_code._code_cache)
+
+
+class TestRunCode(unittest.TestCase):
+
+    def test_namespace(self):
+        namespace = {'a': 1}
+        run_code('b = a + 1', '<test>', namespace)
+        self.assertEqual(2, namespace['b'])
+
+    def test_errors_are_annotated(self):
+        try:
+            run_code('a = 1\nb = c', '/a/all.snippets:3', {})
+        except NameError as e:
+            self.assertEqual('a = 1\nb = c', e.snippet_code)
+            self.assertEqual('/a/all.snippets:3', e.snippet_filename)
+        else:
+            self.fail('No error raised.')
+
+
+class TestCompiledGlobals(unittest.TestCase):
+
+    def test_shared_per_file(self):
+        globals = {'!p': ['value = []']}
+        first = compiled_globals(globals, '/a/all.snippets:3')
+        self.assertTrue(
+            first is compiled_globals(globals, '/a/all.snippets:10'))
+        self.assertFalse(
+            first is compiled_globals(globals, '/a/other.snippets:3'))
+
+    def test_executed_in_namespace(self):
+        globals = {'!p': ['def get():', '    return value']}
+        namespace = {'value': 1}
+        compiled_globals(globals, '/a/x.snippets:1').execute(namespace)
+        self.assertEqual(1, namespace['get']())
+        self.assertTrue('re' in namespace and 'os' in namespace)
+
+    def test_errors_name_the_file(self):
+        try:
+            compiled_globals({'!p': ['a = b']}, '/a/x.snippets:1').execute({})
+        except NameError as e:
+            self.assertEqual('<global !p of /a/x.snippets>',
+                             e.snippet_filename)
+        else:
+            self.fail('No error raised.')
+
+    def test_errors_without_file(self):
+        try:
+            compiled_globals({'!p': ['a = b']}, None).execute({})
+        except NameError as e:
+            self.assertEqual('<global !p>', e.snippet_filename)
+        else:
+            self.fail('No error raised.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@
 
 import unittest
 
-from _diff import diff, guess_edit
+from _diff import diff, guess_edit, is_complete_edit
 from position import Position
 
 
@@ -31,11 +31,27 @@ import unittest
 # Test Guessing  {{{
 
 
+class _ModePosition(Position):
+
+    def __init__(self, line, col, mode):
+        Position.__init__(self, line, col)
+        self.mode = mode
+
+
+class _VimState(object):
+
+    def __init__(self, ppos, pos, mode):
+        self.ppos = _ModePosition(ppos[0], ppos[1], mode)
+        self.pos = Position(*pos)
+
+
 class _BaseGuessing(object):
+    mode = 'i'
 
     def runTest(self):
         rv, es = guess_edit(
-            self.initial_line, self.a, self.b, Position(*self.ppos), Position(*self.pos))
+            self.initial_line, self.a, self.b,
+            _VimState(self.ppos, self.pos, self.mode))
         self.assertEqual(rv, True)
         self.assertEqual(self.wanted, es)
 
@@ -82,6 +98,91 @@ class TestGuessing_DeleteOneChar(_BaseGuessing, unittest.TestCase):
         ('D', 0, 5, ' '),
     )
 
+
+
+class TestGuessing_PasteLines(_BaseGuessing, unittest.TestCase):
+    a, b = ['if (a) {', '}'], ['if (a) {', '    one();', '    two();', '}']
+    initial_line = 3
+    ppos, pos = (3, 8), (5, 10)
+    wanted = (
+        ('I', 3, 8, '\n    one();\n    two();'),
+    )
+
+
+class TestGuessing_OpenLineBelow(_BaseGuessing, unittest.TestCase):
+    a, b = ['    first', 'last'], ['    first', '    ', 'last']
+    initial_line = 0
+    mode = 'n'
+    ppos, pos = (0, 2), (1, 4)
+    wanted = (
+        ('I', 0, 9, '\n    '),
+    )
+
+
+class TestGuessing_OpenLineAbove(_BaseGuessing, unittest.TestCase):
+    a, b = ['first', 'last'], ['first', '', 'last']
+    initial_line = 0
+    mode = 'n'
+    ppos, pos = (1, 2), (1, 0)
+    wanted = (
+        ('I', 1, 0, '\n'),
+    )
+
+
+class TestGuessing_PasteLinesAbove(_BaseGuessing, unittest.TestCase):
+    a, b = ['first', 'last'], ['first', 'one', 'two', 'last']
+    initial_line = 0
+    mode = 'n'
+    ppos, pos = (1, 0), (1, 0)
+    wanted = (
+        ('I', 1, 0, 'one\ntwo\n'),
+    )
+
+
+class TestGuessing_CompletionCycle(_BaseGuessing, unittest.TestCase):
+    a, b = ['call foobar(x)'], ['call foobaz_long(x)']
+    initial_line = 0
+    ppos, pos = (0, 11), (0, 16)
+    wanted = (
+        ('D', 0, 10, 'r'),
+        ('I', 0, 10, 'z_long'),
+    )
+
+
+class TestGuessing_Unknown(unittest.TestCase):
+
+    def runTest(self):
+        rv, es = guess_edit(0, ['abc', 'def'], ['xbc', 'dxf'],
+                            _VimState((1, 2), (1, 2), 'n'))
+        self.assertEqual(rv, False)
+        self.assertEqual(es, None)
+
+
+class TestIsCompleteEdit(unittest.TestCase):
+
+    def test_multi_line_commands(self):
+        a = ['zero', 'one', 'two', 'three', 'four']
+        self.assertTrue(is_complete_edit(
+            10, a, ['zero', 'oNEW', 'LINES', 'three', 'four'],
+            (('D', 11, 1, 'ne\ntwo'), ('I', 11, 1, 'NEW\nLINES'))))
+        self.assertFalse(is_complete_edit(
+            10, a, ['zero', 'oNEW', 'LINES', 'thre', 'four'],
+            (('D', 11, 1, 'ne\ntwo'), ('I', 11, 1, 'NEW\nLINES'))))
+
+    def test_deletes_last_newline(self):
+        self.assertTrue(is_complete_edit(
+            0, ['a', 'b'], ['ab'], (('D', 0, 1, '\n'),)))
+        self.assertTrue(is_complete_edit(
+            0, ['a', 'b'], ['a'], (('D', 1, 0, '\n'),)))
+        self.assertTrue(is_complete_edit(
+            0, ['a', 'b'], ['a'], (('D', 1, 0, 'b'), ('D', 1, 0, '\n'))))
+
+    def test_outside_of_text(self):
+        self.assertFalse(is_complete_edit(
+            0, ['a'], ['a', 'b'], (('I', 1, 0, 'b'),)))
+        self.assertFalse(is_complete_edit(
+            1, ['a'], ['ba'], (('I', 0, 0, 'b'),)))
+
 # End: Test Guessing  }}}
 
 
@@ -206,6 +307,35 @@ class MultiLine(_Base, unittest.TestCase):
     )
 
 
+class KeepsUnchangedRunInLine(_Base, unittest.TestCase):
+    a = 'foo(bar, baz)'
+    b = 'foo(bar2, baz3)'
+    wanted = (
+        ('I', 0, 7, '2'),
+        ('I', 0, 13, '3'),
+    )
+
+
+class KeepsUnchangedRunAcrossLines(_Base, unittest.TestCase):
+    a = 'one two\nthree'
+    b = 'a two\nthree\nb'
+    wanted = (
+        ('D', 0, 0, 'one'),
+        ('I', 0, 0, 'a'),
+        ('I', 1, 5, '\n'),
+        ('I', 2, 0, 'b'),
+    )
+
+
+class LongChangeIsReplacedAsWhole(_Base, unittest.TestCase):
+    a = 'x' + 'ab' * 200 + 'cde' + 'ab' * 200
+    b = 'x' + 'AB' * 200 + 'cde' + 'AB' * 200
+    wanted = (
+        ('D', 0, 1, a[1:]),
+        ('I', 0, 1, b[1:]),
+    )
+
+
 if __name__ == '__main__':
     unittest.main()
     # k = TestEditScript()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import re
+import unittest
+
+import _native_mark
+from _native_mark import NativeMark
+
+
+class _FakeVim(object):
+
+    """Keeps the text property or extmark of UltiSnips like Vim or Neovim
+    and moves it with move_lines()."""
+
+    def __init__(self, neovim=False):
+        self.neovim = neovim
+        self.marks = {}  # buffer -> line
+        self.calls = 0
+
+    def move_lines(self, buffer, lines):
+        self.marks[buffer] += lines
+
+    def delete_mark_line(self, buffer):
+        del self.marks[buffer]
+
+    def eval(self, expr):
+        self.calls += 1
+        if expr == 'get(g:, "UltiSnipsNativeMarks", 1)':
+            return '1'
+        if expr == 'exists("*prop_find")':
+            return '0' if self.neovim else '1'
+        if expr == 'has("nvim-0.5")':
+            return '1' if self.neovim else '0'
+        if expr == 'nvim_create_namespace("UltiSnips")':
+            return 7
+        match = re.match(r'nvim_buf_set_extmark\((\d+), 7, (\d+), 0,', expr)
+        if match:
+            self.marks[int(match.group(1))] = int(match.group(2))
+            return 1
+        match = re.match(r'nvim_buf_get_extmark_by_id\((\d+), 7, 1,', expr)
+        if match:
+            buffer = int(match.group(1))
+            return [self.marks[buffer], 0] if buffer in self.marks else []
+        match = re.match(r'nvim_buf_del_extmark\((\d+), 7, 1\)', expr)
+        if match:
+            self.marks.pop(int(match.group(1)), None)
+            return 1
+        match = re.match(r'prop_find\(.*"bufnr": (\d+),', expr)
+        if match:
+            buffer = int(match.group(1))
+            if buffer not in self.marks:
+                return {}
+            return {'lnum': str(self.marks[buffer] + 1), 'col': '1'}
+        raise AssertionError('Unexpected eval: ' + expr)
+
+    def command(self, cmd):
+        self.calls += 1
+        if cmd.startswith('silent! call prop_type_add('):
+            return
+        for match in re.finditer(r'call prop_remove\(.*?"bufnr": (\d+)',
+                                 cmd):
+            self.marks.pop(int(match.group(1)), None)
+        match = re.search(r'call prop_add\((\d+), 1, .*"bufnr": (\d+),',
+                          cmd)
+        if match:
+            self.marks[int(match.group(2))] = int(match.group(1)) - 1
+
+
+class _BaseMark(object):
+    neovim = False
+
+    def setUp(self):
+        self.vim = _FakeVim(self.neovim)
+        self.real_vim = _native_mark._vim
+        _native_mark._vim = self.vim
+        self.mark = NativeMark()
+
+    def tearDown(self):
+        _native_mark._vim = self.real_vim
+
+    def test_not_moved(self):
+        self.mark.place(1, 10)
+        self.assertEqual(0, self.mark.lines_moved(1))
+
+    def test_moved(self):
+        self.mark.place(1, 10)
+        self.vim.move_lines(1, 3)
+        self.assertEqual(3, self.mark.lines_moved(1))
+        self.vim.move_lines(1, -1)
+        self.assertEqual(-1, self.mark.lines_moved(1))
+
+    def test_placed_only_once(self):
+        self.mark.place(1, 10)
+        calls = self.vim.calls
+        self.mark.place(1, 10)
+        self.assertEqual(calls, self.vim.calls)
+        self.mark.place(1, 11)
+        self.assertEqual(11, self.vim.marks[1])
+
+    def test_moved_mark_is_placed_again(self):
+        self.mark.place(1, 10)
+        self.vim.move_lines(1, 3)
+        self.assertEqual(3, self.mark.lines_moved(1))
+        self.mark.place(1, 10)
+        self.assertEqual(10, self.vim.marks[1])
+
+    def test_deleted(self):
+        self.mark.place(1, 10)
+        self.vim.delete_mark_line(1)
+        self.assertEqual(None, self.mark.lines_moved(1))
+        self.mark.place(1, 10)
+        self.assertEqual(10, self.vim.marks[1])
+
+    def test_other_buffer(self):
+        self.mark.place(1, 10)
+        self.assertEqual(None, self.mark.lines_moved(2))
+        self.mark.place(2, 4)
+        self.assertEqual({2: 4}, self.vim.marks)
+
+    def test_remove(self):
+        self.mark.place(1, 10)
+        self.mark.remove()
+        self.assertEqual({}, self.vim.marks)
+        self.assertEqual(None, self.mark.lines_moved(1))
+
+
+class TestTextProperty(_BaseMark, unittest.TestCase):
+    neovim = False
+
+
+class TestExtmark(_BaseMark, unittest.TestCase):
+    neovim = True
+
+
+if __name__ == '__main__':
+    unittest.main()
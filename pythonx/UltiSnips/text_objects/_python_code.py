@@ -8,8 +8,10 @@ from collections import namedtuple
 
 from UltiSnips import _vim
 from UltiSnips.compatibility import as_unicode
+from UltiSnips.compiled_code import compiled_globals, run_code
 from UltiSnips.indent_util import IndentUtil
 from UltiSnips.text_objects._base import NoneditableTextObject
+from UltiSnips.text_objects._watchdog import interpolation_location, timed
 from UltiSnips.vim_state import _Placeholder
 import UltiSnips.snippet_manager
 
@@ -283,13 +285,15 @@ class PythonCode(NoneditableTextObject):
                 snippet = snippet._parent  # pylint:disable=protected-access
         self._snip = SnippetUtil(token.indent, mode, text, context, snippet)
 
-        self._codes = ((
-            'import re, os, vim, string, random',
-            '\n'.join(snippet.globals.get('!p', [])).replace('\r\n', '\n'),
-            token.code.replace('\\`', '`')
-        ))
+        self._snippet = snippet
+        self._globals = compiled_globals(snippet.globals,
+                                         snippet.snippet.location)
+        self._code = token.code.replace('\\`', '`')
+        self._location = interpolation_location(parent, token)
+        self._prefetch_seconds = 0.0
         NoneditableTextObject.__init__(self, parent, token)
 
+    @timed
     def _update(self, done):
         path = _vim.eval('expand("%")') or ''
         ct = self.current_text
@@ -303,12 +307,13 @@ class PythonCode(NoneditableTextObject):
         })
         self._snip._reset(ct)  # pylint:disable=protected-access
 
-        for code in self._codes:
-            try:
-                exec(code, self._locals)  # pylint:disable=exec-used
-            except Exception as e:
-                e.snippet_code = code
-                raise
+        # The globals only need to run once per snippet instance, all its
+        # interpolations share the same locals.
+        if not self._snippet.globals_executed:
+            self._globals.execute(self._locals)
+            self._snippet.globals_executed = True
+
+        run_code(self._code, self._location, self._locals)
 
         rv = as_unicode(
             self._snip.rv if self._snip._rv_changed  # pylint:disable=protected-access
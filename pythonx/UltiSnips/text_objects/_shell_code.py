@@ -3,14 +3,31 @@
 
 """Implements `echo hi` shell code interpolation."""
 
+from multiprocessing.pool import ThreadPool
 import os
 import platform
 from subprocess import Popen, PIPE
+import signal
 import stat
+import sys
 import tempfile
+import threading
+import time
 
+from UltiSnips import _vim
 from UltiSnips.compatibility import as_unicode
 from UltiSnips.text_objects._base import NoneditableTextObject
+from UltiSnips.text_objects._watchdog import interpolation_location, timed
+
+# The executable tmp directory, probed once per session. None until then.
+_tmpdir = None
+
+# Most shell interpolations of one snippet that run at the same time.
+_MAX_THREADS = 8
+
+# (command, working directory) -> (time of the run, output) of the commands
+# memorized through g:UltiSnipsShellMemo.
+_memo = {}
 
 
 def _chomp(string):
@@ -23,7 +40,61 @@ def _chomp(string):
     return string
 
 
-def _run_shell_command(cmd, tmpdir):
+def _popen(cmd):
+    """Starts 'cmd' through the shell in a process group of its own, so that
+    it can be killed with all its children."""
+    kwargs = {}
+    if platform.system() != 'Windows':
+        if sys.version_info >= (3, 2):
+            kwargs['start_new_session'] = True
+        else:
+            kwargs['preexec_fn'] = os.setsid
+    return Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE, **kwargs)
+
+
+def _kill(proc):
+    """Kills 'proc' and the processes it started."""
+    try:
+        if platform.system() == 'Windows':
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass  # Already gone.
+
+
+def _communicate(cmd, timeout):
+    """Runs 'cmd' and returns its output. It is killed if it takes longer
+    than 'timeout' seconds."""
+    proc = _popen(cmd)
+    timed_out = []
+
+    def _on_timeout():
+        """Kills the command when it took too long."""
+        timed_out.append(True)
+        _kill(proc)
+
+    timer = None
+    if timeout > 0:
+        timer = threading.Timer(timeout, _on_timeout)
+        timer.start()
+    try:
+        stdout, _ = proc.communicate()
+    finally:
+        if timer is not None:
+            timer.cancel()
+    if timed_out:
+        return 'Shell command timed out after %g seconds' % timeout
+    return _chomp(as_unicode(stdout))
+
+
+def _needs_script(cmd):
+    """True if 'cmd' has to be written to a file to be run: it has a shebang
+    line or we are on Windows, where the shell needs a batch file."""
+    return platform.system() == 'Windows' or cmd.startswith('#!')
+
+
+def _run_script(cmd, tmpdir, timeout=0):
     """Write the code to a temporary file."""
     cmdsuf = ''
     if platform.system() == 'Windows':
@@ -37,23 +108,104 @@ def _run_shell_command(cmd, tmpdir):
     os.chmod(path, stat.S_IRWXU)
 
     # Execute the file and read stdout
-    proc = Popen(path, shell=True, stdout=PIPE, stderr=PIPE)
-    proc.wait()
-    stdout, _ = proc.communicate()
-    os.unlink(path)
-    return _chomp(as_unicode(stdout))
+    try:
+        return _communicate(path, timeout)
+    finally:
+        os.unlink(path)
 
 
 def _get_tmp():
     """Find an executable tmp directory."""
+    global _tmpdir  # pylint:disable=global-statement
+    if _tmpdir is not None:
+        return _tmpdir
+    _tmpdir = ''
     userdir = os.path.expanduser('~')
     for testdir in [tempfile.gettempdir(), os.path.join(userdir, '.cache'),
                     os.path.join(userdir, '.tmp'), userdir]:
         if (not os.path.exists(testdir) or
-                not _run_shell_command('echo success', testdir) == 'success'):
+                not _run_script('echo success', testdir) == 'success'):
             continue
-        return testdir
-    return ''
+        _tmpdir = testdir
+        break
+    return _tmpdir
+
+
+def _run_shell_command(cmd, timeout):
+    """Runs 'cmd' and returns its output.
+
+    Plain shell code is handed to the shell directly, only scripts with a
+    shebang line go through a temporary file.
+
+    """
+    if not _needs_script(cmd):
+        return _communicate(cmd, timeout)
+    tmpdir = _get_tmp()
+    if not tmpdir:
+        return 'Unable to find executable tmp directory, check noexec on /tmp'
+    return _run_script(cmd, tmpdir, timeout)
+
+
+def _memo_seconds(cmd):
+    """Returns for how many seconds the output of 'cmd' may be reused."""
+    memo = _vim.eval('get(g:, "UltiSnipsShellMemo", {})')
+    try:
+        return float(memo.get(cmd, 0))
+    except (AttributeError, ValueError):
+        return 0
+
+
+def _timeout():
+    """Returns after how many seconds a shell command is killed."""
+    try:
+        return float(_vim.eval('get(g:, "UltiSnipsShellTimeout", 10)'))
+    except ValueError:
+        return 0
+
+
+def run_shell_code(cmd, memo_seconds=0, timeout=0):
+    """Returns the output of 'cmd', reusing the output of an earlier run in
+    the same directory if it is at most 'memo_seconds' old.
+
+    Does not talk to Vim, so it can run in any thread.
+
+    """
+    if memo_seconds <= 0:
+        return _run_shell_command(cmd, timeout)
+    key = (cmd, os.getcwd())
+    now = time.time()
+    if key in _memo and now - _memo[key][0] <= memo_seconds:
+        return _memo[key][1]
+    output = _run_shell_command(cmd, timeout)
+    _memo[key] = (now, output)
+    return output
+
+
+def _run_shell_code_args(args):
+    """Calls run_shell_code() with the tuple 'args' and returns its result
+    and how long it took."""
+    start = time.time()
+    output = run_shell_code(*args)
+    return output, time.time() - start
+
+
+def run_concurrently(shell_codes):
+    """Runs the commands of all 'shell_codes' that did not run yet at the
+    same time. Their outputs are inserted when they are updated."""
+    # pylint:disable=protected-access
+    pending = [shell_code for shell_code in shell_codes
+               if shell_code._output is None]
+    if len(pending) < 2:
+        return
+    args = [shell_code._args() for shell_code in pending]
+    pool = ThreadPool(min(len(pending), _MAX_THREADS))
+    try:
+        outputs = pool.map(_run_shell_code_args, args)
+    finally:
+        pool.close()
+    for shell_code, (output, seconds) in zip(pending, outputs):
+        shell_code._output = output
+        shell_code._prefetch_seconds = seconds
 
 
 class ShellCode(NoneditableTextObject):
@@ -63,14 +215,18 @@ class ShellCode(NoneditableTextObject):
     def __init__(self, parent, token):
         NoneditableTextObject.__init__(self, parent, token)
         self._code = token.code.replace('\\`', '`')
-        self._tmpdir = _get_tmp()
+        self._output = None
+        self._location = interpolation_location(parent, token)
+        self._prefetch_seconds = 0.0
 
+    def _args(self):
+        """Returns the arguments to run_shell_code() for this code."""
+        return (self._code, _memo_seconds(self._code), _timeout())
+
+    @timed
     def _update(self, done):
-        if not self._tmpdir:
-            output = \
-                'Unable to find executable tmp directory, check noexec on /tmp'
-        else:
-            output = _run_shell_command(self._code, self._tmpdir)
-        self.overwrite(output)
+        if self._output is None:
+            self._output = run_shell_code(*self._args())
+        self.overwrite(self._output)
         self._parent._del_child(self)  # pylint:disable=protected-access
         return True
@@ -9,11 +9,17 @@ also a TextObject.
 
 """
 
+from itertools import takewhile
+
 from UltiSnips import _vim
 from UltiSnips.position import Position
 from UltiSnips.text_objects._base import EditableTextObject, \
     NoneditableTextObject
+from UltiSnips.text_objects._python_code import PythonCode
+from UltiSnips.text_objects._shell_code import ShellCode, run_concurrently
 from UltiSnips.text_objects._tabstop import TabStop
+from UltiSnips.text_objects._viml_code import VimLCode, evaluate_together
+from UltiSnips.text_objects._watchdog import is_due, measure, report
 
 
 class SnippetInstance(EditableTextObject):
@@ -33,8 +39,14 @@ class SnippetInstance(EditableTextObject):
         self.context = context
         self.locals = {'match': last_re, 'context': context}
         self.globals = globals
+        self.globals_executed = False
         self.visual_content = visual_content
         self.current_placeholder = None
+        # Set when the interpolations took longer than the budget, which is
+        # in seconds. Cleared on the next jump.
+        self.degraded = False
+        self._budget = float(_vim.eval(
+            'get(g:, "UltiSnipsInterpolationBudget", 500)')) / 1000
 
         EditableTextObject.__init__(self, parent, start, end, initial_text)
 
@@ -73,13 +85,36 @@ class SnippetInstance(EditableTextObject):
             not_done.add(obj)
         _find_recursive(self)
 
-        counter = 10
-        while (done != not_done) and counter:
-            # Order matters for python locals!
-            for obj in sorted(not_done - done):
-                if obj._update(done):
-                    done.add(obj)
-            counter -= 1
+        with measure() as cycle:
+            # Shell code does not depend on other text objects, so all of it
+            # can run at once instead of one after the other.
+            run_concurrently(
+                obj for obj in not_done if isinstance(obj, ShellCode))
+            # One round trip to Vim for the VimL interpolations. Only those
+            # before the first python interpolation are evaluated early, the
+            # python code could change what the later ones evaluate to, and
+            # only those that cannot see the text objects before them change
+            # the buffer.
+            before_python = takewhile(
+                lambda obj: not isinstance(obj, PythonCode), sorted(not_done))
+            evaluate_together(obj for obj in before_python
+                              if isinstance(obj, VimLCode) and is_due(obj))
+
+            counter = 10
+            while (done != not_done) and counter:
+                # Order matters for python locals!
+                for obj in sorted(not_done - done):
+                    if obj._update(done):
+                        done.add(obj)
+                counter -= 1
+
+        root = self
+        while root._parent is not None:
+            root = root._parent
+        if 0 < self._budget < cycle.seconds and not root.degraded:
+            root.degraded = True
+            report(cycle)
+
         if not counter:
             raise RuntimeError(
                 'The snippets content did not converge: Check for Cyclic '
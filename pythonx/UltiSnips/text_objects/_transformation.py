@@ -3,6 +3,7 @@
 
 """Implements TabStop transformations."""
 
+from collections import OrderedDict
 import re
 import sys
 
@@ -78,36 +79,251 @@ _DOLLAR = re.compile(r"\$(\d+)", re.DOTALL)
 _CONDITIONAL = re.compile(r"\(\?(\d+):", re.DOTALL)
 
 
+def _one_char_case_change(match):
+    """Replaces one character case changes."""
+    if match.group(1)[0] == 'u':
+        return match.group(1)[-1].upper()
+    else:
+        return match.group(1)[-1].lower()
+
+
+def _multi_char_case_change(match):
+    """Replaces multi character case changes."""
+    if match.group(1)[0] == 'U':
+        return match.group(1)[1:].upper()
+    else:
+        return match.group(1)[1:].lower()
+
+
+# Node types of a parsed replacement, see _parse_replacement(). Plain text is
+# a str.
+_GROUP = 0  # (_GROUP, number)
+_ESCAPED = 1  # (_ESCAPED, text), not affected by a one character case switch
+_CASE_SWITCH = 2  # (_CASE_SWITCH, upper)
+_CASE_FOLDING = 3  # (_CASE_FOLDING, upper, nodes)
+_CONDITIONAL_NODE = 4  # (_CONDITIONAL_NODE, number, if_nodes, else_nodes)
+
+_GROUP_AT = re.compile(r"\$(\d+)")
+_CONDITIONAL_AT = re.compile(r"\(\?(\d+):")
+_WHITESPACE = {'n': '\n', 't': '\t', 'r': '\r', 'a': '\a', 'b': '\b'}
+
+
+class _Unsupported(Exception):
+
+    """The replacement uses its syntax in a way that only replacing it as a
+    string gets right."""
+
+
+def _ends_with_paren(nodes):
+    """True if the parsed 'nodes' end with the text '('."""
+    if not nodes:
+        return False
+    if isinstance(nodes[-1], str):
+        return nodes[-1][-1] == '('
+    return nodes[-1][0] == _ESCAPED and nodes[-1][1] == '('
+
+
+def _parse_replacement(text, pos, num_groups, in_conditional, after_paren):
+    """Parses the replacement 'text' from 'pos' on until its end or, if
+    'in_conditional', the end of an argument of a conditional.
+
+    Returns the nodes, the position after them and whether a '?' would
+    follow a '(' there, which could start a conditional when the text is
+    replaced as a string. Raises _Unsupported for anything that replacing
+    the text as a string, see _CleverReplace._replace_text(), does not
+    treat the same way.
+
+    """
+    nodes = []
+    while pos < len(text):
+        char = text[pos]
+        if in_conditional and char in ':)':
+            break
+        group = _GROUP_AT.match(text, pos)
+        if group:
+            if int(group.group(1)) > num_groups:
+                raise _Unsupported()
+            nodes.append((_GROUP, int(group.group(1))))
+            pos = group.end()
+            continue
+        conditional = _CONDITIONAL_AT.match(text, pos)
+        if conditional:
+            number = conditional.group(1)
+            if len(number) > 1 or int(number) > num_groups:
+                raise _Unsupported()
+            pos = conditional.end()
+            args = []
+            while True:
+                arg, pos, _ = _parse_replacement(
+                    text, pos, num_groups, True, after_paren)
+                if _ends_with_paren(arg):
+                    raise _Unsupported()
+                args.append(arg)
+                if pos == len(text):
+                    raise _Unsupported()
+                pos += 1
+                if text[pos - 1] == ')':
+                    break
+            nodes.append((_CONDITIONAL_NODE, int(number), args[0],
+                          args[1] if len(args) > 1 else []))
+            continue
+        if char == '\\' and pos + 1 < len(text):
+            escaped = text[pos + 1]
+            follower = text[pos + 2:pos + 3]
+            if escaped in 'ul':
+                if not _GROUP_AT.match(text, pos + 2) and (
+                        not follower or follower in '\\():?$'):
+                    raise _Unsupported()
+                nodes.append((_CASE_SWITCH, escaped == 'u'))
+                pos += 2
+                continue
+            if escaped in 'UL':
+                end = text.find('\\E', pos + 2)
+                if (in_conditional or end < 0 or
+                        '\\' in text[pos + 2:end]):
+                    raise _Unsupported()
+                folded, _, after_paren = _parse_replacement(
+                    text[:end], pos + 2, num_groups, False, after_paren)
+                nodes.append((_CASE_FOLDING, escaped == 'U', folded))
+                pos = end + 2
+                continue
+            if escaped == '\\' and (
+                    in_conditional or follower in '\\ulULEntrab$(' and
+                    follower):
+                raise _Unsupported()
+            if (escaped == '$' and follower.isdigit() or
+                    escaped == '(' and follower == '?'):
+                raise _Unsupported()
+            if not in_conditional:
+                escaped = _WHITESPACE.get(escaped, escaped)
+            nodes.append((_ESCAPED, escaped))
+            # Conditionals are found before escapes are removed.
+            after_paren = escaped == '('
+            pos += 2
+            continue
+        if char == '(' and in_conditional:
+            raise _Unsupported()
+        if char == '?' and after_paren:
+            raise _Unsupported()
+        after_paren = char == '('
+        if nodes and isinstance(nodes[-1], str):
+            nodes[-1] += char
+        else:
+            nodes.append(char)
+        pos += 1
+    return nodes, pos, after_paren
+
+
+class _Fallback(Exception):
+
+    """The text of a group would be read as replacement syntax when the
+    replacement is replaced as a string."""
+
+
+def _group_text(match, number, in_conditional):
+    """Returns the text of the group 'number' of 'match'."""
+    text = match.group(number) or ''
+    if ('\\' in text or '(' in text or ')' in text or text[:1] == '?' or
+            in_conditional and ':' in text):
+        raise _Fallback()
+    return text
+
+
+def _check_groups(nodes, match):
+    """Checks the groups in the conditional argument 'nodes' that is not
+    taken, their text still decides how the arguments are split."""
+    for node in nodes:
+        if isinstance(node, str) or node[0] in (_ESCAPED, _CASE_SWITCH):
+            continue
+        if node[0] == _GROUP:
+            _group_text(match, node[1], True)
+        elif node[0] == _CASE_FOLDING:
+            _check_groups(node[2], match)
+        else:
+            _check_groups(node[2], match)
+            _check_groups(node[3], match)
+
+
+def _evaluate(nodes, match, out, in_conditional):
+    """Appends the text of the parsed replacement 'nodes' for 'match' to
+    'out'."""
+    case_switch = None
+    for node in nodes:
+        if isinstance(node, str):
+            text = node
+        elif node[0] == _GROUP:
+            text = _group_text(match, node[1], in_conditional)
+        elif case_switch is not None:
+            raise _Fallback()
+        elif node[0] == _ESCAPED:
+            text = node[1]
+        elif node[0] == _CASE_SWITCH:
+            case_switch = node[1]
+            continue
+        elif node[0] == _CASE_FOLDING:
+            folded = []
+            _evaluate(node[2], match, folded, in_conditional)
+            text = ''.join(folded)
+            text = text.upper() if node[1] else text.lower()
+        else:
+            if match.group(node[1]):
+                taken, not_taken = node[2], node[3]
+            else:
+                taken, not_taken = node[3], node[2]
+            _check_groups(not_taken, match)
+            _evaluate(taken, match, out, True)
+            continue
+        if case_switch is not None and text:
+            text = (text[0].upper() if case_switch else
+                    text[0].lower()) + text[1:]
+            case_switch = None
+        out.append(text)
+    if case_switch is not None:
+        raise _Fallback()
+
+
 class _CleverReplace(object):
 
-    """Mimics TextMates replace syntax."""
+    """Mimics TextMates replace syntax.
+
+    The expression is parsed once into text, group references, case switches,
+    case foldings and conditionals, which are evaluated for each match.
+    Expressions that use the syntax in ways the parser does not mirror, and
+    matches whose groups contain text that would be read as syntax, are
+    replaced as a string like before, applying the syntax after the groups
+    have been filled in.
 
-    def __init__(self, expression):
+    """
+
+    def __init__(self, expression, num_groups):
         self._expression = expression
+        try:
+            self._nodes = _parse_replacement(
+                expression, 0, num_groups, False, False)[0]
+        except _Unsupported:
+            self._nodes = None
 
     def replace(self, match):
         """Replaces 'match' through the correct replacement string."""
-        transformed = self._expression
+        if self._nodes is not None:
+            out = []
+            try:
+                _evaluate(self._nodes, match, out, False)
+                return ''.join(out)
+            except _Fallback:
+                pass
+        return self._replace_text(match)
+
+    def _replace_text(self, match):
+        """Replaces 'match' by filling the groups into the expression and
+        then applying the rest of the syntax."""
         # Replace all $? with capture groups
         transformed = _DOLLAR.subn(
-            lambda m: match.group(int(m.group(1))), transformed)[0]
+            lambda m: match.group(int(m.group(1))) or '', self._expression)[0]
 
         # Replace Case switches
-        def _one_char_case_change(match):
-            """Replaces one character case changes."""
-            if match.group(1)[0] == 'u':
-                return match.group(1)[-1].upper()
-            else:
-                return match.group(1)[-1].lower()
         transformed = _ONE_CHAR_CASE_SWITCH.subn(
             _one_char_case_change, transformed)[0]
-
-        def _multi_char_case_change(match):
-            """Replaces multi character case changes."""
-            if match.group(1)[0] == 'U':
-                return match.group(1)[1:].upper()
-            else:
-                return match.group(1)[1:].lower()
         transformed = _LONG_CASEFOLDINGS.subn(
             _multi_char_case_change, transformed)[0]
         transformed = _replace_conditional(match, transformed)
@@ -116,6 +332,67 @@ class _CleverReplace(object):
 # flag used to display only one time the lack of unidecode
 UNIDECODE_ALERT_RAISED = False
 
+# The unidecode function once it was imported, see _to_ascii().
+_unidecode = []
+
+
+def _to_ascii(text):
+    """Converts 'text' to ascii with unidecode if it is installed."""
+    global UNIDECODE_ALERT_RAISED  # pylint:disable=global-statement
+    if not _unidecode:
+        try:
+            import unidecode
+            _unidecode.append(unidecode.unidecode)
+        except Exception:  # pylint:disable=broad-except
+            if UNIDECODE_ALERT_RAISED == False:
+                UNIDECODE_ALERT_RAISED = True
+                sys.stderr.write(
+                    'Please install unidecode python package in order to '
+                    'be able to make ascii conversions.\n')
+            return text
+    return _unidecode[0](text)
+
+
+class _CompiledTransformation(object):
+
+    """A transformation compiled from its search, replace and options."""
+
+    def __init__(self, search, replace, options):
+        flags = 0
+        self.match_this_many = 1
+        self.convert_to_ascii = False
+        if options:
+            if 'g' in options:
+                self.match_this_many = 0
+            if 'i' in options:
+                flags |= re.IGNORECASE
+            if 'm' in options:
+                flags |= re.MULTILINE
+            if 'a' in options:
+                self.convert_to_ascii = True
+
+        self.find = re.compile(search, flags | re.DOTALL)
+        self.replace = _CleverReplace(replace, self.find.groups).replace
+
+
+# Number of compiled transformations shared by all text objects.
+_COMPILED_CACHE_SIZE = 256
+
+_compiled = OrderedDict()
+
+
+def _compile(search, replace, options):
+    """Returns the _CompiledTransformation for the arguments, compiling it
+    only the first time."""
+    key = (search, replace, options)
+    compiled = _compiled.pop(key, None)
+    if compiled is None:
+        compiled = _CompiledTransformation(search, replace, options)
+        if len(_compiled) >= _COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    _compiled[key] = compiled
+    return compiled
+
 
 class TextObjectTransformation(object):
 
@@ -124,42 +401,22 @@ class TextObjectTransformation(object):
     def __init__(self, token):
         self._convert_to_ascii = False
 
-        self._find = None
+        self._compiled = None
         if token.search is None:
             return
 
-        flags = 0
-        self._match_this_many = 1
-        if token.options:
-            if 'g' in token.options:
-                self._match_this_many = 0
-            if 'i' in token.options:
-                flags |= re.IGNORECASE
-            if 'm' in token.options:
-                flags |= re.MULTILINE
-            if 'a' in token.options:
-                self._convert_to_ascii = True
-
-        self._find = re.compile(token.search, flags | re.DOTALL)
-        self._replace = _CleverReplace(token.replace)
+        self._compiled = _compile(token.search, token.replace, token.options)
+        self._convert_to_ascii = self._compiled.convert_to_ascii
 
     def _transform(self, text):
         """Do the actual transform on the given text."""
-        global UNIDECODE_ALERT_RAISED  # pylint:disable=global-statement
         if self._convert_to_ascii:
-            try:
-                import unidecode
-                text = unidecode.unidecode(text)
-            except Exception:  # pylint:disable=broad-except
-                if UNIDECODE_ALERT_RAISED == False:
-                    UNIDECODE_ALERT_RAISED = True
-                    sys.stderr.write(
-                        'Please install unidecode python package in order to '
-                        'be able to make ascii conversions.\n')
-        if self._find is None:
+            text = _to_ascii(text)
+        if self._compiled is None:
             return text
-        return self._find.subn(
-            self._replace.replace, text, self._match_this_many)[0]
+        return self._compiled.find.subn(
+            self._compiled.replace, text,
+            self._compiled.match_this_many)[0]
 
 
 class Transformation(Mirror, TextObjectTransformation):
@@ -3,8 +3,64 @@
 
 """Implements `!v ` VimL interpolation."""
 
+import re
+import time
+
 from UltiSnips import _vim
+from UltiSnips.compatibility import as_unicode
 from UltiSnips.text_objects._base import NoneditableTextObject
+from UltiSnips.text_objects._watchdog import interpolation_location, timed
+
+# Vim functions that neither look at the text or the cursor of the buffer nor
+# call other functions or commands.
+_INDEPENDENT_FUNCTIONS = frozenset([
+    'abs', 'and', 'char2nr', 'count', 'empty', 'escape', 'exists', 'expand',
+    'float2nr', 'fnameescape', 'fnamemodify', 'get', 'getenv', 'has',
+    'has_key', 'hostname', 'index', 'join', 'keys', 'len', 'localtime',
+    'match', 'matchend', 'matchlist', 'matchstr', 'max', 'min', 'nr2char',
+    'or', 'printf', 'range', 'repeat', 'reverse', 'round', 'split',
+    'str2nr', 'strcharpart', 'strchars', 'strftime', 'stridx', 'string',
+    'strlen', 'strpart', 'strridx', 'strtrans', 'strwidth', 'substitute',
+    'tolower', 'toupper', 'tr', 'trim', 'type', 'values', 'xor',
+])
+
+_STRING = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:[^\']|\'\')*\'')
+_CALL = re.compile(r'([\w:#.]+)\s*\(')
+# expand() looks at the cursor for anything but the name of a file, e.g.
+# '<cword>'.
+_EXPAND_AT_CURSOR = re.compile(r'\bexpand\s*\(\s*(?!["\'][%#])')
+
+
+def is_independent(code):
+    """True if the VimL expression 'code' only calls functions that cannot
+    see the text or the cursor of the buffer, so that its value does not
+    depend on whether the text objects before it were updated already."""
+    if _EXPAND_AT_CURSOR.search(code):
+        return False
+    strings = _STRING.findall(code)
+    # substitute() evaluates replacements starting with '\='.
+    if any('\\=' in string for string in strings):
+        return False
+    return all(name in _INDEPENDENT_FUNCTIONS
+               for name in _CALL.findall(_STRING.sub('""', code)))
+
+
+def evaluate_together(viml_codes):
+    """Evaluates the expressions of all 'viml_codes' that are independent in a
+    single call to Vim. The values are inserted when the codes are updated
+    next, the others are evaluated then."""
+    # pylint:disable=protected-access
+    viml_codes = [viml_code for viml_code in viml_codes
+                  if viml_code._independent]
+    if len(viml_codes) < 2:
+        return
+    start = time.time()
+    values = _vim.eval('[%s]' % ', '.join(
+        '(%s)' % viml_code._code for viml_code in viml_codes))
+    seconds = (time.time() - start) / len(viml_codes)
+    for viml_code, value in zip(viml_codes, values):
+        viml_code._value = as_unicode(value)
+        viml_code._prefetch_seconds = seconds
 
 
 class VimLCode(NoneditableTextObject):
@@ -13,9 +69,17 @@ class VimLCode(NoneditableTextObject):
 
     def __init__(self, parent, token):
         self._code = token.code.replace('\\`', '`').strip()
+        self._independent = is_independent(self._code)
+        self._value = None
+        self._location = interpolation_location(parent, token)
+        self._prefetch_seconds = 0.0
 
         NoneditableTextObject.__init__(self, parent, token)
 
+    @timed
     def _update(self, done):
-        self.overwrite(_vim.eval(self._code))
+        value, self._value = self._value, None
+        if value is None:
+            value = _vim.eval(self._code)
+        self.overwrite(value)
         return True
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Keeps slow interpolation code from blocking typing.
+
+The time spent in the python, shell and VimL interpolations is added up for
+every update of a snippet. If it exceeds g:UltiSnipsInterpolationBudget, the
+snippet is degraded: interpolations that already ran are not evaluated again
+while typing, only after the next jump.
+
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+import time
+
+from UltiSnips.compiled_code import code_filename
+
+# Location of an interpolation -> {'count': how often it was the slowest
+# interpolation of a snippet that exceeded its budget, 'seconds': its longest
+# run in that case}.
+slow_interpolations = {}
+
+# The updates that are running, innermost last.
+_cycles = []
+
+
+class _Cycle(object):
+
+    """The interpolation time of one update."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_location = None
+
+    def add(self, location, seconds):
+        """Adds 'seconds' spent in the interpolation at 'location'."""
+        self.seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_location = location
+
+
+@contextmanager
+def measure():
+    """Yields a _Cycle that adds up the time of all interpolations updated
+    in the block."""
+    cycle = _Cycle()
+    _cycles.append(cycle)
+    try:
+        yield cycle
+    finally:
+        _cycles.pop()
+
+
+def report(cycle):
+    """Remembers the slowest interpolation of 'cycle', which exceeded its
+    budget."""
+    stats = slow_interpolations.setdefault(
+        cycle.slowest_location, {'count': 0, 'seconds': 0.0})
+    stats['count'] += 1
+    stats['seconds'] = max(stats['seconds'], cycle.slowest_seconds)
+
+
+def interpolation_location(parent, token):
+    """Returns 'file:line' of the interpolation 'token' inside 'parent'."""
+    snippet = parent
+    while snippet is not None and getattr(snippet, 'snippet', None) is None:
+        snippet = snippet._parent  # pylint:disable=protected-access
+    location = snippet.snippet.location if snippet is not None else ''
+    return code_filename(location, token.start.line + 1)
+
+
+def is_due(text_object):
+    """False if 'text_object' ran before and its snippet is degraded."""
+    if not getattr(text_object, '_interpolated', False):
+        return True
+    root = text_object
+    while root._parent is not None:  # pylint:disable=protected-access
+        root = root._parent  # pylint:disable=protected-access
+    return not getattr(root, 'degraded', False)
+
+
+def timed(update):
+    """Decorates the _update() of an interpolation.
+
+    The time it takes, plus the time spent computing its result ahead of the
+    update ('_prefetch_seconds'), is added to the running update. The
+    decorated object needs a '_location'.
+
+    """
+    @wraps(update)
+    def wrapper(self, done):
+        if not is_due(self):
+            return True
+        start = time.time()
+        try:
+            return update(self, done)
+        finally:
+            self._interpolated = True
+            seconds = time.time() - start + self._prefetch_seconds
+            self._prefetch_seconds = 0.0
+            if _cycles:
+                _cycles[-1].add(self._location, seconds)
+    return wrapper
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import os
+import platform
+import shutil
+import tempfile
+import time
+import unittest
+
+import _shell_code
+from _shell_code import run_concurrently, run_shell_code
+
+# Appends a line to the file 'runs' and prints how many lines it has.
+_COUNT_RUNS = 'echo run >> runs; wc -l < runs | tr -d " "'
+
+
+class _ShellTest(unittest.TestCase):
+
+    def setUp(self):
+        if platform.system() == 'Windows':
+            self.skipTest('Does not work on Windows.')
+        self.old_cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        _shell_code._memo.clear()
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.directory)
+        _shell_code._memo.clear()
+
+
+class TestRunShellCode(_ShellTest):
+
+    def test_output(self):
+        self.assertEqual('hallo', run_shell_code('echo hallo'))
+
+    def test_only_last_newline_is_removed(self):
+        self.assertEqual('a\n', run_shell_code('printf "a\\n\\n"'))
+
+    def test_plain_code_does_not_need_a_tmp_directory(self):
+        old_tmpdir = _shell_code._tmpdir
+        _shell_code._tmpdir = None
+        try:
+            self.assertEqual('hallo', run_shell_code('echo hallo'))
+            self.assertEqual(None, _shell_code._tmpdir)
+        finally:
+            _shell_code._tmpdir = old_tmpdir
+
+    def test_shebang(self):
+        self.assertEqual('hallo', run_shell_code('#!/bin/sh\necho hallo'))
+
+    def test_not_memorized_by_default(self):
+        self.assertEqual('1', run_shell_code(_COUNT_RUNS))
+        self.assertEqual('2', run_shell_code(_COUNT_RUNS))
+
+
+class TestMemo(_ShellTest):
+
+    def test_reused(self):
+        self.assertEqual('1', run_shell_code(_COUNT_RUNS, 60))
+        self.assertEqual('1', run_shell_code(_COUNT_RUNS, 60))
+
+    def test_expired(self):
+        self.assertEqual('1', run_shell_code(_COUNT_RUNS, 60))
+        key = (_COUNT_RUNS, os.getcwd())
+        _shell_code._memo[key] = (time.time() - 61, _shell_code._memo[key][1])
+        self.assertEqual('2', run_shell_code(_COUNT_RUNS, 60))
+
+    def test_keyed_by_working_directory(self):
+        self.assertEqual('1', run_shell_code(_COUNT_RUNS, 60))
+        os.mkdir('other')
+        os.chdir('other')
+        self.assertEqual('1', run_shell_code(_COUNT_RUNS, 60))
+        os.chdir(self.directory)
+        self.assertEqual('1', run_shell_code(_COUNT_RUNS, 60))
+
+
+def _is_running(pid):
+    """True if the process 'pid' exists and is not a zombie."""
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    try:
+        with open('/proc/%i/stat' % pid) as stat:
+            return stat.read().split(')')[-1].split()[0] != 'Z'
+    except IOError:
+        return True
+
+
+class TestTimeout(_ShellTest):
+
+    def test_killed(self):
+        start = time.time()
+        self.assertEqual('Shell command timed out after 0.2 seconds',
+                         run_shell_code('sleep 10', 0, 0.2))
+        self.assertTrue(time.time() - start < 5)
+
+    def test_children_are_killed(self):
+        run_shell_code('sleep 10 & echo $! > pid; wait', 0, 0.2)
+        with open('pid') as pid_file:
+            pid = int(pid_file.read())
+        deadline = time.time() + 5
+        while _is_running(pid) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(_is_running(pid))
+
+    def test_fast_command_is_not_killed(self):
+        self.assertEqual('hallo', run_shell_code('echo hallo', 0, 10))
+
+    def test_timed_out_output_is_memorized(self):
+        run_shell_code('sleep 10', 60, 0.2)
+        self.assertEqual('Shell command timed out after 0.2 seconds',
+                         run_shell_code('sleep 10', 60, 0.2))
+
+
+class _ShellCode(object):
+
+    def __init__(self, code, output=None):
+        self._code = code
+        self._output = output
+        self._prefetch_seconds = 0.0
+
+    def _args(self):
+        return (self._code, 0, 0)
+
+
+class TestRunConcurrently(_ShellTest):
+
+    def test_outputs_in_order(self):
+        shell_codes = [_ShellCode('sleep 0.%i; echo %i' % (3 - i, i))
+                       for i in range(3)]
+        run_concurrently(shell_codes)
+        self.assertEqual(['0', '1', '2'],
+                         [shell_code._output for shell_code in shell_codes])
+
+    def test_runs_at_the_same_time(self):
+        shell_codes = [_ShellCode('sleep 0.5; echo %i' % i) for i in range(4)]
+        start = time.time()
+        run_concurrently(shell_codes)
+        self.assertTrue(time.time() - start < 1.5)
+        for shell_code in shell_codes:
+            self.assertTrue(shell_code._prefetch_seconds >= 0.4)
+
+    def test_only_pending_codes_run(self):
+        shell_codes = [_ShellCode(_COUNT_RUNS, 'done'),
+                       _ShellCode(_COUNT_RUNS), _ShellCode('echo hallo')]
+        run_concurrently(shell_codes)
+        self.assertEqual(['done', '1', 'hallo'],
+                         [shell_code._output for shell_code in shell_codes])
+
+    def test_single_code_runs_in_its_update(self):
+        shell_codes = [_ShellCode(_COUNT_RUNS, 'done'), _ShellCode('echo a')]
+        run_concurrently(shell_codes)
+        self.assertEqual(None, shell_codes[1]._output)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import re
+import unittest
+
+import _transformation
+from _transformation import _compile, _COMPILED_CACHE_SIZE, \
+    _ONE_CHAR_CASE_SWITCH, _LONG_CASEFOLDINGS, _DOLLAR, \
+    _one_char_case_change, _multi_char_case_change, _replace_conditional
+from UltiSnips.text import unescape, fill_in_whitespace
+
+
+def _transform_uncompiled(search, replace, options, text):
+    """The transformation as it was before it was compiled: the replacement
+    is parsed again for every match."""
+    flags = 0
+    count = 1
+    if 'g' in options:
+        count = 0
+    if 'i' in options:
+        flags |= re.IGNORECASE
+    if 'm' in options:
+        flags |= re.MULTILINE
+
+    def _replace(match):
+        transformed = _DOLLAR.subn(
+            lambda m: match.group(int(m.group(1))), replace)[0]
+        transformed = _ONE_CHAR_CASE_SWITCH.subn(
+            _one_char_case_change, transformed)[0]
+        transformed = _LONG_CASEFOLDINGS.subn(
+            _multi_char_case_change, transformed)[0]
+        transformed = _replace_conditional(match, transformed)
+        return unescape(fill_in_whitespace(transformed))
+    return re.compile(search, flags | re.DOTALL).subn(
+        _replace, text, count)[0]
+
+
+def _transform(search, replace, options, text):
+    compiled = _compile(search, replace, options)
+    return compiled.find.subn(compiled.replace, text,
+                              compiled.match_this_many)[0]
+
+
+# (search, replace, options, texts)
+_CASES = [
+    ('.*', 'a$0b', '', ['', 'hallo', 'two\nlines']),
+    ('(.)(.)', '$2$1$2', '', ['ab', 'abcd', 'a']),
+    ('(\\w+)', '\\u$1', 'g', ['hallo welt', '']),
+    ('(\\w+)', '\\l$1', '', ['HALLO']),
+    ('(\\w+)', '\\U$1\\E!', '', ['hallo welt']),
+    ('(\\w+)', '\\L$1\\E!', 'g', ['HALLO WELT']),
+    ('(\\w+)', '\\U$1\\E \\u\\L$1\\E', '', ['mIxEd']),
+    ('(a)|b', '(?1:yes:no)', 'g', ['ab', 'ba', 'c']),
+    ('(a)|b', '(?1:yes)', 'g', ['ab', 'ba']),
+    ('(a)?(b)?', '(?1:(?2:both:a):(?2:b:none))', '', ['ab', 'a', 'b', 'c']),
+    ('(a)', '(?1:\\(x\\):y)', '', ['a']),
+    ('(a)', '(?1:x\\:y:z)', '', ['a']),
+    ('(a)', '(?1:x\\\\:y)', '', ['a']),
+    ('(\\w+)', '$1\\n\\t$1', '', ['hallo']),
+    ('a', 'b', 'i', ['AaA']),
+    ('a', 'b', 'gi', ['AaA']),
+    ('^a', 'b', 'gm', ['a\na\nca']),
+    ('a', 'aa', 'g', ['aaa']),
+    ('(.*)', '[$1]', '', ['back\\slash', '(?1:cond)', '\\u']),
+    ('(a)?(b)?(.*)', '(?1:x:$3)', 'g', ['ab', 'b:c', 'a(b)', 'x\\n']),
+    ('(a)?(b)?(.*)', '(?2:a$3)\\E', '', [':a\\n', 'b:', '?x']),
+    ('(a)?(.*)', ' \\u(?1:$2 )E', 'g', [':E', 'aE', 'a?']),
+]
+
+
+class TestCompiledTransformation(unittest.TestCase):
+
+    def test_same_as_uncompiled(self):
+        for search, replace, options, texts in _CASES:
+            for text in texts:
+                self.assertEqual(
+                    _transform_uncompiled(search, replace, options, text),
+                    _transform(search, replace, options, text),
+                    (search, replace, options, text))
+
+    def test_same_when_reused(self):
+        for search, replace, options, texts in _CASES:
+            for text in texts + texts:
+                self.assertEqual(
+                    _transform_uncompiled(search, replace, options, text),
+                    _transform(search, replace, options, text))
+
+    def test_parsed_once(self):
+        for replace in ('$1', '\\u$1 \\U$2\\E', '(?1:yes:no)',
+                        '(?1:(?2:both:a):$2)\\n'):
+            self.assertTrue(
+                _compile('(a)(b)', replace, '').replace.__self__._nodes is not None,
+                replace)
+
+    def test_unmatched_group_is_empty(self):
+        self.assertEqual('[]', _transform('(a)?b', '[$1]', '', 'b'))
+
+    def test_options(self):
+        compiled = _compile('a', 'b', 'gima')
+        self.assertEqual(0, compiled.match_this_many)
+        self.assertTrue(compiled.convert_to_ascii)
+        self.assertTrue(compiled.find.flags & re.IGNORECASE)
+        self.assertTrue(compiled.find.flags & re.MULTILINE)
+        compiled = _compile('a', 'b', '')
+        self.assertEqual(1, compiled.match_this_many)
+        self.assertFalse(compiled.convert_to_ascii)
+
+
+class TestCompileCache(unittest.TestCase):
+
+    def setUp(self):
+        _transformation._compiled.clear()
+
+    def tearDown(self):
+        _transformation._compiled.clear()
+
+    def test_compiled_once(self):
+        self.assertTrue(_compile('a', 'b', 'g') is _compile('a', 'b', 'g'))
+
+    def test_keyed_by_all_arguments(self):
+        compiled = _compile('a', 'b', 'g')
+        self.assertFalse(compiled is _compile('a', 'b', ''))
+        self.assertFalse(compiled is _compile('a', 'c', 'g'))
+        self.assertFalse(compiled is _compile('b', 'b', 'g'))
+
+    def test_least_recently_used_is_dropped(self):
+        first = _compile('0', '', '')
+        second = _compile('1', '', '')
+        for index in range(2, _COMPILED_CACHE_SIZE):
+            _compile(str(index), '', '')
+        self.assertTrue(first is _compile('0', '', ''))
+        _compile('new', '', '')
+        self.assertEqual(_COMPILED_CACHE_SIZE, len(_transformation._compiled))
+        self.assertTrue(first is _compile('0', '', ''))
+        self.assertFalse(second is _compile('1', '', ''))
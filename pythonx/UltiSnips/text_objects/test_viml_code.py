@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# pylint: skip-file
+
+import unittest
+
+from _viml_code import is_independent
+
+
+class TestIsIndependent(unittest.TestCase):
+
+    def test_independent(self):
+        for code in ['1 + 1', '"a" . "b"', 'g:ulti_test', '&shiftwidth',
+                     'strftime("%Y")', 'toupper(expand("%:t"))',
+                     "'it''s'", '"getline(1)"', '"abc"->toupper()',
+                     'substitute(g:x, "a", "b", "g")']:
+            self.assertTrue(is_independent(code), code)
+
+    def test_sees_buffer(self):
+        for code in ["getline('.')", "col('.')", 'line(".")', 'indent(".")',
+                     'toupper(getline(1))', 'expand("<cword>")',
+                     'expand(g:pattern)', 'MyFunction()', 's:Func()',
+                     'foo#bar()', 'execute("echo 1")',
+                     'substitute(g:x, "a", "\\=getline(1)", "")',
+                     '"it\'s" . getline(1)', "'a''b' . getline(1)"]:
+            self.assertFalse(is_independent(code), code)
+
+
+if __name__ == '__main__':
+    unittest.main()
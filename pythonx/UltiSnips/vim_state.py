@@ -6,6 +6,8 @@
 from collections import deque, namedtuple
 
 from UltiSnips import _vim
+from UltiSnips._change_tracker import ChangeTracker
+from UltiSnips._native_mark import NativeMark
 from UltiSnips.compatibility import as_unicode, byte2col
 from UltiSnips.position import Position
 
@@ -35,6 +37,9 @@ class VimState(object):
     def __init__(self):
         self._poss = deque(maxlen=5)
         self._lvb = None
+        self._lvb_tick = None
+        self._changes = ChangeTracker()
+        self._start_mark = NativeMark()
 
         self._text_to_expect = ''
         self._unnamed_reg_cached = False
@@ -78,8 +83,43 @@ class VimState(object):
         """Remember the content of the buffer and the position."""
         self._lvb = _vim.buf[to.start.line:to.end.line + 1]
         self._lvb_len = len(_vim.buf)
+        self._lvb_tick = _vim.eval('[bufnr("%"), b:changedtick]')
+        self._changes.start(_vim.buf.number)
+        self._start_mark.place(_vim.buf.number, to.start.line)
         self.remember_position()
 
+    def forget_buffer(self):
+        """Stops tracking the changes to the remembered buffer."""
+        self._changes.stop()
+        self._start_mark.remove()
+
+    def lines_moved(self):
+        """Returns by how many lines the editor moved the start of the
+        remembered snippet, or None if this is unknown."""
+        return self._start_mark.lines_moved(_vim.buf.number)
+
+    def follow_lines_moved(self, start, lines):
+        """Accepts that the lines from 'start' on of the remembered buffer
+        moved by 'lines', because lines above them were added or
+        removed."""
+        self._lvb_len += lines
+        if self.ppos.line >= start:
+            self.ppos.line += lines
+
+    def changed_lines(self):
+        """Returns the (first, last, new_last) range of lines that changed
+        since the buffer was remembered, with 'last' in the remembered and
+        'new_last' in the current buffer. Returns () if nothing changed and
+        None if this is unknown."""
+        return self._changes.changed_lines(_vim.buf.number)
+
+    def buffer_changed(self):
+        """True if the buffer might have changed since it was remembered,
+        that is another buffer is current or its b:changedtick is
+        different."""
+        return (self._lvb_tick is None or
+                self._lvb_tick != _vim.eval('[bufnr("%"), b:changedtick]'))
+
     @property
     def diff_in_buffer_length(self):
         """Returns the difference in the length of the current buffer compared
@@ -1,4 +1,5 @@
 from test.constant import *
+from test.util import insert_python_value
 from test.vim_test_case import VimTestCase as _VimTest
 
 
@@ -196,3 +197,49 @@ class ContextSnippets_Header_DoNotExpandOnFalse(_VimTest):
         """}
     keys = 'a' + EX
     wanted = keys
+
+
+# Looks up the snippets for 't' twice with the same buffer and cursor and
+# inserts the number of matches, hits and misses of the context cache.
+_LOOKUP_TWICE = (
+    insert_python_value(
+        'str([len(UltiSnips_Manager._snips("t", False)) for _ in range(2)])') +
+    ' \x12=UltiSnips#ContextCacheStats().hits\n' +
+    ' \x12=UltiSnips#ContextCacheStats().misses\n')
+
+
+class ContextSnippets_CachedForSameState(_VimTest):
+    files = { 'us/all.snippets': r"""
+        snippet t "desc" "True" e
+        abc
+        endsnippet
+        """}
+    keys = _LOOKUP_TWICE
+    wanted = '[1, 1] 1 1'
+
+
+class ContextSnippets_NotCachedWithOptionU(_VimTest):
+    files = { 'us/all.snippets': r"""
+        snippet t "desc" "True" eu
+        abc
+        endsnippet
+        """}
+    keys = _LOOKUP_TWICE
+    wanted = '[1, 1] 0 2'
+
+
+class ContextSnippets_NotCachedIfDisabled(ContextSnippets_CachedForSameState):
+    wanted = '[1, 1] 0 2'
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsContextCache=0')
+
+
+class ContextSnippets_NotCachedAfterChange(_VimTest):
+    files = { 'us/all.snippets': r"""
+        snippet t "desc" "snip.line >= 0" e
+        abc
+        endsnippet
+        """}
+    keys = 't' + EX + ' t' + EX + ' \x12=UltiSnips#ContextCacheStats().hits\n'
+    wanted = 'abc abc 0'
@@ -71,3 +71,36 @@ class SimpleExpandEndingWithNewline_ExpectCorrectResult(_VimTest):
 
 
 # End: Simple Expands  #}}}
+# Remembered Lookups  {{{#
+
+
+class RememberedLookup_SnippetAddedLater(_VimTest):
+    files = { 'us/all.snippets': r"""
+        snippet t "desc"
+        one
+        endsnippet
+        """}
+    keys = ('t' + EX + ESC +
+            ':call UltiSnips#AddSnippetWithPriority("t", "two", "", "", '
+            '"all", 1)\n' +
+            'ot' + EX)
+    wanted = 'one\ntwo'
+
+
+class RememberedLookup_IsKeywordChanged(_VimTest):
+    snippets = ('b', 'B', '', 'w')
+    keys = 'a-b' + EX + ESC + ':set iskeyword+=-\n' + 'oa-b' + EX
+    wanted = 'a-B\na-b' + EX
+
+
+class RememberedLookup_MatchIsRestored(_VimTest):
+    # The snippet matches '2x' in between, the remembered lookup for '1x'
+    # must bring back its own match.
+    files = { 'us/all.snippets': r"""
+        snippet "(\d)x" "desc" r
+        `!p snip.rv = match.group(1)`
+        endsnippet
+        """}
+    keys = '1x' + EX + '\n2x' + EX + '\n1x' + EX
+    wanted = '1\n2\n1'
+# End: Remembered Lookups  #}}}
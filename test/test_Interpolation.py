@@ -72,6 +72,28 @@ class TabStop_VimScriptInterpolation_SimpleExample(_VimTest):
     snippets = ('test', """hi `!v indent(".")` End""")
     keys = '    test' + EX
     wanted = '    hi 4 End'
+
+
+class TabStop_VimScriptInterpolation_Several(_VimTest):
+    snippets = ('test', """`!v 1 + 1` `!v "a" . "b"` `!v indent(".")`""")
+    keys = '    test' + EX
+    wanted = '    2 ab 4'
+
+
+class TabStop_VimScriptInterpolation_AfterPython(_VimTest):
+    snippets = ('test', '`!v 1` '
+                '`!p vim.command("let g:ulti_test = 5"); snip.rv = "p"` '
+                '`!v g:ulti_test`')
+    keys = 'test' + EX
+    wanted = '1 p 5'
+
+
+class TabStop_VimScriptInterpolation_SeesTextBeforeIt(_VimTest):
+    # The mirror and the first interpolation are in the line before the last
+    # interpolation reads it.
+    snippets = ('test', """${1:ab}$1`!v "x"`|`!v getline('.')`""")
+    keys = 'test' + EX
+    wanted = 'ababx|ababx|'
 # End: VimScript Interpolation  #}}}
 # PythonCode Interpolation  {{{#
 # Deprecated Implementation  {{{#
@@ -489,3 +511,46 @@ class Python_WeirdScoping_Error(_VimTest):
     wanted = 'h5b'
 # End: New Implementation  #}}}
 # End: PythonCode Interpolation  #}}}
+# Time Budget  {{{#
+
+
+class _SlowMirror(_VimTest):
+    snippets = ('test', """${1:a} `!p import time
+time.sleep(0.2)
+snip.rv = t[1]`$2""")
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsInterpolationBudget=50')
+
+
+class Budget_SlowCodeIsNotEvaluatedWhileTyping(_SlowMirror):
+    keys = 'test' + EX + 'xyz'
+    wanted = 'xyz a'
+
+
+class Budget_SlowCodeIsEvaluatedOnJump(_SlowMirror):
+    keys = 'test' + EX + 'xyz' + JF + 'b'
+    wanted = 'xyz xyzb'
+
+
+class Budget_SlowCodeIsReported(_SlowMirror):
+    keys = 'test' + EX + 'xyz' + \
+        '\x12=join(keys(UltiSnips#InterpolationStats()))\n'
+    wanted = 'xyz<added> a'
+
+
+class Budget_FastCodeIsEvaluatedWhileTyping(_SlowMirror):
+    keys = 'test' + EX + 'xyz'
+    wanted = 'xyz xyz'
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsInterpolationBudget=5000')
+
+
+class Budget_Disabled(_SlowMirror):
+    keys = 'test' + EX + 'xyz'
+    wanted = 'xyz xyz'
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsInterpolationBudget=0')
+# End: Time Budget  #}}}
@@ -81,3 +81,28 @@ class IMMoving_ExitWhenOutsideBelow_ECR(_VimTest):
         'testhallo\n'
     wanted = 'hello tab\nblub this\n' + JF + 'testhallo'
 # End: Insert Mode Moving  #}}}
+# Updates On Moving  {{{#
+
+# Counts in g:runs how often the interpolations of the snippet were updated.
+_COUNT_UPDATES = r"""${1:abc} `!p vim.command("let g:runs = get(g:, 'runs', 0) + 1")`x"""
+
+_REMEMBER_RUNS = '\x0f:let g:before = g:runs\n'
+_RAN_AGAIN = '\x0f:let g:ran = g:runs > g:before\n'
+
+
+class UpdatesOnMoving_MovingDoesNotUpdate(_VimTest):
+    snippets = ('test', _COUNT_UPDATES)
+    # Give Vim the time to handle every key press on its own.
+    sleeptime = 0.1
+    keys = 'test' + EX + 'xyz' + _REMEMBER_RUNS + 3 * ARR_L + 2 * ARR_R + \
+        _RAN_AGAIN + JF + '\x12=g:ran\n'
+    wanted = 'xyz x0'
+
+
+class UpdatesOnMoving_TypingUpdates(_VimTest):
+    snippets = ('test', _COUNT_UPDATES)
+    sleeptime = 0.1
+    keys = 'test' + EX + 'xyz' + _REMEMBER_RUNS + 3 * ARR_L + 'q' + \
+        _RAN_AGAIN + JF + '\x12=g:ran\n'
+    wanted = 'qxyz x1'
+# End: Updates On Moving  #}}}
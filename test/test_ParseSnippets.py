@@ -1,5 +1,10 @@
+import os
+import time
+
 from test.vim_test_case import VimTestCase as _VimTest
 from test.constant import *
+from test.test_Autotrigger import check_required_vim_version
+from test.util import insert_python_value, running_on_windows
 
 
 class ParseSnippets_SimpleSnippet(_VimTest):
@@ -314,3 +319,257 @@ class ParseSnippets_PrintErroneousSnippetLocation(_VimTest):
     keys = 'test' + EX
     wanted = keys
     expected_error = "Defined in: .*/all.snippets"
+
+
+class ParseSnippets_CacheDisabled(_VimTest):
+    files = { 'us/all.snippets': r"""
+        snippet testsnip "Test Snippet" b!
+        This is a test snippet!
+        endsnippet
+        """}
+    keys = 'testsnip' + EX
+    wanted = 'This is a test snippet!'
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsCacheDirectory=""')
+
+
+class _ParseSnippets_ChangedAfterLoading(_VimTest):
+    """Loads the snippets, then changes the snippet file before the keys are
+    typed."""
+    files = { 'us/all.snippets': r"""
+        snippet testsnip "Test Snippet" b
+        This is a test snippet!
+        endsnippet
+        """}
+
+    def _change_file(self, path):
+        raise NotImplementedError()
+
+    def _before_test(self):
+        self.vim.send_to_vim(':call UltiSnips#SnippetsInCurrentScope(1)\n')
+        time.sleep(0.2)
+        self._change_file(self.name_temp('us/all.snippets'))
+
+
+class ParseSnippets_TouchedAfterLoading(_ParseSnippets_ChangedAfterLoading):
+    keys = 'testsnip' + EX
+    wanted = 'This is a test snippet!'
+
+    def _change_file(self, path):
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+
+class ParseSnippets_EditedAfterLoading(_ParseSnippets_ChangedAfterLoading):
+    # Autotriggers do not check the snippet files before they expand, the
+    # body is read from the edited file.
+    skip_if = check_required_vim_version
+    files = { 'us/all.snippets': r"""
+        snippet testsnip "Test Snippet" bA
+        This is a test snippet!
+        endsnippet
+        """}
+    keys = 'testsnip'
+    wanted = 'This is the edited snippet!'
+
+    def _change_file(self, path):
+        self._create_file('us/all.snippets', r"""
+            # A new line above the snippet.
+            snippet testsnip "Test Snippet" bA
+            This is the edited snippet!
+            endsnippet
+            """)
+
+
+# What the last check of the snippet files did, as '<hashes> <reparses>'.
+_ENSURE_STATISTICS = ' '.join(insert_python_value(
+    'dict(UltiSnips_Manager._snippet_sources)["ultisnips_files"]'
+    '.ensure_statistics["%s"]' % key) for key in ('hashes', 'reparses'))
+
+
+class ParseSnippets_UnchangedIsNotHashed(_ParseSnippets_ChangedAfterLoading):
+    keys = 'testsnip' + EX + ' ' + _ENSURE_STATISTICS
+    wanted = 'This is a test snippet! 0 0'
+
+    def _change_file(self, path):
+        pass
+
+
+class ParseSnippets_TouchedIsHashedButNotReparsed(
+        _ParseSnippets_ChangedAfterLoading):
+    keys = 'testsnip' + EX + ' ' + _ENSURE_STATISTICS
+    wanted = 'This is a test snippet! 1 0'
+
+    def _change_file(self, path):
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+
+class ParseSnippets_TouchedIsReparsedWithoutHashing(
+        ParseSnippets_TouchedIsHashedButNotReparsed):
+    wanted = 'This is a test snippet! 0 1'
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsHashSnippetFiles=0')
+
+
+class ParseSnippets_EditedIsReparsed(_ParseSnippets_ChangedAfterLoading):
+    keys = 'testsnip' + EX + ' ' + _ENSURE_STATISTICS
+    wanted = 'This is the edited snippet! 1 1'
+
+    def _change_file(self, path):
+        self._create_file('us/all.snippets', r"""
+            snippet testsnip "Test Snippet" b
+            This is the edited snippet!
+            endsnippet
+            """)
+
+
+class ParseSnippets_EditedWithSameStatAfterLoading(
+        _ParseSnippets_ChangedAfterLoading):
+    keys = 'testsnip' + EX
+    wanted = 'This is the new snippet'
+
+    def _change_file(self, path):
+        stat = os.stat(path)
+        with open(path) as snippet_file:
+            content = snippet_file.read()
+        with open(path, 'w') as snippet_file:
+            snippet_file.write(content.replace(
+                'This is a test snippet!', 'This is the new snippet'))
+        if hasattr(stat, 'st_mtime_ns'):
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        else:
+            os.utime(path, (stat.st_atime, stat.st_mtime))
+
+
+# Loads the snippets for 'all' with a new source, like a new Vim session
+# would, and inserts what it did as '<cached> <reparses>'.
+_LOAD_IN_NEW_SESSION = insert_python_value(
+    '(lambda source: source.ensure(["all"], False) or '
+    '"%(cached)i %(reparses)i" % source.ensure_statistics)('
+    '__import__("UltiSnips.snippet.source", fromlist=["UltiSnipsFileSource"])'
+    '.UltiSnipsFileSource())')
+
+
+class ParseSnippets_CacheIsUsedInNewSession(_ParseSnippets_ChangedAfterLoading):
+    keys = 'testsnip' + EX + ' ' + _LOAD_IN_NEW_SESSION
+    wanted = 'This is a test snippet! 1 1'
+
+    def _change_file(self, path):
+        pass
+
+
+class ParseSnippets_CacheIsNotUsedForEditedFile(ParseSnippets_EditedIsReparsed):
+    keys = 'testsnip' + EX + ' ' + _LOAD_IN_NEW_SESSION
+    wanted = 'This is the edited snippet! 0 1'
+
+
+class ParseSnippets_CacheIsNotUsedForTouchedFile(
+        ParseSnippets_TouchedIsHashedButNotReparsed):
+    keys = 'testsnip' + EX + ' ' + _LOAD_IN_NEW_SESSION
+    wanted = 'This is a test snippet! 0 1'
+
+
+class _ParseSnippets_CacheDamaged(_ParseSnippets_ChangedAfterLoading):
+    keys = 'testsnip' + EX + ' ' + _LOAD_IN_NEW_SESSION
+    wanted = 'This is a test snippet! 0 1'
+
+    def _change_file(self, path):
+        for directory, _, filenames in os.walk(self.name_temp('cache')):
+            for filename in filenames:
+                self._damage(os.path.join(directory, filename))
+
+
+class ParseSnippets_TruncatedCacheIsNotUsed(_ParseSnippets_CacheDamaged):
+
+    def _damage(self, path):
+        with open(path, 'rb+') as cache_file:
+            cache_file.truncate(os.path.getsize(path) // 2)
+
+
+class ParseSnippets_CorruptCacheIsNotUsed(_ParseSnippets_CacheDamaged):
+
+    def _damage(self, path):
+        with open(path, 'wb') as cache_file:
+            cache_file.write(b'This is not a pickle.')
+
+
+class ParseSnippets_WatchedSymlinkTargetEdited(
+        _ParseSnippets_ChangedAfterLoading):
+    skip_if = lambda self: running_on_windows()
+    files = {}
+    keys = 'testsnip' + EX
+    wanted = 'This is the edited snippet!'
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsWatchSnippetDirectories=1')
+        target = self._create_file('real/all.snippets', r"""
+            snippet testsnip "Test Snippet" b
+            This is a test snippet!
+            endsnippet
+            """)
+        self._link_file(target, 'us')
+
+    def _change_file(self, path):
+        self._create_file('real/all.snippets', r"""
+            snippet testsnip "Test Snippet" b
+            This is the edited snippet!
+            endsnippet
+            """)
+        # Give the watcher time to report the change.
+        time.sleep(0.5)
+
+
+class _ParseSnippets_ParallelLoad(_VimTest):
+    files = {
+        'us/all.snippets': r"""
+            priority -1
+            snippet t "desc"
+            all
+            endsnippet
+
+            snippet u "desc"
+            cleared
+            endsnippet
+            """,
+        'us/all_a.snippets': r"""
+            priority 3
+            snippet t "desc"
+            all_a
+            endsnippet
+            """,
+        'us/all_b.snippets': r"""
+            priority 10
+            clearsnippets u
+            """,
+        'us/all/c.snippets': r"""
+            snippet t "desc"
+            all/c
+            endsnippet
+            """,
+    }
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsParallelLoad=4')
+
+
+class ParseSnippets_ParallelLoad_Priorities(_ParseSnippets_ParallelLoad):
+    keys = 't' + EX
+    wanted = 'all_a'
+
+
+class ParseSnippets_ParallelLoad_ClearSnippets(_ParseSnippets_ParallelLoad):
+    keys = 'u' + EX
+    wanted = 'u' + EX
+
+
+class ParseSnippets_ParallelLoad_ErrorLocation(_ParseSnippets_ParallelLoad):
+    files = dict(_ParseSnippets_ParallelLoad.files)
+    files['us/all_c.snippets'] = r"""
+        snippet x "desc"
+        """
+    keys = 't' + EX
+    wanted = keys
+    expected_error = r"Missing 'endsnippet' for 'x' in \S+all_c.snippets:3"
@@ -0,0 +1,54 @@
+import time
+
+from test.vim_test_case import VimTestCase as _VimTest
+from test.constant import *
+
+
+def check_timers(test):
+    if test.vim_flavor == 'neovim':
+        return None
+    if not test.vim.has_version(7, 4, 1578):
+        return 'Vim newer than 7.4.1578 is required'
+    return None
+
+
+# Inserts the preload state of the 'all' snippets.
+_STATUS = '\x12=get(UltiSnips#PreloadStatus(), "all", "none")\n'
+
+
+class _Preload(_VimTest):
+    skip_if = check_timers
+    files = { 'us/all.snippets': r"""
+        snippet testsnip "Test Snippet"
+        This is a test snippet!
+        endsnippet
+        """}
+
+    def _before_test(self):
+        # Let the timers do their work.
+        time.sleep(1)
+
+
+class Preload_DisabledByDefault(_Preload):
+    keys = _STATUS + ' testsnip' + EX
+    wanted = 'none This is a test snippet!'
+
+
+class Preload_LoadsInBackground(_Preload):
+    keys = _STATUS + ' testsnip' + EX
+    wanted = 'loaded This is a test snippet!'
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsPreload=1')
+
+
+class Preload_ErrorsAreNotReportedInBackground(_Preload):
+    files = { 'us/all.snippets': r"""
+        snippet testsnip "Test Snippet"
+        This is a test snippet!
+        """}
+    keys = _STATUS
+    wanted = 'failed'
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.append('let g:UltiSnipsPreload=1')
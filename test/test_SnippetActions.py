@@ -379,3 +379,71 @@ class SnippetActions_DoNotBreakCursorOnSingleLikeChange(_VimTest):
         """}
     keys = 'a' + EX + '123'
     wanted = 'def123'
+
+
+class SnippetActions_VariablesDoNotLeakIntoOtherActions(_VimTest):
+    files = { 'us/all.snippets': r"""
+        pre_expand "leaked = 1"
+        snippet a "desc"
+        A
+        endsnippet
+
+        snippet b "desc" "'leaked' not in globals()" e
+        clean
+        endsnippet
+        """}
+    keys = 'a' + EX + ' b' + EX
+    wanted = 'A clean'
+
+
+class SnippetActions_GlobalsDoNotLeakIntoOtherFiles(_VimTest):
+    files = {
+        'us/all.snippets': r"""
+            global !p
+            leaked = 1
+            endglobal
+
+            snippet a "desc"
+            A
+            endsnippet
+            """,
+        'us/all_other.snippets': r"""
+            snippet b "desc" "'leaked' not in globals()" e
+            clean
+            endsnippet
+            """}
+    keys = 'a' + EX + ' b' + EX
+    wanted = 'A clean'
+
+
+class SnippetActions_GlobalsSeeVariablesOfAction(_VimTest):
+    files = { 'us/all.snippets': r"""
+        global !p
+        def added_lines():
+            return [text]
+        endglobal
+
+        post_expand "text = 'seen'; snip.buffer[snip.line+1:snip.line+1] = added_lines()"
+        snippet a "desc"
+        abc
+        endsnippet
+        """}
+    keys = 'a' + EX
+    wanted = 'abc\nseen'
+
+
+class SnippetActions_StateOfGlobalsDoesNotOutliveEvaluation(_VimTest):
+    files = { 'us/all.snippets': r"""
+        global !p
+        calls = []
+        def first_call():
+            calls.append(1)
+            return len(calls) == 1
+        endglobal
+
+        snippet a "desc" "first_call()" e
+        A
+        endsnippet
+        """}
+    keys = 'a' + EX + ' a' + EX
+    wanted = 'A A'
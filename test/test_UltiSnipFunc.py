@@ -168,4 +168,34 @@ class MySnippetSource(SnippetSource):
         vim_config.append(
             '%s %s' %
             (pyfile, self.name_temp('snippet_source.py')))
+
+
+class SnippetSourceFillingDictionariesIsNotCached(_VimTest):
+    keys = (ESC + ':let g:ulti_body = "one"\n' +
+            'iblumba' + EX + ESC +
+            ':let g:ulti_body = "two"\n' +
+            'o' + 'blumba' + EX)
+    wanted = 'one\ntwo'
+
+    def _extra_vim_config(self, vim_config):
+        self._create_file('snippet_source.py', """
+import vim
+from UltiSnips.snippet.source import SnippetSource
+from UltiSnips.snippet.source._snippet_dictionary import SnippetDictionary
+from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
+
+class MySnippetSource(SnippetSource):
+  def ensure(self, filetypes, cached):
+    self._snippets['all'] = SnippetDictionary()
+    self._snippets['all'].add_snippet(UltiSnipsSnippetDefinition(
+        0, "blumba", vim.eval("g:ulti_body"), "", "", {}, "blub", None, {}))
+""")
+        pyfile = 'py3file' if PYTHON3 else 'pyfile'
+        vim_config.append(
+            '%s %s' %
+            (pyfile, self.name_temp('snippet_source.py')))
+        vim_config.append(
+            '%s from UltiSnips import UltiSnips_Manager; '
+            "UltiSnips_Manager.register_snippet_source('temp', "
+            'MySnippetSource())' % ('py3' if PYTHON3 else 'py'))
 # End: Snippet Source  #}}}
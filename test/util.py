@@ -1,5 +1,7 @@
 import platform
 
+from test.constant import PYTHON3
+
 try:
     import unidecode
     UNIDECODE_IMPORTED = True
@@ -15,3 +17,9 @@ def running_on_windows():
 def no_unidecode_available():
     if not UNIDECODE_IMPORTED:
         return 'unidecode is not available.'
+
+
+def insert_python_value(expr):
+    """Returns the keys that insert the value of the python expression 'expr'
+    in insert mode. 'expr' must not contain single quotes."""
+    return '\x12=%s(\'%s\')\n' % ('py3eval' if PYTHON3 else 'pyeval', expr)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Measures the cost of one keystroke with a few hundred regular expression
+autotrigger snippets, as they are common for LaTeX.
+
+Snippet definitions need Vim, so run this from the root of the repository
+inside a Vim with Python support:
+
+    vim -u NONE -N -i NONE -c 'py3file utils/benchmark_regex_triggers.py'
+
+The results are shown as messages.
+
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.getcwd(), 'pythonx'))
+
+from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
+from UltiSnips.snippet.source._snippet_dictionary import SnippetDictionary
+
+NUM_SNIPPETS = 300
+KEYSTROKES = 200
+
+# Patterns in the style of math mode snippets. The first ones end in a
+# literal character, the last ones in something that could be any
+# character.
+PATTERNS = [
+    r'(\\?\w+)mat%i',
+    r'\b(\w+)/%i',
+    r'([a-zA-Z])bar%i',
+    r'(\d+)ee%i',
+    r'([a-zA-Z]\d)%i(\d)',
+    r'\\(\w+)%i\w',
+]
+
+LINE = r'The energy is $E = mc^2 + \frac{1}{2} m v^2 + \sum_{i=1}^n x_i$'
+
+
+def make_snippets():
+    """Returns the snippets of the benchmark."""
+    return [UltiSnipsSnippetDefinition(
+        0, PATTERNS[index % len(PATTERNS)] % index, 'x', '', 'rA', {},
+        'benchmark:%i' % index, None, {}) for index in range(NUM_SNIPPETS)]
+
+
+def main():
+    snippets = make_snippets()
+    dictionary = SnippetDictionary()
+    for snippet in snippets:
+        dictionary.add_snippet(snippet)
+    befores = [LINE[:length % len(LINE) + 1] for length in range(KEYSTROKES)]
+
+    def linear():
+        for before in befores:
+            [s for s in snippets if s.matches(before)]
+
+    def indexed():
+        for before in befores:
+            dictionary.get_matching_snippets(before, False, True, None)
+
+    for before in befores:
+        assert [s for s in snippets if s.matches(before)] == \
+            dictionary.get_matching_snippets(before, False, True, None)
+
+    linear_time = min(timeit.repeat(linear, number=1, repeat=5)) / KEYSTROKES
+    indexed_time = min(timeit.repeat(indexed, number=1, repeat=5)) / KEYSTROKES
+    print('%i regex snippets: every snippet %.1f us, index %.1f us '
+          'per keystroke (%.1fx)' % (NUM_SNIPPETS, linear_time * 1e6,
+                                     indexed_time * 1e6,
+                                     linear_time / indexed_time))
+
+main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Compares serial and parallel loading of a corpus of 5,000 snippets.
+
+The snippet sources need Vim, so run this from the root of the repository
+inside a Vim with Python support:
+
+    vim -u NONE -N -i NONE -c 'py3file utils/benchmark_snippet_loading.py'
+
+The results are shown as messages. Set $ULTISNIPS_BENCH_WORKERS to change
+the number of threads used for the parallel runs (default 4).
+
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import vim
+
+sys.path.insert(0, os.path.join(os.getcwd(), 'pythonx'))
+
+from UltiSnips.snippet.source.file.ultisnips import UltiSnipsFileSource
+
+# 5 filetypes with 10 files of 100 snippets each. 'bench' extends the others.
+FILETYPES = ['bench', 'parenta', 'parentb', 'parentc', 'parentd']
+FILES_PER_FILETYPE = 10
+SNIPPETS_PER_FILE = 100
+RUNS = 5
+
+SNIPPET = '''snippet %(trigger)s "Snippet %(trigger)s" b
+for (${1:int} ${2:i} = 0; $2 < ${3:count}; ++$2) {
+	${4:/* %(trigger)s */}
+}
+$0
+endsnippet
+
+'''
+
+
+def write_corpus(root):
+    """Writes the snippet files to 'root'/UltiSnips."""
+    directory = os.path.join(root, 'UltiSnips')
+    os.makedirs(directory)
+    for ft in FILETYPES:
+        for file_index in range(FILES_PER_FILETYPE):
+            path = os.path.join(directory, '%s_%02i.snippets' % (ft, file_index))
+            with open(path, 'w') as snippet_file:
+                if ft == 'bench' and file_index == 0:
+                    snippet_file.write('extends %s\n\n' % ', '.join(FILETYPES[1:]))
+                snippet_file.write('priority %i\n\n' % file_index)
+                for snippet_index in range(SNIPPETS_PER_FILE):
+                    snippet_file.write(SNIPPET % {
+                        'trigger': '%s%i_%i' % (ft, file_index, snippet_index)})
+
+
+def time_load(workers, cache_directory):
+    """Returns the best time of loading all filetypes with a fresh source."""
+    vim.command('let g:UltiSnipsParallelLoad = %i' % workers)
+    vim.command("let g:UltiSnipsCacheDirectory = '%s'" % cache_directory)
+    best = None
+    for _ in range(RUNS):
+        source = UltiSnipsFileSource()
+        start = time.time()
+        source.ensure(['bench'], cached=False)
+        elapsed = time.time() - start
+        count = sum(len(source._snippets[ft]._snippets) for ft in FILETYPES)
+        assert count == len(FILETYPES) * FILES_PER_FILETYPE * SNIPPETS_PER_FILE
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    workers = int(os.environ.get('ULTISNIPS_BENCH_WORKERS', '4'))
+    root = tempfile.mkdtemp()
+    try:
+        write_corpus(root)
+        vim.command("let g:UltiSnipsSnippetDirectories = ['UltiSnips']")
+        vim.command('set runtimepath=%s' % root)
+        cache_directory = os.path.join(root, 'cache')
+        # Fill the cache once so that both modes see the same warm entries.
+        time_load(0, cache_directory)
+        for label, cache in (('parse', ''), ('cache', cache_directory)):
+            serial = time_load(0, cache)
+            parallel = time_load(workers, cache)
+            print('%s: serial %.1f ms, %i threads %.1f ms (%.2fx)' % (
+                label, serial * 1000, workers, parallel * 1000,
+                serial / parallel))
+    finally:
+        shutil.rmtree(root)
+
+main()